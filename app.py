@@ -46,6 +46,8 @@ app = create_app()
 with app.app_context():
     # Import models to ensure tables are created
     import models  # noqa: F401
+    import dashboard_counters
+    dashboard_counters.install()
     
     try:
         db.create_all()
@@ -63,3 +65,17 @@ with app.app_context():
         db.init_app(app)
         db.create_all()
         logging.info("SQLite database initialized successfully")
+
+    # Indexes and other changes to existing tables are a deploy step: python migrations.py upgrade
+    try:
+        from migrations import pending_versions, upgrade
+        if os.environ.get('DB_AUTO_MIGRATE', 'false').lower() == 'true':
+            # Never hold up a booting worker behind another process's index build
+            upgrade(lock_timeout=0)
+        else:
+            pending = pending_versions()
+            if pending:
+                logging.warning(f"Schema migrations {', '.join(pending)} are pending, "
+                                f"run: python migrations.py upgrade")
+    except Exception as e:
+        logging.error(f"Schema migration failed: {e}")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark GRN number allocation under concurrent GRPO creation
+
+Starts several worker processes, each with several threads, that create
+GRPOs as fast as they can against a benchmark purchase order and count
+unique-constraint collisions on grpos.grn_number. The block allocator is
+compared with the old second-resolution timestamp numbers. GRPOs go into
+the configured WMS database (use a development database) and are deleted
+again unless --keep is given.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime
+
+BENCH_PO_NUMBER = 'BENCH-GRN'
+
+
+def legacy_grn_number(branch_id=None):
+    """The timestamp numbers generate_grn_number used to return"""
+    return f"GRN{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def warm_up(_):
+    """Import the app in a worker process before timing starts"""
+    logging.basicConfig(level=logging.WARNING)
+    import app  # noqa: F401
+    import qr_generator  # noqa: F401
+    return os.getpid()
+
+
+def create_grpos(job):
+    """Create ``count`` GRPOs on ``threads`` threads; runs in a worker process"""
+    mode, count, threads, block_size, branch_id = job
+    os.environ['GRN_BLOCK_SIZE'] = str(block_size)
+    logging.basicConfig(level=logging.WARNING)
+    from sqlalchemy.exc import IntegrityError, OperationalError
+    from app import app, db
+    from models import GRPO, GRPOStatus, PurchaseOrder, User
+    from qr_generator import generate_grn_number
+    logging.getLogger().setLevel(logging.WARNING)
+    allocate = generate_grn_number if mode == 'block' else legacy_grn_number
+
+    with app.app_context():
+        po_id = PurchaseOrder.query.filter_by(po_number=BENCH_PO_NUMBER).one().id
+        user_id = User.query.filter_by(username='admin').one().id
+
+    def run(thread_count):
+        created = collisions = errors = 0
+        with app.app_context():
+            for _ in range(thread_count):
+                db.session.add(GRPO(grn_number=allocate(branch_id), po_id=po_id,
+                                    created_by=user_id, receipt_date=date.today(),
+                                    status=GRPOStatus.DRAFT))
+                try:
+                    db.session.commit()
+                    created += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    collisions += 1
+                except OperationalError:
+                    db.session.rollback()
+                    errors += 1
+        return created, collisions, errors
+
+    shares = [count // threads + (1 if index < count % threads else 0) for index in range(threads)]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(run, shares))
+    return tuple(sum(values) for values in zip(*results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--grpos', type=int, default=4000, help='GRPOs per run')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process')
+    parser.add_argument('--block-size', type=int, default=50)
+    parser.add_argument('--branch', default='MAIN')
+    parser.add_argument('--modes', default='legacy,block',
+                        help='comma separated: legacy (timestamp numbers), block (allocator)')
+    parser.add_argument('--keep', action='store_true', help='keep the benchmark GRPOs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    from app import app, db
+    from models import GRPO, PurchaseOrder, User
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        if not User.query.filter_by(username='admin').first():
+            print("Create the admin user first (create_admin_user.py)")
+            return 1
+        po = PurchaseOrder.query.filter_by(po_number=BENCH_PO_NUMBER).first()
+        if po is None:
+            po = PurchaseOrder(po_number=BENCH_PO_NUMBER, supplier_code='BENCH',
+                               supplier_name='GRN allocator benchmark', branch_id=args.branch,
+                               po_date=date.today(), total_amount=0)
+            db.session.add(po)
+            db.session.commit()
+        po_id = po.id
+
+    per_process = [args.grpos // args.processes + (1 if index < args.grpos % args.processes else 0)
+                   for index in range(args.processes)]
+    print(f"{args.grpos} GRPOs per run on {args.processes} processes x {args.threads} threads, "
+          f"block size {args.block_size}")
+    print(f"{'mode':<10}{'created':>9}{'collisions':>12}{'db errors':>11}{'seconds':>9}"
+          f"{'GRPOs/min':>11}{'unique':>8}")
+    try:
+        for mode in args.modes.split(','):
+            started_at = datetime.utcnow()
+            with ProcessPoolExecutor(max_workers=args.processes,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                # Start the workers before timing
+                list(executor.map(warm_up, range(args.processes)))
+                start = time.perf_counter()
+                results = list(executor.map(create_grpos, [
+                    (mode, count, args.threads, args.block_size, args.branch)
+                    for count in per_process]))
+                elapsed = time.perf_counter() - start
+            created, collisions, errors = (sum(values) for values in zip(*results))
+
+            with app.app_context():
+                numbers = GRPO.query.with_entities(GRPO.grn_number).filter(
+                    GRPO.po_id == po_id, GRPO.created_at >= started_at).all()
+                unique = len({number for number, in numbers}) == len(numbers)
+            print(f"{mode:<10}{created:>9}{collisions:>12}{errors:>11}{elapsed:>9.2f}"
+                  f"{created / elapsed * 60:>11.0f}{'yes' if unique else 'NO':>8}")
+    finally:
+        if not args.keep:
+            with app.app_context():
+                GRPO.query.filter_by(po_id=po_id).delete()
+                db.session.commit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
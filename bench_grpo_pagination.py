@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark GRPO list pages by OFFSET against keyset cursors
+
+Loads the synthetic receiving history of bench_schema_indexes.py (250k GRPOs
+by default) and times fetching page N of the GRPO list, unfiltered and by
+status, the way paginate() did it (COUNT(*) plus LIMIT/OFFSET) and the way
+grpo_queries.grpo_page() does it (one seek from a cursor). Use a scratch
+database: its WMS tables are emptied.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+
+def timed(function, repeat):
+    function()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/wms_bench_pagination.db',
+                        help='scratch database, its WMS tables are emptied')
+    parser.add_argument('--grpos', type=int, default=250000)
+    parser.add_argument('--pages', default='1,100,1000,5000', help='comma-separated page numbers')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--skip-load', action='store_true', help='reuse the data of an earlier run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['DB_AUTO_MIGRATE'] = 'true'
+    from app import app, db
+    from bench_schema_indexes import load_data
+    from models import GRPO, GRPOStatus
+    import grpo_queries
+
+    per_page = grpo_queries.GRPO_PAGE_SIZE
+    with app.app_context():
+        logging.getLogger().setLevel(logging.WARNING)
+        if not args.skip_load:
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                load_data(connection, args.grpos, 1)
+            print(f"Loaded {args.grpos} GRPOs in {time.perf_counter() - started:.1f}s")
+
+        print(f"\n{'list':<14}{'page':>7}{'offset ms':>12}{'keyset ms':>12}")
+        for status in (None, GRPOStatus.QC_APPROVED):
+            for page in (int(p) for p in args.pages.split(',')):
+                def offset_page():
+                    query = grpo_queries.grpo_query('list')
+                    if status:
+                        query = query.filter(GRPO.status == status)
+                    query.order_by(GRPO.created_at.desc(), GRPO.id.desc()).paginate(
+                        page=page, per_page=per_page, error_out=False).items
+                    db.session.rollback()
+
+                # Reach page N once by OFFSET to get its cursor, then time the seek alone
+                cursor = None
+                if page > 1:
+                    query = GRPO.query.order_by(GRPO.created_at.desc(), GRPO.id.desc())
+                    if status:
+                        query = query.filter(GRPO.status == status)
+                    boundary = query.offset((page - 1) * per_page - 1).first()
+                    if boundary is None:
+                        continue
+                    cursor = grpo_queries.encode_cursor('after', boundary)
+
+                def keyset_page():
+                    grpo_queries.grpo_page(cursor, status)
+                    db.session.rollback()
+
+                offset_ms = timed(offset_page, args.repeat)
+                keyset_ms = timed(keyset_page, args.repeat)
+                label = status.value if status else 'all'
+                print(f"{label:<14}{page:>7}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
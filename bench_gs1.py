@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark the GS1 barcode parser
+
+Builds supplier carton barcodes in the forms scanners deliver them (raw
+GS1-128 with a symbology identifier and GS separators, GS1 DataMatrix,
+bracketed human-readable text) and prints the parse time per barcode.
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from gs1 import GS, parse
+
+
+def with_check_digit(digits):
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return digits + str((10 - total % 10) % 10)
+
+
+def sample_barcodes(count, seed=1):
+    generator = random.Random(seed)
+    forms = []
+    for _ in range(count):
+        gtin = with_check_digit(f"{generator.randrange(10 ** 13):013d}")
+        expiry = f"{generator.randrange(25, 30)}{generator.randrange(1, 13):02d}{generator.randrange(0, 29):02d}"
+        batch = f"L{generator.randrange(10 ** 6):06d}"
+        count_value = str(generator.randrange(1, 500))
+        forms.append({
+            'GS1-128': f"]C101{gtin}17{expiry}10{batch}{GS}37{count_value}",
+            'DataMatrix': f"]d201{gtin}10{batch}{GS}17{expiry}21S{generator.randrange(10 ** 8)}",
+            'bracketed': f"(01){gtin}(17){expiry}(10){batch}(30){count_value}",
+            'weight': f"01{gtin}3103{generator.randrange(10 ** 6):06d}17{expiry}"
+        })
+    return forms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000, help='barcodes per form')
+    args = parser.parse_args()
+
+    samples = sample_barcodes(args.count)
+    print(f"{'form':<12}{'us/parse':>10}{'parses/sec':>13}")
+    for form in samples[0]:
+        barcodes = [sample[form] for sample in samples]
+        start = time.perf_counter()
+        for barcode in barcodes:
+            parse(barcode)
+        elapsed = time.perf_counter() - start
+        print(f"{form:<12}{elapsed * 1e6 / len(barcodes):>10.2f}{len(barcodes) / elapsed:>13.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark purchase order sync: one serial stream vs parallel per-branch fetches
+
+Starts an in-process sap_simulator with the given latency and runs a full
+sync_purchase_orders followed by a full sync_purchase_orders_parallel
+against it, printing wall time and per-branch fetch times. Both runs write
+into the configured WMS database, so use a development database.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+
+def timed_sync(sync, **kwargs):
+    """Run a sync and return its stats with the wall time in ``seconds``"""
+    started = time.perf_counter()
+    stats = sync(**kwargs)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def report(mode, stats):
+    """Print one result row; returns False when the sync failed"""
+    if stats.get('error'):
+        print(f"{mode:<12}failed: {stats['error']}")
+        return False
+    rate = f"{stats['fetched'] / stats['seconds']:>10.1f}" if stats['seconds'] > 0 else f"{'-':>10}"
+    print(f"{mode:<12}{stats['fetched']:>10}{stats['seconds']:>10.2f}{rate}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', default='lognormal:40,0.5',
+                        help='simulator latency model, see sap_simulator.py')
+    parser.add_argument('--purchase-orders', type=int, default=2000)
+    parser.add_argument('--branches', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='parallel fetch threads (and pooled sessions)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    from sap_simulator import start_simulator
+    server = start_simulator(latency=args.latency, purchase_orders=args.purchase_orders,
+                             branches=args.branches)
+    os.environ['SAP_B1_URL'] = server.base_url
+    os.environ['WMS_DEV_MODE'] = 'false'
+    os.environ['SAP_B1_PAGE_SIZE'] = str(args.page_size)
+    os.environ['SAP_B1_POOL_SIZE'] = str(args.workers)
+    os.environ['SAP_B1_SESSION_STORE'] = ''
+
+    from app import app
+    from sap_integration import SAPIntegration
+
+    with app.app_context():
+        logging.getLogger().setLevel(logging.WARNING)
+        sap = SAPIntegration()
+
+        print(f"Syncing {args.purchase_orders} simulated POs over {args.branches} branches, "
+              f"latency {args.latency}")
+        print(f"{'mode':<12}{'fetched':>10}{'seconds':>10}{'POs/sec':>10}")
+        ok = report('serial', timed_sync(sap.sync_purchase_orders, full=True))
+        parallel = timed_sync(sap.sync_purchase_orders_parallel, full=True, max_workers=args.workers)
+        ok = report('parallel', parallel) and ok
+
+        print(f"\n{'branch':<12}{'fetched':>10}{'seconds':>10}  error")
+        for branch_id, branch_stats in parallel['branches'].items():
+            print(f"{branch_id:<12}{branch_stats['fetched']:>10}{branch_stats['seconds']:>10.2f}"
+                  f"  {branch_stats['error'] or ''}")
+            ok = ok and not branch_stats['error']
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
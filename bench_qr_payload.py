@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare the JSON and compact (W1) QR label payload formats
+
+For the same set of labels, prints the average payload length, QR version,
+module count, PNG size and render time of each format. With OpenCV
+installed (opencv-python-headless) it also estimates the scanner decode
+rate: each code is shrunk to --scan-pixels wide, as a handheld sees it from
+a distance, blurred, and decoded with cv2.QRCodeDetector.
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import date
+from io import BytesIO
+
+from bench_qr_render import sample_payloads
+from qr_generator import _make_qr, encode_compact_payload
+
+try:
+    import cv2
+    import numpy
+except ImportError:
+    cv2 = None
+
+
+def compact_payloads(json_payloads):
+    payloads = []
+    for index, payload in enumerate(json_payloads):
+        label = json.loads(payload)
+        payloads.append(encode_compact_payload(
+            label['grn_number'], index % 200 + 1, label['item_code'], label['quantity'],
+            label['batch_number'], date.fromisoformat(label['expiry_date'])))
+    return payloads
+
+
+def decodes_at(image, scan_pixels, blur):
+    """True if OpenCV can read the code once it is scan_pixels wide"""
+    array = numpy.array(image.convert('L'))
+    small = cv2.resize(array, (scan_pixels, scan_pixels), interpolation=cv2.INTER_AREA)
+    if blur:
+        small = cv2.GaussianBlur(small, (3, 3), blur)
+    # Scale back up so the detector's finder-pattern search has pixels to work with
+    view = cv2.resize(small, (scan_pixels * 4, scan_pixels * 4), interpolation=cv2.INTER_LINEAR)
+    text, _, _ = cv2.QRCodeDetector().detectAndDecode(view)
+    return bool(text)
+
+
+def measure(payloads, scan_pixels, blur):
+    versions = []
+    modules = []
+    png_bytes = []
+    decoded = 0
+    start = time.perf_counter()
+    images = []
+    for payload in payloads:
+        qr = _make_qr(payload)
+        image = qr.make_image(fill_color="black", back_color="white")
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        versions.append(qr.version)
+        modules.append(qr.modules_count)
+        png_bytes.append(len(buffer.getvalue()))
+        images.append(image)
+    render_ms = (time.perf_counter() - start) * 1000 / len(payloads)
+
+    if cv2 is not None:
+        decoded = sum(1 for image in images if decodes_at(image.get_image(), scan_pixels, blur))
+
+    count = len(payloads)
+    return {
+        'chars': sum(len(payload) for payload in payloads) / count,
+        'version': sum(versions) / count,
+        'modules': sum(modules) / count,
+        'png_bytes': sum(png_bytes) / count,
+        'render_ms': render_ms,
+        'decode_rate': decoded / count if cv2 is not None else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--scan-pixels', type=int, default=120,
+                        help='width in pixels the scanner sees the code at')
+    parser.add_argument('--blur', type=float, default=0.8,
+                        help='Gaussian blur sigma applied after shrinking (0 to disable)')
+    args = parser.parse_args()
+
+    json_payloads = sample_payloads(args.count)
+    formats = [('json', json_payloads), ('compact W1', compact_payloads(json_payloads))]
+
+    print(f"{args.count} labels, scanner view {args.scan_pixels}px, blur {args.blur}")
+    print(f"{'format':<12}{'chars':>8}{'version':>9}{'modules':>9}{'PNG bytes':>11}"
+          f"{'render ms':>11}{'decoded':>9}")
+    for name, payloads in formats:
+        result = measure(payloads, args.scan_pixels, args.blur)
+        decode = f"{result['decode_rate']:.0%}" if result['decode_rate'] is not None else 'n/a'
+        print(f"{name:<12}{result['chars']:>8.0f}{result['version']:>9.1f}{result['modules']:>9.0f}"
+              f"{result['png_bytes']:>11.0f}{result['render_ms']:>11.1f}{decode:>9}")
+    if cv2 is None:
+        print("Install opencv-python-headless to measure decode rates")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
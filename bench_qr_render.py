@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark QR label rendering throughput against the number of worker processes
+
+Renders the same set of GRPO-style label payloads serially and then through
+process pools of increasing size into an empty scratch image cache, and
+prints labels/sec for each run. A final run shows the cost of a fully
+cached batch, as on a reprint.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+
+def sample_payloads(count):
+    """Label payloads shaped like generate_qr_code output"""
+    return [json.dumps({
+        'grn_number': f"GRN{20240101000000 + index // 50}",
+        'po_number': f"PO-{index // 50:05d}",
+        'item_code': f"ITEM{index % 500:04d}",
+        'item_description': f"Benchmark item {index % 500}",
+        'quantity': float(index % 24 + 1),
+        'unit_of_measure': 'PCS',
+        'batch_number': f"B{index // 10:06d}",
+        'expiry_date': date(2026, 12, 31).isoformat(),
+        'bin_location': f"WH01-A{index % 20 + 1:02d}",
+        'receipt_date': date.today().isoformat(),
+        'supplier_code': 'SUP001',
+        'generated_at': datetime.now().isoformat()
+    }) for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=1000, help='labels per run')
+    parser.add_argument('--format', choices=['png', 'svg'], default='png')
+    parser.add_argument('--workers', default=None,
+                        help='comma separated pool sizes (default: 1, 2, 4 ... up to the core count)')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        pool_sizes = [int(size) for size in args.workers.split(',')]
+    else:
+        pool_sizes = []
+        size = 1
+        while size < cores:
+            pool_sizes.append(size)
+            size *= 2
+        pool_sizes.append(cores)
+
+    payloads = sample_payloads(args.count)
+    scratch = tempfile.mkdtemp(prefix='qr-bench-')
+    os.environ['QR_STORAGE_DIR'] = scratch
+    from qr_generator import render_qr_codes
+
+    def empty_cache():
+        for entry in os.listdir(scratch):
+            shutil.rmtree(os.path.join(scratch, entry), ignore_errors=True)
+
+    print(f"Rendering {args.count} {args.format.upper()} labels on {cores} cores")
+    print(f"{'workers':<10}{'seconds':>10}{'labels/sec':>12}{'speedup':>10}")
+    try:
+        start = time.perf_counter()
+        for payload in payloads:
+            render_qr_codes([payload], args.format)
+        baseline = time.perf_counter() - start
+        print(f"{'serial':<10}{baseline:>10.2f}{args.count / baseline:>12.1f}{1.0:>10.2f}")
+
+        for size in pool_sizes:
+            empty_cache()
+            with ProcessPoolExecutor(max_workers=size,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                # Start the workers before timing
+                list(executor.map(abs, range(size)))
+                start = time.perf_counter()
+                render_qr_codes(payloads, args.format, executor=executor)
+                elapsed = time.perf_counter() - start
+            print(f"{size:<10}{elapsed:>10.2f}{args.count / elapsed:>12.1f}{baseline / elapsed:>10.2f}")
+
+        start = time.perf_counter()
+        render_qr_codes(payloads, args.format)
+        elapsed = time.perf_counter() - start
+        print(f"{'cached':<10}{elapsed:>10.2f}{args.count / elapsed:>12.1f}{baseline / elapsed:>10.2f}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark report queries on the daily rollups against the raw grpos table
+
+Loads the synthetic receiving history of bench_schema_indexes.py (250k GRPOs
+and 1M lines spread over three years by default), builds the rollups, and
+times the /reports queries
+on the rollups next to the same aggregates computed from grpos. It also
+times an incremental refresh after a batch of status changes. Use a scratch
+database: its WMS tables are emptied.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+
+def timed(function, repeat):
+    function()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/wms_bench_rollups.db',
+                        help='scratch database, its WMS tables are emptied')
+    parser.add_argument('--grpos', type=int, default=250000)
+    parser.add_argument('--lines-per-grpo', type=int, default=4)
+    parser.add_argument('--spread-days', type=int, default=1095,
+                        help='spread receipt dates over this many days')
+    parser.add_argument('--changes', type=int, default=500, help='GRPOs changed before the incremental refresh')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['DB_AUTO_MIGRATE'] = 'true'
+    from sqlalchemy import extract, func, select
+    from app import app, db
+    from bench_schema_indexes import load_data
+    from models import GRPO, GRPOStatus, PurchaseOrder
+    import report_rollups
+
+    with app.app_context():
+        logging.getLogger().setLevel(logging.WARNING)
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            load_data(connection, args.grpos, args.lines_per_grpo,
+                      interval_seconds=args.spread_days * 86400 / args.grpos)
+        print(f"Loaded {args.grpos} GRPOs in {time.perf_counter() - started:.1f}s")
+
+        full = report_rollups.refresh(full=True)
+        print(f"Full rollup build: {full['days']} days in {full['seconds']:.2f}s")
+
+        raw_dimensions = {
+            'by status': (GRPO.status,),
+            'by month': (extract('year', GRPO.receipt_date), extract('month', GRPO.receipt_date)),
+            'by supplier': (PurchaseOrder.supplier_code,),
+        }
+        rollup_reports = {
+            'by status': lambda: report_rollups.report(None, by=('status',)),
+            'by month': lambda: report_rollups.report('month'),
+            'by supplier': lambda: report_rollups.report(None, by=('supplier',)),
+            'by week and branch': lambda: report_rollups.report('week', by=('branch',)),
+            'one branch, quarter': lambda: report_rollups.report('quarter', branch_id='3'),
+        }
+
+        print(f"\n{'report':<22}{'raw grpos ms':>14}{'rollup ms':>12}{'rows':>7}")
+        for label, report in rollup_reports.items():
+            raw_ms = None
+            if label in raw_dimensions:
+                dimensions = raw_dimensions[label]
+                query = (select(*dimensions, func.count(GRPO.id), func.sum(GRPO.total_amount))
+                         .join(PurchaseOrder, PurchaseOrder.id == GRPO.po_id).group_by(*dimensions))
+                raw_ms, _ = timed(lambda: db.session.execute(query).all(), args.repeat)
+            rollup_ms, rows = timed(report, args.repeat)
+            raw = f"{raw_ms:>14.1f}" if raw_ms is not None else f"{'-':>14}"
+            print(f"{label:<22}{raw}{rollup_ms:>12.2f}{len(rows):>7}")
+
+        changed = db.session.execute(select(GRPO.id).where(GRPO.status == GRPOStatus.PENDING_QC)
+                                     .limit(args.changes)).scalars().all()
+        for grpo in GRPO.query.filter(GRPO.id.in_(changed)):
+            grpo.status = GRPOStatus.QC_APPROVED
+        db.session.commit()
+        incremental = report_rollups.refresh()
+        print(f"\nIncremental refresh after {len(changed)} status changes: "
+              f"{incremental['days']} days in {incremental['seconds'] * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
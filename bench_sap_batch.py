@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark GRPO posting throughput: one request per receipt vs OData $batch
+
+Runs against an in-process sap_simulator by default. Point --url at a
+Service Layer stand-in only, never at a production company database;
+every run creates real Purchase Receipts.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+from types import SimpleNamespace
+
+
+def fake_grpo(index, lines=5):
+    """Build an object shaped like a GRPO, enough for the payload builder"""
+    purchase_order = SimpleNamespace(supplier_code='SUP001', sap_doc_entry=1000 + index)
+    grpo_lines = [
+        SimpleNamespace(
+            po_line=SimpleNamespace(item_code=f'ITEM{n:03d}', warehouse_code='WH01',
+                                    line_number=n + 1),
+            received_quantity=10, unit_price=2.5, batch_number=f'B{index}-{n}',
+            expiry_date=date(2026, 12, 31))
+        for n in range(lines)
+    ]
+    return SimpleNamespace(grn_number=f'BENCH{index:06d}', purchase_order=purchase_order,
+                           receipt_date=date.today(), remarks=None, grpo_lines=grpo_lines)
+
+
+def bench_single(sap, grpos):
+    start = time.perf_counter()
+    posted = sum(1 for grpo in grpos if sap.post_grpo_to_sap(grpo))
+    return posted, time.perf_counter() - start
+
+
+def bench_batch(sap, grpos, batch_size, use_changeset):
+    start = time.perf_counter()
+    posted = 0
+    for i in range(0, len(grpos), batch_size):
+        results = sap.post_grpos_batch(grpos[i:i + batch_size], use_changeset)
+        posted += sum(1 for result in results if result['doc_entry'])
+    return posted, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url',
+                        help='Service Layer base URL, e.g. http://127.0.0.1:50001/b1s/v1/ '
+                             '(default: start a local simulator)')
+    parser.add_argument('--latency', default='fixed:20',
+                        help='simulator latency model, see sap_simulator.py')
+    parser.add_argument('--count', type=int, default=200, help='receipts per run')
+    parser.add_argument('--batch-sizes', default='10,50,100',
+                        help='comma separated $batch sizes to compare')
+    parser.add_argument('--changeset', action='store_true',
+                        help='wrap each batch in an atomic changeset')
+    args = parser.parse_args()
+
+    if not args.url:
+        from sap_simulator import start_simulator
+        args.url = start_simulator(latency=args.latency).base_url
+
+    os.environ['SAP_B1_URL'] = args.url
+    os.environ['WMS_DEV_MODE'] = 'false'
+    from sap_integration import SAPIntegration
+
+    sap = SAPIntegration()
+    grpos = [fake_grpo(i) for i in range(args.count)]
+
+    print(f"Posting {args.count} receipts to {args.url}")
+    print(f"{'mode':<20}{'posted':>8}{'seconds':>10}{'docs/sec':>12}")
+
+    posted, elapsed = bench_single(sap, grpos)
+    print(f"{'single':<20}{posted:>8}{elapsed:>10.2f}{posted / elapsed:>12.1f}")
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        posted, elapsed = bench_batch(sap, grpos, batch_size, args.changeset)
+        label = f"$batch x{batch_size}"
+        print(f"{label:<20}{posted:>8}{elapsed:>10.2f}{posted / elapsed:>12.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Benchmark the app's hot queries before and after the migration 0001 indexes
+
+Loads a synthetic receiving history (1M+ GRPO lines by default) into the
+given database, reverts the 0001 indexes, then times each query and prints
+its plan. It then applies the migration the way a live upgrade would and
+runs everything again. Use a scratch database: the tables are emptied first.
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = 'EXPLAIN QUERY PLAN ' if compiler.dialect.name == 'sqlite' else 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def load_data(connection, grpos, lines_per_grpo, seed=1, interval_seconds=30):
+    from models import (GRPO, GRPOLine, GRPOStatus, PurchaseOrder, PurchaseOrderLine,
+                        QRCode, SAPOutbox, User)
+
+    generator = random.Random(seed)
+    for model in (QRCode, SAPOutbox, GRPOLine, GRPO, PurchaseOrderLine, PurchaseOrder):
+        connection.execute(delete(model))
+    connection.execute(delete(User).where(User.username == 'bench'))
+    user_id = connection.execute(insert(User).values(
+        username='bench', email='bench@example.com', password_hash='-',
+        full_name='Benchmark')).inserted_primary_key[0]
+
+    purchase_orders = max(1, grpos // 2)
+    po_lines = 5
+    start = datetime(2023, 1, 1)
+    statuses = list(GRPOStatus)
+    weights = [5, 3, 1, 1, 85, 5]  # Most history is posted, the work queue is small
+    batch = 10000
+
+    def flush(model, rows):
+        if rows:
+            connection.execute(insert(model), rows)
+            rows.clear()
+
+    rows = []
+    for po_id in range(1, purchase_orders + 1):
+        rows.append({'id': po_id, 'po_number': f'PO{po_id:08d}', 'supplier_code': 'S1',
+                     'supplier_name': 'Supplier', 'branch_id': str(po_id % 8 + 1),
+                     'po_date': date(2023, 1, 1), 'total_amount': 0, 'sap_doc_entry': 100000 + po_id})
+        if len(rows) >= batch:
+            flush(PurchaseOrder, rows)
+    flush(PurchaseOrder, rows)
+    for po_id in range(1, purchase_orders + 1):
+        for line in range(po_lines):
+            rows.append({'id': (po_id - 1) * po_lines + line + 1, 'po_id': po_id, 'line_number': line,
+                         'item_code': f'ITEM{generator.randrange(20000):05d}', 'item_description': 'Item',
+                         'ordered_quantity': 100, 'unit_price': 1, 'unit_of_measure': 'EA',
+                         'warehouse_code': 'WH01'})
+            if len(rows) >= batch:
+                flush(PurchaseOrderLine, rows)
+    flush(PurchaseOrderLine, rows)
+
+    line_rows, qr_rows, outbox_rows = [], [], []
+    line_id = 0
+    for grpo_id in range(1, grpos + 1):
+        created_at = start + timedelta(seconds=grpo_id * interval_seconds)
+        status = generator.choices(statuses, weights)[0]
+        po_id = generator.randrange(1, purchase_orders + 1)
+        rows.append({'id': grpo_id, 'grn_number': f'GRN{grpo_id:09d}', 'po_id': po_id,
+                     'created_by': user_id, 'status': status, 'receipt_date': created_at.date(),
+                     'total_amount': 0, 'created_at': created_at, 'updated_at': created_at})
+        for _ in range(lines_per_grpo):
+            line_id += 1
+            line_rows.append({'id': line_id, 'grpo_id': grpo_id,
+                              'po_line_id': (po_id - 1) * po_lines + generator.randrange(po_lines) + 1,
+                              'received_quantity': 1, 'unit_price': 1, 'line_total': 1})
+        for _ in range(2):
+            qr_rows.append({'grpo_id': grpo_id, 'qr_code_data': '{}', 'item_code': 'ITEM',
+                            'quantity': 1, 'created_at': created_at})
+        outbox_rows.append({'grpo_id': grpo_id, 'status': 'pending' if status == GRPOStatus.QC_APPROVED else 'done',
+                            'next_attempt_at': created_at, 'created_at': created_at})
+        if len(line_rows) >= batch:
+            flush(GRPO, rows)
+            flush(GRPOLine, line_rows)
+            flush(QRCode, qr_rows)
+            flush(SAPOutbox, outbox_rows)
+    flush(GRPO, rows)
+    flush(GRPOLine, line_rows)
+    flush(QRCode, qr_rows)
+    flush(SAPOutbox, outbox_rows)
+    return line_id
+
+
+def hot_queries(grpos, purchase_orders):
+    """The statements behind the busiest pages and jobs, as the app builds them"""
+    from models import GRPO, GRPOLine, GRPOStatus, PurchaseOrder, PurchaseOrderLine, QRCode, SAPOutbox
+    from sap_worker import _claimable
+
+    some_grpo = grpos // 3
+    return {
+        # routes.dashboard
+        'dashboard pending_qc count': select(func.count()).select_from(GRPO).where(
+            GRPO.status == GRPOStatus.PENDING_QC),
+        'dashboard recent GRPOs': select(GRPO).order_by(GRPO.created_at.desc()).limit(5),
+        # routes.grpo_list with a status filter, first page and its total
+        'grpo_list status page': select(GRPO).where(GRPO.status == GRPOStatus.QC_APPROVED)
+        .order_by(GRPO.created_at.desc()).limit(20),
+        'grpo_list status total': select(func.count()).select_from(GRPO).where(
+            GRPO.status == GRPOStatus.QC_APPROVED),
+        # grpo_details: grpo.grpo_lines, po_line.grpo_lines, purchase_order.po_lines
+        'GRPO lines of a GRPO': select(GRPOLine).where(GRPOLine.grpo_id == some_grpo),
+        'receipts of a PO line': select(GRPOLine).where(GRPOLine.po_line_id == 42),
+        'lines of a PO': select(PurchaseOrderLine).where(PurchaseOrderLine.po_id == purchase_orders // 2),
+        'GRPOs of a PO': select(GRPO).where(GRPO.po_id == purchase_orders // 2),
+        # label_sheet_pdf keyset chunk for one GRPO
+        'label sheet chunk': select(QRCode.id, QRCode.qr_code_data).where(QRCode.grpo_id == some_grpo)
+        .order_by(QRCode.id).limit(240),
+        # po_sync upsert lookup of existing POs by DocEntry
+        'PO sync DocEntry lookup': select(PurchaseOrder.id, PurchaseOrder.sap_doc_entry).where(
+            PurchaseOrder.sap_doc_entry.in_(range(100000 + purchase_orders // 2,
+                                                  100000 + purchase_orders // 2 + 50))),
+        # sap_worker.claim_entries
+        'outbox claim': select(SAPOutbox.id).where(_claimable(datetime.utcnow()))
+        .order_by(SAPOutbox.next_attempt_at).limit(10),
+    }
+
+
+def analyze(connection):
+    from models import GRPO, GRPOLine, PurchaseOrder, PurchaseOrderLine, QRCode, SAPOutbox
+
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        connection.execute(text('ANALYZE'))
+        return
+    for model in (GRPO, GRPOLine, PurchaseOrder, PurchaseOrderLine, QRCode, SAPOutbox):
+        table = connection.dialect.identifier_preparer.quote(model.__tablename__)
+        connection.execute(text(f"ANALYZE TABLE {table}" if dialect in ('mysql', 'mariadb')
+                                else f"ANALYZE {table}"))
+
+
+def plan_text(connection, statement):
+    rows = connection.execute(Explain(statement)).all()
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    if connection.dialect.name == 'postgresql':
+        return [row[0] for row in rows]
+    return [', '.join(f"{key}={value}" for key, value in row._mapping.items()
+                      if key in ('table', 'type', 'key', 'rows', 'Extra') and value is not None)
+            for row in rows]
+
+
+def run_queries(connection, queries, repeat):
+    results = {}
+    for label, statement in queries.items():
+        connection.execute(statement).all()  # Warm the cache
+        started = time.perf_counter()
+        for _ in range(repeat):
+            connection.execute(statement).all()
+        results[label] = ((time.perf_counter() - started) * 1000 / repeat, plan_text(connection, statement))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/wms_bench_indexes.db',
+                        help='scratch database, its WMS tables are emptied')
+    parser.add_argument('--grpos', type=int, default=250000)
+    parser.add_argument('--lines-per-grpo', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=20, help='executions per query')
+    parser.add_argument('--skip-load', action='store_true', help='reuse the data of an earlier run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['DB_AUTO_MIGRATE'] = 'false'
+    from app import app, db
+    from migrations import downgrade, upgrade
+
+    with app.app_context():
+        logging.getLogger().setLevel(logging.WARNING)
+        engine = db.engine
+        print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+        # create_all() builds the declared indexes on a fresh database; record and drop them
+        upgrade()
+        downgrade('0000')
+        if not args.skip_load:
+            started = time.perf_counter()
+            with engine.begin() as connection:
+                lines = load_data(connection, args.grpos, args.lines_per_grpo)
+            print(f"Loaded {args.grpos} GRPOs, {lines} GRPO lines in {time.perf_counter() - started:.1f}s")
+
+        queries = hot_queries(args.grpos, max(1, args.grpos // 2))
+        with engine.connect() as connection:
+            analyze(connection)
+            before = run_queries(connection, queries, args.repeat)
+
+        started = time.perf_counter()
+        upgrade(target='0001')
+        print(f"Migration 0001 built its indexes in {time.perf_counter() - started:.1f}s")
+
+        with engine.connect() as connection:
+            analyze(connection)
+            after = run_queries(connection, queries, args.repeat)
+
+    print(f"\n{'query':<30}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for label in queries:
+        before_ms, after_ms = before[label][0], after[label][0]
+        print(f"{label:<30}{before_ms:>12.3f}{after_ms:>12.3f}{before_ms / max(after_ms, 1e-6):>9.0f}x")
+
+    for label in queries:
+        print(f"\n{label}")
+        for state, plan in (('before', before[label][1]), ('after', after[label][1])):
+            for index, step in enumerate(plan):
+                print(f"  {state if index == 0 else '':<8}{step}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
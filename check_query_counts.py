@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Check that the GRPO pages stay within a fixed number of SQL queries
+
+Fills a scratch database with a 100-line GRPO with labels, a QC queue and a
+page of GRPOs, requests each page through the Flask test client and counts
+the statements sent to the database. Exits non-zero when a page goes over
+its budget, which is what a lazy-loaded relationship in a template does.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+# Statements allowed per page: the logged-in user, the page's own queries
+# and one per eager-loaded relationship, independent of the number of rows
+QUERY_BUDGETS = {
+    'dashboard': 3,
+    'grpo_list': 4,
+    'grpo_list_filtered': 4,
+    'grpo_list_older': 4,
+    'grpo_details': 5,
+    'qc_pending': 4,  # Plus the queue total once it exceeds QC_PENDING_LIMIT
+}
+
+
+def seed(db, lines, pending, listed):
+    from models import (GRPO, GRPOLine, GRPOStatus, PurchaseOrder, PurchaseOrderLine,
+                        QCApproval, QRCode, User, UserRole)
+
+    for model in (QRCode, QCApproval, GRPOLine, GRPO, PurchaseOrderLine, PurchaseOrder):
+        model.query.delete()
+    User.query.filter(User.username.like('qcount%')).delete(synchronize_session=False)
+
+    users = [User(username=f'qcount{i}', email=f'qcount{i}@example.com', full_name=f'Query Count {i}',
+                  role=UserRole.ADMIN) for i in range(5)]
+    for user in users:
+        user.set_password('qcount')
+    db.session.add_all(users)
+
+    po = PurchaseOrder(po_number='QC-PO-1', supplier_code='S1', supplier_name='Supplier',
+                       branch_id='1', po_date=date.today(), total_amount=0, sap_doc_entry=1)
+    db.session.add(po)
+    db.session.flush()
+    po_lines = [PurchaseOrderLine(po_id=po.id, line_number=n, item_code=f'ITEM{n:03d}',
+                                  item_description=f'Item {n}', ordered_quantity=1000, received_quantity=0,
+                                  unit_price=1, unit_of_measure='EA', warehouse_code='WH01')
+                for n in range(lines)]
+    db.session.add_all(po_lines)
+    db.session.flush()
+
+    def add_grpo(number, status, line_count, labels=0, created_at=None):
+        grpo = GRPO(grn_number=f'QC-GRN-{number:05d}', po_id=po.id, created_by=users[number % len(users)].id,
+                    status=status, receipt_date=date.today(), total_amount=0,
+                    created_at=created_at or datetime.utcnow())
+        db.session.add(grpo)
+        db.session.flush()
+        db.session.add_all(GRPOLine(grpo_id=grpo.id, po_line_id=po_lines[n % lines].id, received_quantity=1,
+                                    unit_price=1, line_total=1, batch_number=f'B{n}')
+                           for n in range(line_count))
+        db.session.add_all(QRCode(grpo_id=grpo.id, qr_code_data=f'{{"grpo":{grpo.id},"n":{n}}}',
+                                  item_code=po_lines[n % lines].item_code, quantity=1)
+                           for n in range(labels))
+        return grpo
+
+    detail = add_grpo(0, GRPOStatus.QC_APPROVED, lines, labels=lines)
+    db.session.add(QCApproval(grpo_id=detail.id, qc_user_id=users[1].id, approval_status='approved'))
+    for number in range(1, pending + 1):
+        add_grpo(number, GRPOStatus.PENDING_QC, 10)
+    start = datetime.utcnow() - timedelta(days=1)
+    for number in range(pending + 1, pending + listed + 1):
+        add_grpo(number, GRPOStatus.POSTED_TO_SAP, 2, labels=2, created_at=start + timedelta(minutes=number))
+    db.session.commit()
+    return detail.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default='sqlite:////tmp/wms_query_counts.db',
+                        help='scratch database, its GRPO and PO tables are emptied')
+    parser.add_argument('--lines', type=int, default=100, help='lines and labels on the detail GRPO')
+    parser.add_argument('--pending', type=int, default=25, help='GRPOs waiting for QC')
+    parser.add_argument('--listed', type=int, default=40, help='posted GRPOs for the list pages')
+    parser.add_argument('--verbose', action='store_true', help='print every statement')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['DATABASE_URL'] = args.database_url
+    from sqlalchemy import event
+    from app import app, db
+    import grpo_queries
+    import routes  # noqa: F401
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        detail_id = seed(db, args.lines, args.pending, args.listed)
+        older = grpo_queries.grpo_page().next_cursor
+        engine = db.engine
+
+    pages = {
+        'dashboard': '/dashboard',
+        'grpo_list': '/grpos',
+        'grpo_list_filtered': '/grpos?status=posted_to_sap',
+        'grpo_list_older': f'/grpos?cursor={older}',
+        'grpo_details': f'/grpos/{detail_id}',
+        'qc_pending': '/qc/pending',
+    }
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'qcount0', 'password': 'qcount'})
+    if response.status_code != 302:
+        print(f"Login failed with HTTP {response.status_code}")
+        return 1
+
+    failures = 0
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        print(f"{'page':<22}{'status':>8}{'queries':>9}{'budget':>8}")
+        for name, url in pages.items():
+            statements.clear()
+            response = client.get(url)
+            budget = QUERY_BUDGETS[name]
+            over = response.status_code != 200 or len(statements) > budget
+            failures += over
+            print(f"{name:<22}{response.status_code:>8}{len(statements):>9}{budget:>8}"
+                  f"{'  OVER BUDGET' if over else ''}")
+            if args.verbose or over:
+                for statement in statements:
+                    print(f"    {' '.join(statement.split())[:150]}")
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Check the SAP circuit breaker and concurrency limiter state transitions
+
+Drives an EndpointGuard with fake calls through the scenarios that have to
+recover on their own: opening after consecutive failures, a half-open trial
+that fails or succeeds, business 4xx errors, and a half-open trial slot
+taken while the concurrency limiter is full. Exits non-zero when a scenario
+ends in the wrong state.
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from sap_resilience import (CLOSED, HALF_OPEN, OPEN, AdaptiveLimiter, CircuitBreaker, EndpointGuard,
+                            SAPUnavailableError)
+
+RESET_SECONDS = 0.05
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def new_guard():
+    guard = EndpointGuard('check')
+    guard.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=RESET_SECONDS)
+    guard.limiter = AdaptiveLimiter(initial=1, maximum=1, queue_timeout=0.01)
+    return guard
+
+
+def call(guard, status_code):
+    """'ok', 'failed' or the SAPUnavailableError message"""
+    try:
+        response = guard.call(lambda: FakeResponse(status_code))
+    except SAPUnavailableError as e:
+        return str(e)
+    return 'ok' if response.status_code < 500 else 'failed'
+
+
+def open_circuit(guard):
+    call(guard, 503)
+    call(guard, 503)
+
+
+def opens_after_threshold():
+    guard = new_guard()
+    open_circuit(guard)
+    return guard.breaker.state == OPEN and 'circuit is open' in call(guard, 200)
+
+
+def half_open_failure_reopens():
+    guard = new_guard()
+    open_circuit(guard)
+    time.sleep(RESET_SECONDS * 2)
+    return call(guard, 503) == 'failed' and guard.breaker.state == OPEN
+
+
+def half_open_success_closes():
+    guard = new_guard()
+    open_circuit(guard)
+    time.sleep(RESET_SECONDS * 2)
+    return call(guard, 200) == 'ok' and guard.breaker.state == CLOSED
+
+
+def business_errors_keep_circuit_closed():
+    guard = new_guard()
+    for _ in range(5):
+        call(guard, 400)
+    return guard.breaker.state == CLOSED
+
+
+def half_open_trial_survives_full_limiter():
+    guard = new_guard()
+    open_circuit(guard)
+    time.sleep(RESET_SECONDS * 2)
+    guard.limiter.acquire()  # Another call holds the only slot
+    saturated = call(guard, 200)
+    guard.limiter.release(0, True)
+    return ('concurrency limit' in saturated and guard.breaker.state == HALF_OPEN
+            and call(guard, 200) == 'ok' and guard.breaker.state == CLOSED)
+
+
+SCENARIOS = [
+    opens_after_threshold,
+    half_open_failure_reopens,
+    half_open_success_closes,
+    business_errors_keep_circuit_closed,
+    half_open_trial_survives_full_limiter,
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    failures = 0
+    for scenario in SCENARIOS:
+        passed = scenario()
+        failures += not passed
+        print(f"{scenario.__name__:<42}{'ok' if passed else 'FAILED'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
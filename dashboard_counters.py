@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+GRPO counts by status, kept in a table instead of counted per dashboard hit
+
+Every flush that creates, deletes or changes the status of a GRPO adds
+its +1/-1 to the ``grpo_status_counts`` rows in the same transaction, so
+the counts commit or roll back together with the GRPOs. This covers the
+routes and the SAP worker alike. Writes that bypass the ORM (bulk inserts,
+query.delete(), manual SQL) are corrected by reconcile(), which recounts
+the grpos table. It runs at startup, every
+DASHBOARD_COUNTERS_RECONCILE_SECONDS, and from the command line:
+
+    python dashboard_counters.py
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from models import GRPO, GRPOStatus, GRPOStatusCount
+
+DASHBOARD_COUNTERS_RECONCILE_SECONDS = float(os.environ.get('DASHBOARD_COUNTERS_RECONCILE_SECONDS', '3600'))
+
+
+def _status_deltas(session, connection):
+    """Per-status change in GRPO count this flush will make, or None if unknown"""
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, GRPO):
+            status = obj.status or GRPOStatus.DRAFT  # The column default applies on INSERT
+            deltas[status] = deltas.get(status, 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, GRPO):
+            history = inspect(obj).attrs.status.history
+            status = (history.deleted or history.unchanged or [None])[0] or _stored_status(connection, obj)
+            if status is None:
+                return None
+            deltas[status] = deltas.get(status, 0) - 1
+    for obj in session.dirty:
+        if isinstance(obj, GRPO) and obj not in session.deleted:
+            history = inspect(obj).attrs.status.history
+            if not history.added:
+                continue
+            # No old value when the status was assigned while expired, e.g. after a commit
+            old = history.deleted[0] if history.deleted else _stored_status(connection, obj)
+            if old is None:
+                return None
+            new = history.added[0]
+            if old != new:
+                deltas[old] = deltas.get(old, 0) - 1
+                deltas[new] = deltas.get(new, 0) + 1
+    return {status: delta for status, delta in deltas.items() if delta}
+
+
+def _stored_status(connection, grpo):
+    if grpo.id is None:
+        return None
+    return connection.execute(select(GRPO.status).where(GRPO.id == grpo.id)).scalar()
+
+
+def _count_status_changes(session, flush_context, instances):
+    if not any(isinstance(obj, GRPO) for obj in (*session.new, *session.dirty, *session.deleted)):
+        return
+    connection = session.connection()
+    deltas = _status_deltas(session, connection)
+    if deltas is None:
+        logging.warning("GRPO status changed without its previous value, counters will be reconciled")
+        session.info['dashboard_counters_stale'] = True
+        return
+    if not deltas:
+        return
+    table = GRPOStatusCount.__table__
+    # Same row order in every transaction, so two writers never deadlock
+    for status in sorted(deltas, key=lambda s: s.value):
+        updated = connection.execute(
+            update(table).where(table.c.status == status.value).values(
+                count=table.c.count + deltas[status], updated_at=datetime.utcnow()))
+        if not updated.rowcount:
+            session.info['dashboard_counters_stale'] = True
+
+
+def _reconcile_if_stale(session):
+    if session.info.pop('dashboard_counters_stale', False):
+        try:
+            reconcile()
+        except Exception as e:
+            logging.error(f"Dashboard counter reconciliation failed: {e}")
+
+
+def _discard_stale_flag(session):
+    session.info.pop('dashboard_counters_stale', None)
+
+
+_LISTENERS = (('before_flush', _count_status_changes), ('after_commit', _reconcile_if_stale),
+              ('after_rollback', _discard_stale_flag))
+
+
+def install():
+    """Keep the counters current on every ORM flush in this process (called by app.py)"""
+    for name, listener in _LISTENERS:
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
+
+def reconcile():
+    """Recount GRPOs by status and correct the counters.
+
+    Locks the counter rows first, so writers that change GRPO counts wait
+    for the recount rather than having their increments overwritten.
+    Returns ``{status: (counter, actual)}`` for every counter that drifted.
+    """
+    table = GRPOStatusCount.__table__
+    now = datetime.utcnow()
+    drifted = {}
+    try:
+        with db.engine.begin() as connection:
+            counters = dict(connection.execute(
+                select(table.c.status, table.c.count).with_for_update()).all())
+            actual = {status.value: count for status, count in connection.execute(
+                select(GRPO.status, func.count()).group_by(GRPO.status)).all()}
+            for status in GRPOStatus:
+                count = actual.get(status.value, 0)
+                if status.value not in counters:
+                    connection.execute(insert(table).values(
+                        status=status.value, count=count, updated_at=now, reconciled_at=now))
+                    continue
+                if counters[status.value] != count:
+                    drifted[status.value] = (counters[status.value], count)
+                connection.execute(update(table).where(table.c.status == status.value).values(
+                    count=count, reconciled_at=now))
+    except IntegrityError:
+        logging.info("Dashboard counters were created by another worker")
+        return drifted
+    if drifted:
+        logging.warning(f"Corrected drifted dashboard counters: {drifted}")
+    return drifted
+
+
+def get_counts():
+    """GRPO count per status value, plus ``total``"""
+    counts = dict(db.session.query(GRPOStatusCount.status, GRPOStatusCount.count).all())
+    if len(counts) < len(GRPOStatus):
+        reconcile()
+        counts = dict(db.session.query(GRPOStatusCount.status, GRPOStatusCount.count).all())
+    counts = {status.value: counts.get(status.value, 0) for status in GRPOStatus}
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+def start(app):
+    """Reconcile now and then every DASHBOARD_COUNTERS_RECONCILE_SECONDS"""
+    def run():
+        with app.app_context():
+            while True:
+                try:
+                    reconcile()
+                except Exception as e:
+                    logging.error(f"Dashboard counter reconciliation failed: {e}")
+                time.sleep(DASHBOARD_COUNTERS_RECONCILE_SECONDS)
+
+    threading.Thread(target=run, name='dashboard-counters', daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+
+    from app import app
+    logging.getLogger().setLevel(logging.INFO)
+    with app.app_context():
+        drifted = reconcile()
+        for status, (counter, actual) in drifted.items():
+            print(f"{status}: counter {counter}, actual {actual}")
+        counts = get_counts()
+        print(', '.join(f"{status}={count}" for status, count in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a raw TCP (port 9100) ZPL label printer
+
+Accepts connections like a networked Zebra printer, counts the ^XA...^XZ
+labels it receives and can print at a limited speed, so the label spooler's
+batching and backpressure can be exercised without hardware:
+
+    python fake_printer.py --port 9100 --labels-per-second 5 --save-dir /tmp/labels
+    LABEL_PRINTERS=dock1=127.0.0.1:9100 python main.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+
+class FakePrinter:
+    """Raw-socket printer that consumes ZPL no faster than ``labels_per_second``"""
+
+    def __init__(self, host='127.0.0.1', port=9100, labels_per_second=0, save_dir=None):
+        self.host = host
+        self.port = port
+        self.labels_per_second = labels_per_second
+        self.save_dir = save_dir
+        self.connections = 0
+        self.labels = 0
+        self.bytes = 0
+        self.received = []  # Raw bytes of every connection, in order
+        self._server = None
+        self._loop = None
+        self._printing = None
+
+    async def _handle(self, reader, writer):
+        # Like a real printer, take one connection at a time
+        async with self._printing:
+            await self._receive(reader, writer)
+
+    async def _receive(self, reader, writer):
+        self.connections += 1
+        connection = self.connections
+        chunks = []
+        pending = b''
+        while True:
+            chunk = await reader.read(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self.bytes += len(chunk)
+            pending += chunk
+            finished = pending.count(b'^XZ')
+            if finished:
+                pending = pending[pending.rindex(b'^XZ') + 3:]
+                self.labels += finished
+                if self.labels_per_second:
+                    # Printing is slow: stop reading and let the TCP window fill
+                    await asyncio.sleep(finished / self.labels_per_second)
+        writer.close()
+
+        data = b''.join(chunks)
+        self.received.append(data)
+        if self.save_dir:
+            os.makedirs(self.save_dir, exist_ok=True)
+            with open(os.path.join(self.save_dir, f"job-{connection:05d}.zpl"), 'wb') as f:
+                f.write(data)
+        logging.info(f"Fake printer: connection {connection} sent {data.count(b'^XZ')} labels")
+
+    async def serve(self):
+        self._printing = asyncio.Lock()
+        # A label printer's receive buffer is small; a large one would hide backpressure
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        listener.bind((self.host, self.port))
+        self._server = await asyncio.start_server(self._handle, sock=listener)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self._server
+
+    def start(self):
+        """Serve on a background thread and return once the port is bound"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name='fake-printer', daemon=True).start()
+        ready.wait()
+        return self
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+
+def start_fake_printer(host='127.0.0.1', port=0, **options):
+    """Start a fake printer on a background thread and return it"""
+    return FakePrinter(host, port, **options).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--labels-per-second', type=float, default=0,
+                        help='simulated print speed (0 = unlimited)')
+    parser.add_argument('--save-dir', help='write every received job to this directory')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    printer = FakePrinter(args.host, args.port, args.labels_per_second, args.save_dir).start()
+    logging.info(f"Fake ZPL printer listening on {printer.address}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logging.info(f"Received {printer.labels} labels over {printer.connections} connections")
+    sys.exit(0)
@@ -0,0 +1,141 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import or_
+from sqlalchemy.orm import configure_mappers, joinedload, selectinload
+
+from models import GRPO, GRPOLine, GRPOStatus, PurchaseOrder, QCApproval, QRCode
+
+# Backref attributes such as GRPO.purchase_order only exist once mappers are configured
+configure_mappers()
+
+# GRPOs shown on the QC page at once, oldest first
+QC_PENDING_LIMIT = int(os.environ.get('QC_PENDING_LIMIT', '100'))
+# GRPOs per page of the GRPO list, and the most the API returns at once
+GRPO_PAGE_SIZE = 20
+GRPO_PAGE_MAX = 100
+
+# What each page's template walks, loaded up front so rendering issues no
+# lazy SELECTs. Many-to-one relationships are joined into the main query,
+# collections come in one extra SELECT ... WHERE id IN (...) each.
+# check_query_counts.py fails when a template starts touching something
+# its profile does not load.
+PROFILES = {
+    'dashboard': (
+        joinedload(GRPO.purchase_order),
+    ),
+    'list': (
+        joinedload(GRPO.purchase_order),
+        selectinload(GRPO.qr_codes).load_only(QRCode.id),  # Only whether labels exist
+    ),
+    'api': (
+        joinedload(GRPO.purchase_order),
+    ),
+    'qc': (
+        joinedload(GRPO.purchase_order),
+        joinedload(GRPO.created_by_user),
+        selectinload(GRPO.grpo_lines).joinedload(GRPOLine.po_line),
+    ),
+    'detail': (
+        joinedload(GRPO.purchase_order).selectinload(PurchaseOrder.po_lines),
+        joinedload(GRPO.created_by_user),
+        joinedload(GRPO.qc_approval).joinedload(QCApproval.qc_user),
+        selectinload(GRPO.grpo_lines).joinedload(GRPOLine.po_line),
+        selectinload(GRPO.qr_codes),
+    ),
+}
+
+
+def grpo_query(profile):
+    """GRPO query with the named loading profile applied"""
+    return GRPO.query.options(*PROFILES[profile])
+
+
+def recent_grpos(limit=5):
+    return grpo_query('dashboard').order_by(GRPO.created_at.desc()).limit(limit).all()
+
+
+class GRPOPage:
+    """One page of GRPOs, newest first, with the cursors of its neighbours"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor  # Older GRPOs
+        self.prev_cursor = prev_cursor  # Newer GRPOs
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(direction, grpo):
+    """Opaque token for the GRPOs 'after' (older than) or 'before' (newer than) ``grpo``"""
+    key = json.dumps([direction, grpo.created_at.isoformat(), grpo.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(direction, created_at, id) of a cursor; raises ValueError for a malformed one"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        direction, created_at, grpo_id = key
+        created_at = datetime.fromisoformat(created_at)
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError('Invalid page cursor')
+    if direction not in ('after', 'before') or not isinstance(grpo_id, int):
+        raise ValueError('Invalid page cursor')
+    return direction, created_at, grpo_id
+
+
+def grpo_page(cursor=None, status=None, per_page=GRPO_PAGE_SIZE, profile='list'):
+    """A page of GRPOs, newest first, starting from ``cursor`` (the newest when None).
+
+    Seeks on (created_at, id) through ix_grpos_created_at_id or
+    ix_grpos_status_created_at_id instead of counting past an OFFSET, so
+    a deep page costs the same as the first. Raises ValueError for a bad
+    cursor.
+    """
+    query = grpo_query(profile)
+    if status:
+        query = query.filter(GRPO.status == status)
+    direction, created_at, grpo_id = decode_cursor(cursor) if cursor else ('after', None, None)
+
+    # The created_at bound alone is an index range; the OR breaks ties on id within it
+    if direction == 'before':
+        query = (query.filter(GRPO.created_at >= created_at,
+                              or_(GRPO.created_at > created_at, GRPO.id > grpo_id))
+                 .order_by(GRPO.created_at, GRPO.id))
+    else:
+        if cursor:
+            query = query.filter(GRPO.created_at <= created_at,
+                                 or_(GRPO.created_at < created_at, GRPO.id < grpo_id))
+        query = query.order_by(GRPO.created_at.desc(), GRPO.id.desc())
+    items = query.limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'before':
+        if not more:
+            # Back at the newest GRPOs: show a full first page rather than a short one
+            return grpo_page(None, status, per_page, profile)
+        items.reverse()
+        return GRPOPage(items, encode_cursor('after', items[-1]), encode_cursor('before', items[0]))
+    return GRPOPage(items,
+                    encode_cursor('after', items[-1]) if more else None,
+                    encode_cursor('before', items[0]) if cursor and items else None)
+
+
+def pending_qc_grpos(limit=QC_PENDING_LIMIT):
+    return (grpo_query('qc').filter(GRPO.status == GRPOStatus.PENDING_QC)
+            .order_by(GRPO.created_at, GRPO.id).limit(limit).all())
+
+
+def get_grpo_or_404(grpo_id, profile='detail'):
+    return grpo_query(profile).filter(GRPO.id == grpo_id).first_or_404()
@@ -0,0 +1,203 @@
+import calendar
+import re
+from datetime import date
+from decimal import Decimal
+
+# ASCII group separator, what FNC1 turns into after the first position
+GS = '\x1d'
+
+# Symbology identifiers scanners may prepend: GS1-128, GS1 DataMatrix, GS1 QR,
+# GS1 DataBar, GS1 DotCode
+SYMBOLOGY_IDS = (']C1', ']d2', ']Q3', ']e0', ']J1')
+
+# Application identifiers we read: (title, fixed length or None, max length, format).
+# Formats: N numeric, X alphanumeric, D date YYMMDD, Mn measure with n implied decimals.
+_AIS = {
+    '00': ('SSCC', 18, 18, 'N'),
+    '01': ('GTIN', 14, 14, 'N'),
+    '02': ('CONTENT', 14, 14, 'N'),
+    '10': ('BATCH/LOT', None, 20, 'X'),
+    '11': ('PROD DATE', 6, 6, 'D'),
+    '12': ('DUE DATE', 6, 6, 'D'),
+    '13': ('PACK DATE', 6, 6, 'D'),
+    '15': ('BEST BEFORE', 6, 6, 'D'),
+    '16': ('SELL BY', 6, 6, 'D'),
+    '17': ('USE BY', 6, 6, 'D'),
+    '20': ('VARIANT', 2, 2, 'N'),
+    '21': ('SERIAL', None, 20, 'X'),
+    '22': ('CPV', None, 20, 'X'),
+    '240': ('ADDITIONAL ID', None, 30, 'X'),
+    '241': ('CUST. PART No.', None, 30, 'X'),
+    '250': ('SECONDARY SERIAL', None, 30, 'X'),
+    '30': ('VAR. COUNT', None, 8, 'N'),
+    '37': ('COUNT', None, 8, 'N'),
+    '400': ('ORDER NUMBER', None, 30, 'X'),
+    '401': ('GINC', None, 30, 'X'),
+    '402': ('GSIN', 17, 17, 'N'),
+    '410': ('SHIP TO LOC', 13, 13, 'N'),
+    '411': ('BILL TO', 13, 13, 'N'),
+    '412': ('PURCHASE FROM', 13, 13, 'N'),
+    '413': ('SHIP FOR LOC', 13, 13, 'N'),
+    '414': ('LOC No.', 13, 13, 'N'),
+    '415': ('PAY TO', 13, 13, 'N'),
+    '420': ('SHIP TO POST', None, 20, 'X'),
+    '422': ('ORIGIN', 3, 3, 'N'),
+    '7003': ('EXPIRY TIME', 10, 10, 'N'),
+    '90': ('INTERNAL', None, 30, 'X'),
+}
+# Measures with the number of decimals in the AI's last digit, e.g. 3102 = kg, 2 places
+_MEASURES = {
+    '310': 'NET WEIGHT (kg)',
+    '311': 'LENGTH (m)',
+    '320': 'NET WEIGHT (lb)',
+    '330': 'GROSS WEIGHT (kg)',
+    '315': 'NET VOLUME (l)'
+}
+for _prefix, _title in _MEASURES.items():
+    for _places in range(10):
+        _AIS[f'{_prefix}{_places}'] = (_title, 6, 6, f'M{_places}')
+for _ai in range(91, 100):
+    _AIS[str(_ai)] = ('INTERNAL', None, 90, 'X')
+
+# Precompiled lookup: AI length by its first two digits (fixed by the GS1 spec)
+_AI_LENGTHS = {}
+for _ai in _AIS:
+    _AI_LENGTHS.setdefault(_ai[:2], len(_ai))
+    if _AI_LENGTHS[_ai[:2]] != len(_ai):
+        raise RuntimeError(f"AI table mixes lengths under prefix {_ai[:2]}")
+
+_BRACKETED = re.compile(r'\((\d{2,4})\)([^(]*)')
+_LIKELY_GS1 = re.compile(r'^(?:0[012]\d{14}|\(\d{2,4}\))')
+
+
+class GS1ParseError(ValueError):
+    """Raised when a string is not a valid GS1 element string"""
+
+
+def is_gs1(text):
+    """Cheap check whether a scan looks like a GS1 element string"""
+    return bool(text) and (text.startswith(SYMBOLOGY_IDS) or GS in text
+                           or bool(_LIKELY_GS1.match(text)))
+
+
+def gtin_check_digit_ok(gtin):
+    digits = [int(c) for c in gtin]
+    total = sum(d * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits[:-1])))
+    return (10 - total % 10) % 10 == digits[-1]
+
+
+def _gs1_date(value):
+    """YYMMDD with the GS1 century rule; day 00 means the end of the month"""
+    today = date.today()
+    year = today.year - today.year % 100 + int(value[:2])
+    if year - today.year >= 51:
+        year -= 100
+    elif year - today.year <= -50:
+        year += 100
+    month, day = int(value[2:4]), int(value[4:6])
+    if day == 0:
+        day = calendar.monthrange(year, month)[1]
+    return date(year, month, day)
+
+
+def split_element_string(text, separator=None):
+    """Split a GS1 element string into ``{ai: value}``.
+
+    Accepts the raw form, with an optional symbology identifier and GS (or
+    ``separator``) after variable-length fields, and the human-readable
+    form with AIs in brackets. Brackets delimit every element, so AIs we do
+    not read are kept there as raw values; in the raw form they raise.
+    """
+    text = text.strip()
+    if text.startswith(SYMBOLOGY_IDS):
+        text = text[3:]
+    if separator:
+        text = text.replace(separator, GS)
+
+    if text.startswith('('):
+        pairs = _BRACKETED.findall(text)
+        if not pairs or sum(len(ai) + len(value) + 2 for ai, value in pairs) != len(text):
+            raise GS1ParseError("Malformed bracketed GS1 string")
+        elements = {}
+        for ai, value in pairs:
+            if ai in _AIS:
+                _check(ai, value)
+            elif not value or len(value) > 90:
+                raise GS1ParseError(f"AI {ai} must be 1 to 90 characters")
+            elements[ai] = value
+        return elements
+
+    elements = {}
+    position = 0
+    length = len(text)
+    while position < length:
+        if text[position] == GS:
+            position += 1
+            continue
+        ai_length = _AI_LENGTHS.get(text[position:position + 2])
+        ai = text[position:position + ai_length] if ai_length else text[position:position + 2]
+        spec = _AIS.get(ai)
+        if spec is None:
+            raise GS1ParseError(f"Unknown application identifier {ai} at position {position}")
+        position += len(ai)
+        if spec[1]:
+            value = text[position:position + spec[1]]
+            position += spec[1]
+        else:
+            end = text.find(GS, position)
+            if end == -1:
+                end = length
+            value = text[position:end]
+            position = end
+        _check(ai, value)
+        elements[ai] = value
+    return elements
+
+
+def _check(ai, value):
+    spec = _AIS.get(ai)
+    if spec is None:
+        raise GS1ParseError(f"Unknown application identifier {ai}")
+    title, fixed, maximum, fmt = spec
+    if fixed and len(value) != fixed:
+        raise GS1ParseError(f"AI {ai} ({title}) needs {fixed} characters, got {len(value)}")
+    if not value or len(value) > maximum:
+        raise GS1ParseError(f"AI {ai} ({title}) must be 1 to {maximum} characters")
+    if fmt != 'X' and not value.isdigit():
+        raise GS1ParseError(f"AI {ai} ({title}) must be numeric")
+
+
+def parse(text, separator=None):
+    """Parse a GS1 barcode into the fields a GRPO line needs.
+
+    Returns a dict with ``gtin``, ``batch_number``, ``expiry_date`` (ISO),
+    ``quantity``, ``serial``, ``sscc`` and the other dates and weights
+    present, plus every element under ``ais``. Raises GS1ParseError.
+    """
+    elements = split_element_string(text, separator)
+    fields = {'ais': elements}
+
+    gtin = elements.get('01') or elements.get('02')
+    if gtin and not gtin_check_digit_ok(gtin):
+        raise GS1ParseError(f"GTIN {gtin} has a wrong check digit")
+    fields['gtin'] = gtin
+    fields['sscc'] = elements.get('00')
+    fields['batch_number'] = elements.get('10')
+    fields['serial'] = elements.get('21')
+    fields['order_number'] = elements.get('400')
+
+    try:
+        for ai, name in (('17', 'expiry_date'), ('15', 'best_before'), ('11', 'production_date')):
+            fields[name] = _gs1_date(elements[ai]).isoformat() if ai in elements else None
+        if fields['expiry_date'] is None and '7003' in elements:
+            fields['expiry_date'] = _gs1_date(elements['7003'][:6]).isoformat()
+    except ValueError as e:
+        raise GS1ParseError(f"Invalid date: {e}")
+
+    count = elements.get('30') or elements.get('37')
+    fields['quantity'] = int(count) if count else None
+    for ai, value in elements.items():
+        title, _, _, fmt = _AIS.get(ai, (None, None, None, 'X'))
+        if fmt.startswith('M'):
+            fields.setdefault('measures', {})[title] = float(Decimal(value).scaleb(-int(fmt[1])))
+    return fields
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from decimal import Decimal
+
+from qr_generator import decode_qr_code
+
+# Label layout in dots (203 dpi: 8 dots/mm), a 60 x 30 mm label by default
+LABEL_WIDTH_DOTS = int(os.environ.get('LABEL_WIDTH_DOTS', '480'))
+QR_MAGNIFICATION = int(os.environ.get('LABEL_QR_MAGNIFICATION', '4'))
+# Labels sent to the printer in one TCP job
+LABEL_JOB_SIZE = int(os.environ.get('LABEL_JOB_SIZE', '100'))
+# Seconds the print request waits for its jobs to reach the printer before
+# reporting them as still queued
+LABEL_CONFIRM_SECONDS = float(os.environ.get('LABEL_CONFIRM_SECONDS', '5'))
+# Kernel send buffer per printer connection; kept small so a slow printer
+# pushes back on the spooler instead of megabytes piling up in the socket
+LABEL_SEND_BUFFER = int(os.environ.get('LABEL_SEND_BUFFER', '65536'))
+
+
+class PrinterError(Exception):
+    """Raised when a print job could not be delivered to its printer"""
+
+
+def configured_printers():
+    """Parse LABEL_PRINTERS, e.g. "dock1=10.0.0.21:9100,dock2=10.0.0.22" """
+    printers = {}
+    for entry in os.environ.get('LABEL_PRINTERS', '').split(','):
+        if '=' not in entry:
+            continue
+        name, address = entry.split('=', 1)
+        host, _, port = address.strip().partition(':')
+        printers[name.strip()] = (host, int(port or 9100))
+    return printers
+
+
+def _zpl_field(value):
+    """Field data with ZPL control characters hex-escaped for ^FH"""
+    return str(value).replace('_', '_5F').replace('^', '_5E').replace('~', '_7E')
+
+
+def zpl_label(qr_code):
+    """Native ZPL for one QRCode row; the printer draws the QR code itself"""
+    info = decode_qr_code(qr_code.qr_code_data) or {}
+    quantity = format(Decimal(str(qr_code.quantity)).normalize(), 'f')
+    return '\n'.join([
+        '^XA',
+        '^CI28',  # UTF-8 field data
+        f'^PW{LABEL_WIDTH_DOTS}',
+        f'^FO16,16^BQN,2,{QR_MAGNIFICATION}^FH^FDLA,{_zpl_field(qr_code.qr_code_data)}^FS',
+        f'^FO230,24^A0N,26,26^FH^FD{_zpl_field(info.get("grn_number") or "")}^FS',
+        f'^FO230,64^A0N,34,34^FH^FD{_zpl_field(qr_code.item_code)}^FS',
+        f'^FO230,110^A0N,26,26^FH^FDQty: {quantity}^FS',
+        f'^FO230,146^A0N,26,26^FH^FDBatch: {_zpl_field(qr_code.batch_number or "N/A")}^FS',
+        '^XZ',
+        ''
+    ])
+
+
+class PrintJob:
+    def __init__(self, printer, labels):
+        self.printer = printer
+        self.labels = labels  # ZPL bytes of each label
+        self.sent = 0  # Labels handed to the connection; a retry resumes after them
+        self.future = Future()
+
+
+class LabelSpooler:
+    """Streams ZPL jobs to raw TCP (port 9100) printers.
+
+    Every printer gets its own bounded asyncio queue and a sender task on
+    one background event loop. ``submit`` blocks while a printer's queue is
+    full and the sender only takes the next job once the socket has
+    drained, so a slow or jammed printer pushes back on whoever is
+    printing instead of buffering without limit. Consecutive jobs reuse
+    the connection, which is closed once the queue has been empty for
+    ``idle_timeout`` seconds. Failed sends are retried with backoff from
+    the first label that had not been written out, so a retry does not
+    print the labels before it again. The last failure of each printer is
+    kept in ``stats`` for the UI.
+    """
+
+    def __init__(self, printers, queue_size=8, attempts=3, connect_timeout=5,
+                 write_timeout=120, idle_timeout=5):
+        self.printers = printers
+        self.queue_size = queue_size
+        self.attempts = attempts
+        self.connect_timeout = connect_timeout
+        self.write_timeout = write_timeout
+        self.idle_timeout = idle_timeout
+        self.stats = {name: {'jobs': 0, 'labels': 0, 'bytes': 0, 'failed': 0,
+                             'last_error': None, 'last_error_at': None}
+                      for name in printers}
+        self._queues = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='label-spooler',
+                                 daemon=True).start()
+        return self._loop
+
+    def submit(self, printer, labels, timeout=None):
+        """Queue a job of ZPL labels and return a Future that resolves once it was sent.
+
+        Waits up to ``timeout`` seconds for room in the printer's queue and
+        raises TimeoutError if there is none.
+        """
+        if printer not in self.printers:
+            raise PrinterError(f"Unknown label printer {printer}")
+        job = PrintJob(printer, labels)
+        enqueued = asyncio.run_coroutine_threadsafe(self._enqueue(job), self._ensure_loop())
+        try:
+            enqueued.result(timeout)
+        except TimeoutError:
+            enqueued.cancel()
+            raise
+        return job.future
+
+    async def _enqueue(self, job):
+        queue = self._queues.get(job.printer)
+        if queue is None:
+            queue = self._queues[job.printer] = asyncio.Queue(maxsize=self.queue_size)
+            asyncio.get_running_loop().create_task(self._send_jobs(job.printer, queue))
+        await queue.put(job)
+
+    async def _send_jobs(self, printer, queue):
+        host, port = self.printers[printer]
+        stats = self.stats[printer]
+        writer = None
+        while True:
+            if writer is None:
+                job = await queue.get()
+            else:
+                try:
+                    job = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # Free the printer for other hosts while we have nothing to send
+                    writer.close()
+                    try:
+                        await writer.wait_closed()
+                    except OSError:
+                        pass
+                    writer = None
+                    continue
+
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    if writer is None:
+                        _, writer = await asyncio.wait_for(
+                            asyncio.open_connection(host, port), self.connect_timeout)
+                        writer.get_extra_info('socket').setsockopt(
+                            socket.SOL_SOCKET, socket.SO_SNDBUF, LABEL_SEND_BUFFER)
+                        # drain() then returns only once a label has left the
+                        # transport; the kernel send buffer still pushes back
+                        writer.transport.set_write_buffer_limits(high=0)
+                    while job.sent < len(job.labels):
+                        label = job.labels[job.sent]
+                        writer.write(label)
+                        await asyncio.wait_for(writer.drain(), self.write_timeout)
+                        job.sent += 1
+                        stats['labels'] += 1
+                        stats['bytes'] += len(label)
+                except (OSError, asyncio.TimeoutError) as e:
+                    if writer is not None:
+                        writer.close()
+                        writer = None
+                    error = f"{e or type(e).__name__} ({job.sent} of {len(job.labels)} labels sent)"
+                    if attempt == self.attempts:
+                        stats['failed'] += 1
+                        stats['last_error'] = error
+                        stats['last_error_at'] = datetime.utcnow().isoformat()
+                        logging.error(f"Label printer {printer} failed after {attempt} attempts: {error}")
+                        job.future.set_exception(PrinterError(f"Printer {printer}: {error}"))
+                    else:
+                        logging.warning(f"Label printer {printer} attempt {attempt} failed: {error}")
+                        await asyncio.sleep(min(2 ** attempt, 10))
+                    continue
+
+                stats['jobs'] += 1
+                job.future.set_result(job.sent)
+                break
+
+    def metrics(self):
+        return {name: dict(stats, queued=self._queues[name].qsize() if name in self._queues else 0)
+                for name, stats in self.stats.items()}
+
+
+_spooler = None
+_spooler_lock = threading.Lock()
+
+
+def get_spooler():
+    """Process-wide spooler for the printers in LABEL_PRINTERS"""
+    global _spooler
+    with _spooler_lock:
+        if _spooler is None:
+            _spooler = LabelSpooler(
+                configured_printers(),
+                queue_size=int(os.environ.get('LABEL_SPOOL_QUEUE_SIZE', '8')))
+        return _spooler
+
+
+def print_labels(qr_codes, printer_name=None, timeout=None):
+    """Send QRCode rows to a label printer as ZPL, LABEL_JOB_SIZE labels per job.
+
+    Returns one Future per job. Without ``printer_name`` the first
+    configured printer (or LABEL_PRINTER_DEFAULT) is used.
+    """
+    spooler = get_spooler()
+    printer_name = printer_name or os.environ.get('LABEL_PRINTER_DEFAULT') \
+        or next(iter(spooler.printers), None)
+    if printer_name is None:
+        raise PrinterError("No label printers configured (LABEL_PRINTERS)")
+
+    futures = []
+    for start in range(0, len(qr_codes), LABEL_JOB_SIZE):
+        batch = qr_codes[start:start + LABEL_JOB_SIZE]
+        labels = [zpl_label(qr_code).encode('utf-8') for qr_code in batch]
+        futures.append(spooler.submit(printer_name, labels, timeout=timeout))
+    logging.info(f"Queued {len(qr_codes)} labels in {len(futures)} jobs for printer {printer_name}")
+    return futures
@@ -0,0 +1,249 @@
+import logging
+import os
+import struct
+import zlib
+from decimal import Decimal
+from io import BytesIO
+
+from PIL import Image
+
+from qr_generator import decode_qr_code, qr_image_cache, render_qr_codes
+
+# Page sizes in PDF points (1/72 inch)
+PAGE_SIZES = {
+    'A4': (595.28, 841.89),
+    'Letter': (612.0, 792.0)
+}
+# Labels per sheet, e.g. "3x8" for 24 labels in 3 columns and 8 rows
+LABEL_SHEET_LAYOUT = os.environ.get('LABEL_SHEET_LAYOUT', '3x8')
+# QR code rows loaded, and their images rendered, per database round trip
+LABEL_SHEET_CHUNK = int(os.environ.get('LABEL_SHEET_CHUNK', '240'))
+
+PAGE_MARGIN = 28  # points, about 10 mm
+CELL_PADDING = 6
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def parse_layout(layout):
+    """Turn "3x8" into (3, 8)"""
+    columns, _, rows = layout.lower().partition('x')
+    columns, rows = int(columns), int(rows)
+    if not (0 < columns <= 10 and 0 < rows <= 20):
+        raise ValueError(f"Unsupported label sheet layout {layout}")
+    return columns, rows
+
+
+def _pdf_text(value):
+    """Literal PDF string for the standard (Latin-1) Helvetica font"""
+    text = str(value).encode('latin-1', 'replace').decode('latin-1')
+    return '(' + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def _fit(value, width, font_size):
+    """Truncate text that would not fit ``width`` points (Helvetica averages ~0.55 em)"""
+    text = str(value)
+    limit = max(1, int(width / (font_size * 0.55)))
+    return text if len(text) <= limit else text[:limit - 1] + '~'
+
+
+def png_image_xobject(png):
+    """PDF image XObject (dictionary entries, stream data) for PNG bytes.
+
+    Non-interlaced grey or RGB PNGs, which is what the QR renderer writes,
+    are embedded as they are: their IDAT data is already a Flate stream
+    with PNG row predictors, which PDF readers decode natively. Anything
+    else is decoded and re-compressed.
+    """
+    header = None
+    idat = []
+    if png[:8] == PNG_SIGNATURE:
+        position = 8
+        while position + 8 <= len(png):
+            length, chunk_type = struct.unpack('>I4s', png[position:position + 8])
+            chunk = png[position + 8:position + 8 + length]
+            if chunk_type == b'IHDR':
+                header = struct.unpack('>IIBBBBB', chunk)
+            elif chunk_type == b'IDAT':
+                idat.append(chunk)
+            elif chunk_type == b'IEND':
+                break
+            position += length + 12
+
+    if header and header[3] in (0, 2) and header[6] == 0:
+        width, height, bit_depth, color_type = header[:4]
+        colors = 1 if color_type == 0 else 3
+        color_space = 'DeviceGray' if colors == 1 else 'DeviceRGB'
+        return (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /{color_space} /BitsPerComponent {bit_depth} "
+                f"/Filter /FlateDecode /DecodeParms << /Predictor 15 /Colors {colors} "
+                f"/BitsPerComponent {bit_depth} /Columns {width} >>"), b''.join(idat)
+
+    image = Image.open(BytesIO(png)).convert('L')
+    return (f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode"), \
+        zlib.compress(image.tobytes())
+
+
+class PDFStreamWriter:
+    """Writes a PDF front to back, handing out the bytes as pages are added.
+
+    Objects are numbered in the order they are written and only their byte
+    offsets are kept for the cross-reference table. The page tree (object
+    2) is referenced by every page but written last, once the page count
+    is known.
+    """
+
+    CATALOG = 1
+    PAGES = 2
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.next_object = 3
+        self.pages = []
+        self._buffer = []
+
+    def _emit(self, data):
+        self._buffer.append(data)
+        self.position += len(data)
+
+    def add_object(self, body, stream=None, number=None):
+        """Write a dictionary (or, with ``stream``, a stream object) and return its number"""
+        if number is None:
+            number = self.next_object
+            self.next_object += 1
+        self.offsets[number] = self.position
+        if stream is None:
+            self._emit(f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+        else:
+            self._emit(f"{number} 0 obj\n<< {body} /Length {len(stream)} >>\nstream\n".encode('latin-1'))
+            self._emit(stream)
+            self._emit(b"\nendstream\nendobj\n")
+        return number
+
+    def begin(self):
+        self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.add_object(f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>", number=self.CATALOG)
+
+    def add_page(self, width, height, content, resources):
+        contents = self.add_object('/Filter /FlateDecode', stream=zlib.compress(content.encode('latin-1')))
+        self.pages.append(self.add_object(
+            f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {width} {height}] "
+            f"/Resources {resources} /Contents {contents} 0 R >>"))
+
+    def finish(self):
+        kids = ' '.join(f"{page} 0 R" for page in self.pages)
+        self.add_object(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>",
+                        number=self.PAGES)
+        xref_offset = self.position
+        lines = [f"xref\n0 {self.next_object}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self.offsets[number]:010d} 00000 n \n" for number in range(1, self.next_object))
+        lines.append(f"trailer\n<< /Size {self.next_object} /Root {self.CATALOG} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self._emit(''.join(lines).encode('latin-1'))
+
+    def flush(self):
+        data = b''.join(self._buffer)
+        self._buffer = []
+        return data
+
+
+def iter_chunks(query, key_column, chunk_size=LABEL_SHEET_CHUNK):
+    """Yield the rows of ``query`` in lists of ``chunk_size``, paging on ``key_column``.
+
+    Each chunk is a fresh keyset query, so neither the database cursor nor
+    the session holds more than one chunk at a time.
+    """
+    last_key = None
+    while True:
+        chunk_query = query if last_key is None else query.filter(key_column > last_key)
+        rows = chunk_query.order_by(key_column).limit(chunk_size).all()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_key = getattr(rows[-1], key_column.key)
+
+
+def _label_content(label, image_name, x, y, cell_width, cell_height):
+    """Drawing operators for one label cell with its bottom left corner at (x, y)"""
+    size = min(cell_height, cell_width / 2) - 2 * CELL_PADDING
+    text_x = x + size + 2 * CELL_PADDING
+    text_width = cell_width - size - 3 * CELL_PADDING
+    info = decode_qr_code(label.qr_code_data) or {}
+    quantity = format(Decimal(str(label.quantity)).normalize(), 'f')
+
+    operators = [f"q {size:.2f} 0 0 {size:.2f} {x + CELL_PADDING:.2f} "
+                 f"{y + (cell_height - size) / 2:.2f} cm /{image_name} Do Q"]
+    line_y = y + cell_height - CELL_PADDING
+    for text, font_size in ((label.item_code, 9), (f"Qty: {quantity}", 8),
+                            (f"Batch: {label.batch_number or 'N/A'}", 8),
+                            (info.get('grn_number') or '', 7)):
+        line_y -= font_size + 3
+        operators.append(f"BT /F1 {font_size} Tf {text_x:.2f} {line_y:.2f} Td "
+                         f"{_pdf_text(_fit(text, text_width, font_size))} Tj ET")
+    return '\n'.join(operators)
+
+
+def stream_label_sheet(chunks, page_size='A4', layout=LABEL_SHEET_LAYOUT):
+    """Generate a label sheet PDF piece by piece, one page at a time.
+
+    ``chunks`` yields lists of rows with ``qr_code_data``, ``item_code``,
+    ``quantity`` and ``batch_number`` (see ``iter_chunks``). The images of
+    each chunk come from the QR image cache, rendering only the misses, and
+    are embedded once per document however many labels share them. Memory
+    use depends on the chunk size, not on the number of labels.
+    """
+    page_width, page_height = PAGE_SIZES[page_size]
+    columns, rows = parse_layout(layout)
+    per_page = columns * rows
+    cell_width = (page_width - 2 * PAGE_MARGIN) / columns
+    cell_height = (page_height - 2 * PAGE_MARGIN) / rows
+
+    pdf = PDFStreamWriter()
+    pdf.begin()
+    font = pdf.add_object("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                          "/Encoding /WinAnsiEncoding >>")
+    images = {}
+    labels = 0
+
+    def write_page(page_labels):
+        content = []
+        page_images = {}
+        for index, (label, path) in enumerate(page_labels):
+            if path not in images:
+                try:
+                    with open(qr_image_cache.path(path), 'rb') as f:
+                        png = f.read()
+                except FileNotFoundError:
+                    # Evicted since the chunk was rendered
+                    render_qr_codes([label.qr_code_data])
+                    with open(qr_image_cache.path(path), 'rb') as f:
+                        png = f.read()
+                body, data = png_image_xobject(png)
+                images[path] = pdf.add_object(body, stream=data)
+            name = f"Im{images[path]}"
+            page_images[name] = images[path]
+            column, row = index % columns, index // columns
+            x = PAGE_MARGIN + column * cell_width
+            y = page_height - PAGE_MARGIN - (row + 1) * cell_height
+            content.append(_label_content(label, name, x, y, cell_width, cell_height))
+        xobjects = ' '.join(f"/{name} {number} 0 R" for name, number in page_images.items())
+        pdf.add_page(page_width, page_height, '\n'.join(content),
+                     f"<< /Font << /F1 {font} 0 R >> /XObject << {xobjects} >> >>")
+
+    pending = []
+    for chunk in chunks:
+        paths = render_qr_codes([label.qr_code_data for label in chunk])
+        pending.extend(zip(chunk, paths))
+        labels += len(chunk)
+        while len(pending) >= per_page:
+            write_page(pending[:per_page])
+            pending = pending[per_page:]
+            yield pdf.flush()
+
+    if pending or not pdf.pages:
+        write_page(pending)
+    pdf.finish()
+    logging.info(f"Label sheet: {labels} labels on {len(pdf.pages)} {page_size} pages")
+    yield pdf.flush()
@@ -1,5 +1,12 @@
 from app import app
 import routes  # noqa: F401
+import scan_index
+import dashboard_counters
+import report_rollups
+
+scan_index.start(app)
+dashboard_counters.start(app)
+report_rollups.start(app)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
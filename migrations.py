@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations that are safe to run against a live database
+
+db.create_all() only creates missing tables, so changes to existing tables
+(indexes and enum values so far) are listed here and recorded in ``schema_migrations``
+once applied. Indexes are built online where the database supports it:
+CREATE INDEX CONCURRENTLY on PostgreSQL and ALGORITHM=INPLACE, LOCK=NONE on
+MySQL/MariaDB, so GRPO entry keeps working while an index builds.
+
+Run the upgrade as a deploy step, before the new code starts serving. An
+index build on a large table can take minutes, which is too long for a web
+worker's boot. The app only logs pending migrations unless
+DB_AUTO_MIGRATE=true.
+
+Usage: python migrations.py [status | upgrade | downgrade VERSION]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+# Seconds a worker waits for another worker's migration run to finish
+MIGRATION_LOCK_TIMEOUT = int(os.environ.get('MIGRATION_LOCK_TIMEOUT', '900'))
+MIGRATION_LOCK_NAME = 'wms_schema_migrations'
+_PG_LOCK_KEY = 0x574d53  # pg_advisory_lock key, 'WMS'
+
+
+class CreateIndex:
+    """Add an index without blocking writes to the table where possible"""
+
+    def __init__(self, table, name, columns, unique=False):
+        self.table = table
+        self.name = name
+        self.columns = columns
+        self.unique = unique
+
+    def __repr__(self):
+        return f"CreateIndex({self.table}.{self.name} on {', '.join(self.columns)})"
+
+    def _covers(self, index):
+        if self.unique:
+            return index['unique'] and index['column_names'] == self.columns
+        return index['column_names'][:len(self.columns)] == self.columns
+
+    def _quoted(self, dialect):
+        quote = dialect.identifier_preparer.quote
+        return quote(self.table), quote(self.name), ', '.join(quote(c) for c in self.columns)
+
+    def _state(self, connection):
+        """'valid', 'invalid' (a failed concurrent build), 'covered' or None"""
+        if connection.dialect.name == 'postgresql':
+            valid = connection.execute(text(
+                "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"),
+                {'name': self.name}).scalar()
+            if valid is not None:
+                return 'valid' if valid else 'invalid'
+        indexes = inspect(connection).get_indexes(self.table)
+        if any(index['name'] == self.name for index in indexes):
+            return 'valid'
+        # e.g. the index InnoDB adds for a foreign key, or a wider index
+        # listed before this one
+        if any(self._covers(index) for index in indexes):
+            return 'covered'
+        return None
+
+    def apply(self, connection, skip_covered=True):
+        dialect = connection.dialect.name
+        table, name, columns = self._quoted(connection.dialect)
+        unique = 'UNIQUE ' if self.unique else ''
+        state = self._state(connection)
+        if state == 'valid' or (state == 'covered' and skip_covered):
+            logging.info(f"Index {self.name} on {self.table} already {'present' if state == 'valid' else 'covered'}")
+            return
+        if dialect == 'postgresql':
+            if state == 'invalid':
+                logging.warning(f"Dropping invalid index {self.name} left by an interrupted build")
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            connection.execute(text(f"CREATE {unique}INDEX CONCURRENTLY {name} ON {table} ({columns})"))
+        elif dialect in ('mysql', 'mariadb'):
+            connection.execute(text(
+                f"ALTER TABLE {table} ADD {unique}INDEX {name} ({columns}), ALGORITHM=INPLACE, LOCK=NONE"))
+        else:
+            connection.execute(text(f"CREATE {unique}INDEX {name} ON {table} ({columns})"))
+        logging.info(f"Created index {self.name} on {self.table}")
+
+    def revert(self, connection):
+        dialect = connection.dialect.name
+        table, name, _ = self._quoted(connection.dialect)
+        if self._state(connection) not in ('valid', 'invalid'):
+            return
+        if dialect == 'postgresql':
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        elif dialect in ('mysql', 'mariadb'):
+            connection.execute(text(f"ALTER TABLE {table} DROP INDEX {name}, ALGORITHM=INPLACE, LOCK=NONE"))
+        else:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        logging.info(f"Dropped index {self.name} on {self.table}")
+
+
+class DropIndex(CreateIndex):
+    """Remove an index that a wider or unique one has replaced"""
+
+    def __repr__(self):
+        return f"DropIndex({self.table}.{self.name} on {', '.join(self.columns)})"
+
+    def apply(self, connection):
+        super().revert(connection)
+
+    def revert(self, connection):
+        # The replacement still covers these columns until it is reverted too
+        super().apply(connection, skip_covered=False)
+
+
+class AddEnumValue:
+    """Extend a native ENUM column with a new value
+
+    SQLAlchemy stores Enum(...) members by name. PostgreSQL keeps the names in
+    a named type; MySQL/MariaDB in each column's definition, so the full list
+    is needed there. Other databases store the names as plain strings.
+    """
+
+    def __init__(self, type_name, table, column, values, value, nullable=False):
+        self.type_name = type_name
+        self.table = table
+        self.column = column
+        self.values = values
+        self.value = value
+        self.nullable = nullable
+
+    def __repr__(self):
+        return f"AddEnumValue({self.type_name} += {self.value})"
+
+    def apply(self, connection):
+        dialect = connection.dialect.name
+        if dialect == 'postgresql':
+            # ADD VALUE may not run inside a transaction block before PostgreSQL 12
+            connection.execute(text(f"ALTER TYPE {connection.dialect.identifier_preparer.quote(self.type_name)} "
+                                    f"ADD VALUE IF NOT EXISTS '{self.value}'"))
+        elif dialect in ('mysql', 'mariadb'):
+            column_type = connection.execute(text(
+                "SELECT COLUMN_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+                "AND TABLE_NAME = :table AND COLUMN_NAME = :column"),
+                {'table': self.table, 'column': self.column}).scalar()
+            if column_type is None or f"'{self.value}'" in column_type:
+                return
+            quote = connection.dialect.identifier_preparer.quote
+            members = ', '.join(f"'{value}'" for value in self.values)
+            # Appending a value to the end of the list is a metadata-only change
+            connection.execute(text(
+                f"ALTER TABLE {quote(self.table)} MODIFY {quote(self.column)} ENUM({members}) "
+                f"{'NULL' if self.nullable else 'NOT NULL'}, ALGORITHM=INPLACE, LOCK=NONE"))
+        else:
+            return
+        logging.info(f"Added {self.value} to {self.type_name}")
+
+    def revert(self, connection):
+        # PostgreSQL cannot drop an enum value, and rows may already use it
+        logging.info(f"Leaving {self.value} in {self.type_name}")
+
+
+# (version, description, operations), applied in order. Never edit an applied
+# entry, add a new one. models.py declares the same indexes for new databases.
+MIGRATIONS = [
+    ('0001', 'Indexes for GRPO list, dashboard, detail joins, labels, PO sync and outbox', [
+        CreateIndex('grpos', 'ix_grpos_status_created_at', ['status', 'created_at']),
+        CreateIndex('grpos', 'ix_grpos_created_at', ['created_at']),
+        CreateIndex('grpos', 'ix_grpos_po_id', ['po_id']),
+        CreateIndex('grpo_lines', 'ix_grpo_lines_grpo_id', ['grpo_id']),
+        CreateIndex('grpo_lines', 'ix_grpo_lines_po_line_id', ['po_line_id']),
+        CreateIndex('purchase_order_lines', 'ix_purchase_order_lines_po_id_line_number',
+                    ['po_id', 'line_number']),
+        CreateIndex('purchase_orders', 'ix_purchase_orders_sap_doc_entry', ['sap_doc_entry']),
+        CreateIndex('qr_codes', 'ix_qr_codes_grpo_id_id', ['grpo_id', 'id']),
+        CreateIndex('qr_codes', 'ix_qr_codes_created_at', ['created_at']),
+        CreateIndex('qc_approvals', 'ix_qc_approvals_grpo_id', ['grpo_id']),
+        CreateIndex('sap_outbox', 'ix_sap_outbox_status_next_attempt_at', ['status', 'next_attempt_at']),
+        CreateIndex('sap_outbox', 'ix_sap_outbox_grpo_id', ['grpo_id']),
+    ]),
+    ('0002', 'Indexes for the incremental report rollup refresh', [
+        CreateIndex('grpos', 'ix_grpos_receipt_date', ['receipt_date']),
+        CreateIndex('grpos', 'ix_grpos_updated_at', ['updated_at']),
+    ]),
+    ('0003', 'GRPO list keyset indexes on (created_at, id)', [
+        CreateIndex('grpos', 'ix_grpos_created_at_id', ['created_at', 'id']),
+        CreateIndex('grpos', 'ix_grpos_status_created_at_id', ['status', 'created_at', 'id']),
+        DropIndex('grpos', 'ix_grpos_created_at', ['created_at']),
+        DropIndex('grpos', 'ix_grpos_status_created_at', ['status', 'created_at']),
+    ]),
+    ('0004', 'SAP_POST_FAILED GRPO status', [
+        AddEnumValue('grpostatus', 'grpos', 'status',
+                     ['DRAFT', 'PENDING_QC', 'QC_APPROVED', 'QC_REJECTED', 'POSTED_TO_SAP', 'SAP_POST_FAILED'],
+                     'SAP_POST_FAILED'),
+    ]),
+    ('0005', 'Unique SAP DocEntry on purchase orders for the PO sync upsert', [
+        CreateIndex('purchase_orders', 'uq_purchase_orders_sap_doc_entry', ['sap_doc_entry'], unique=True),
+        DropIndex('purchase_orders', 'ix_purchase_orders_sap_doc_entry', ['sap_doc_entry']),
+    ]),
+]
+
+
+@contextmanager
+def _migration_lock(connection, timeout=None):
+    """Serialize migration runs, waiting up to ``timeout`` seconds for another one"""
+    timeout = MIGRATION_LOCK_TIMEOUT if timeout is None else timeout
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        acquire = text("SELECT pg_try_advisory_lock(:key)")
+        release = text("SELECT pg_advisory_unlock(:key)")
+        params = {'key': _PG_LOCK_KEY}
+    elif dialect in ('mysql', 'mariadb'):
+        acquire = text("SELECT GET_LOCK(:name, 0)")
+        release = text("SELECT RELEASE_LOCK(:name)")
+        params = {'name': MIGRATION_LOCK_NAME}
+    else:
+        yield
+        return
+
+    deadline = time.monotonic() + timeout
+    while not connection.execute(acquire, params).scalar():
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Another migration run is in progress (waited {timeout}s)")
+        time.sleep(1)
+    try:
+        yield
+    finally:
+        connection.execute(release, params)
+
+
+def applied_versions(engine=None):
+    from app import db
+    from models import SchemaMigration
+
+    engine = engine or db.engine
+    table = SchemaMigration.__table__
+    table.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return {row.version: row for row in connection.execute(table.select())}
+
+
+def pending_versions(engine=None):
+    return [version for version, _, _ in MIGRATIONS if version not in applied_versions(engine)]
+
+
+def upgrade(engine=None, target=None, lock_timeout=None):
+    """Apply pending migrations up to ``target`` (all by default), return their versions"""
+    from app import db
+    from models import SchemaMigration
+
+    engine = engine or db.engine
+    table = SchemaMigration.__table__
+    applied = []
+    # DDL runs outside transactions: CREATE INDEX CONCURRENTLY refuses to run inside one
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        with _migration_lock(connection, lock_timeout):
+            done = applied_versions(engine)
+            for version, description, operations in MIGRATIONS:
+                if target and version > target:
+                    break
+                if version in done:
+                    continue
+                logging.info(f"Applying migration {version}: {description}")
+                started = time.perf_counter()
+                for operation in operations:
+                    operation.apply(connection)
+                duration_ms = int((time.perf_counter() - started) * 1000)
+                connection.execute(table.insert().values(
+                    version=version, description=description,
+                    applied_at=datetime.utcnow(), duration_ms=duration_ms))
+                logging.info(f"Migration {version} applied in {duration_ms} ms")
+                applied.append(version)
+    return applied
+
+
+def downgrade(target, engine=None):
+    """Revert applied migrations newer than ``target``, newest first"""
+    from app import db
+    from models import SchemaMigration
+
+    engine = engine or db.engine
+    table = SchemaMigration.__table__
+    reverted = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        with _migration_lock(connection):
+            done = applied_versions(engine)
+            for version, description, operations in reversed(MIGRATIONS):
+                if version <= target or version not in done:
+                    continue
+                logging.info(f"Reverting migration {version}: {description}")
+                for operation in reversed(operations):
+                    operation.revert(connection)
+                connection.execute(table.delete().where(table.c.version == version))
+                reverted.append(version)
+    return reverted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('command', nargs='?', default='status', choices=['status', 'upgrade', 'downgrade'])
+    parser.add_argument('version', nargs='?', help='target version (required for downgrade)')
+    args = parser.parse_args()
+    if args.command == 'downgrade' and not args.version:
+        parser.error('downgrade needs a target version, e.g. 0000 to revert everything')
+
+    os.environ.setdefault('DB_AUTO_MIGRATE', 'false')
+    from app import app
+    logging.getLogger().setLevel(logging.INFO)
+
+    with app.app_context():
+        if args.command == 'upgrade':
+            applied = upgrade(target=args.version)
+            print(f"Applied {', '.join(applied)}" if applied else "Schema is up to date")
+        elif args.command == 'downgrade':
+            reverted = downgrade(args.version)
+            print(f"Reverted {', '.join(reverted)}" if reverted else "Nothing to revert")
+        else:
+            done = applied_versions()
+            for version, description, _ in MIGRATIONS:
+                row = done.get(version)
+                state = f"applied {row.applied_at:%Y-%m-%d %H:%M} ({row.duration_ms} ms)" if row else 'pending'
+                print(f"{version}  {state:<36}{description}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,6 +17,7 @@ class GRPOStatus(enum.Enum):
     QC_APPROVED = "qc_approved"
     QC_REJECTED = "qc_rejected"
     POSTED_TO_SAP = "posted_to_sap"
+    SAP_POST_FAILED = "sap_post_failed"
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -55,6 +56,9 @@ class User(db.Model):
 
 class PurchaseOrder(db.Model):
     __tablename__ = 'purchase_orders'
+    __table_args__ = (
+        db.Index('uq_purchase_orders_sap_doc_entry', 'sap_doc_entry', unique=True),  # PO sync upsert key
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     po_number = db.Column(db.String(50), unique=True, nullable=False)
@@ -75,6 +79,9 @@ class PurchaseOrder(db.Model):
 
 class PurchaseOrderLine(db.Model):
     __tablename__ = 'purchase_order_lines'
+    __table_args__ = (
+        db.Index('ix_purchase_order_lines_po_id_line_number', 'po_id', 'line_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     po_id = db.Column(db.Integer, db.ForeignKey('purchase_orders.id'), nullable=False)
@@ -93,6 +100,14 @@ class PurchaseOrderLine(db.Model):
 
 class GRPO(db.Model):
     __tablename__ = 'grpos'
+    __table_args__ = (
+        # Keyset pages of the GRPO list, seeking on (created_at, id) with or without a status filter
+        db.Index('ix_grpos_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_grpos_created_at_id', 'created_at', 'id'),
+        db.Index('ix_grpos_po_id', 'po_id'),
+        db.Index('ix_grpos_receipt_date', 'receipt_date'),  # Report rollup days
+        db.Index('ix_grpos_updated_at', 'updated_at'),  # Report rollup watermark
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     grn_number = db.Column(db.String(50), unique=True, nullable=False)
@@ -114,6 +129,10 @@ class GRPO(db.Model):
 
 class GRPOLine(db.Model):
     __tablename__ = 'grpo_lines'
+    __table_args__ = (
+        db.Index('ix_grpo_lines_grpo_id', 'grpo_id'),
+        db.Index('ix_grpo_lines_po_line_id', 'po_line_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     grpo_id = db.Column(db.Integer, db.ForeignKey('grpos.id'), nullable=False)
@@ -131,6 +150,9 @@ class GRPOLine(db.Model):
 
 class QCApproval(db.Model):
     __tablename__ = 'qc_approvals'
+    __table_args__ = (
+        db.Index('ix_qc_approvals_grpo_id', 'grpo_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     grpo_id = db.Column(db.Integer, db.ForeignKey('grpos.id'), nullable=False)
@@ -141,6 +163,10 @@ class QCApproval(db.Model):
 
 class QRCode(db.Model):
     __tablename__ = 'qr_codes'
+    __table_args__ = (
+        db.Index('ix_qr_codes_grpo_id_id', 'grpo_id', 'id'),  # Labels of a GRPO in keyset order
+        db.Index('ix_qr_codes_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     grpo_id = db.Column(db.Integer, db.ForeignKey('grpos.id'), nullable=False)
@@ -151,6 +177,150 @@ class QRCode(db.Model):
     batch_number = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class SAPOutbox(db.Model):
+    __tablename__ = 'sap_outbox'
+    __table_args__ = (
+        db.Index('ix_sap_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),  # Worker claims
+        db.Index('ix_sap_outbox_grpo_id', 'grpo_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    grpo_id = db.Column(db.Integer, db.ForeignKey('grpos.id'), nullable=False)
+    operation = db.Column(db.String(50), nullable=False, default='post_grpo')
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'processing', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)  # Worker currently posting this entry
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    grpo = db.relationship('GRPO', backref='sap_outbox_entries')
+
+class SAPGuardSnapshot(db.Model):
+    __tablename__ = 'sap_guard_snapshots'
+    __table_args__ = (db.UniqueConstraint('worker_id', 'endpoint'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    worker_id = db.Column(db.String(100), nullable=False)  # host:pid of the SAP worker
+    endpoint = db.Column(db.String(100), nullable=False)
+    metrics = db.Column(db.Text, nullable=False)  # JSON of EndpointGuard.metrics()
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SyncWatermark(db.Model):
+    __tablename__ = 'sync_watermarks'
+    __table_args__ = (db.UniqueConstraint('entity', 'branch_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(50), nullable=False)  # SAP B1 collection, e.g. PurchaseOrders
+    branch_id = db.Column(db.String(20), nullable=False, default='')  # '' means all branches
+    last_updated_at = db.Column(db.DateTime, nullable=True)  # Highest SAP UpdateDate/UpdateTime seen
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class NumberSequence(db.Model):
+    __tablename__ = 'number_sequences'
+    __table_args__ = (db.UniqueConstraint('name', 'branch_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)  # Document series, e.g. GRN
+    branch_id = db.Column(db.String(20), nullable=False, default='')  # '' means not branch specific
+    next_value = db.Column(db.BigInteger, nullable=False, default=1)  # First number of the next unclaimed block
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class GRPOStatusCount(db.Model):
+    __tablename__ = 'grpo_status_counts'
+
+    status = db.Column(db.String(20), primary_key=True)  # GRPOStatus value
+    count = db.Column(db.BigInteger, nullable=False, default=0)  # Kept current by dashboard_counters.py
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    reconciled_at = db.Column(db.DateTime, nullable=True)  # Last recount against the grpos table
+
+class GRPODailyRollup(db.Model):
+    __tablename__ = 'grpo_daily_rollups'
+    __table_args__ = (db.UniqueConstraint('day', 'branch_id', 'supplier_code', 'status'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # GRPO receipt date
+    branch_id = db.Column(db.String(20), nullable=False)  # From the purchase order
+    supplier_code = db.Column(db.String(50), nullable=False)
+    status = db.Column(Enum(GRPOStatus), nullable=False)
+    grpo_count = db.Column(db.Integer, nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(Numeric(18, 2), nullable=False, default=0)
+    qc_approved = db.Column(db.Integer, nullable=False, default=0)  # GRPOs with an approving QC decision
+    qc_rejected = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class GRPOMonthlyRollup(db.Model):
+    __tablename__ = 'grpo_monthly_rollups'
+    __table_args__ = (db.UniqueConstraint('month', 'branch_id', 'supplier_code', 'status'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False)  # First day of the month, summed from grpo_daily_rollups
+    branch_id = db.Column(db.String(20), nullable=False)
+    supplier_code = db.Column(db.String(50), nullable=False)
+    status = db.Column(Enum(GRPOStatus), nullable=False)
+    grpo_count = db.Column(db.Integer, nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(Numeric(18, 2), nullable=False, default=0)
+    qc_approved = db.Column(db.Integer, nullable=False, default=0)
+    qc_rejected = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.String(20), primary_key=True)  # See migrations.MIGRATIONS
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    duration_ms = db.Column(db.Integer, nullable=True)
+
+class SAPItem(db.Model):
+    __tablename__ = 'sap_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_code = db.Column(db.String(50), unique=True, nullable=False)
+    item_name = db.Column(db.String(200), nullable=True)
+    unit_of_measure = db.Column(db.String(20), nullable=True)
+    manage_batch = db.Column(db.Boolean, default=False)
+    is_active = db.Column(db.Boolean, default=True)
+    sap_updated_at = db.Column(db.DateTime, nullable=True)  # SAP UpdateDate/UpdateTime
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SAPWarehouse(db.Model):
+    __tablename__ = 'sap_warehouses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    warehouse_code = db.Column(db.String(20), unique=True, nullable=False)
+    warehouse_name = db.Column(db.String(200), nullable=True)
+    branch_id = db.Column(db.String(20), nullable=True)
+    bin_locations_enabled = db.Column(db.Boolean, default=False)
+    is_active = db.Column(db.Boolean, default=True)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SAPBinLocation(db.Model):
+    __tablename__ = 'sap_bin_locations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    bin_code = db.Column(db.String(50), unique=True, nullable=False)
+    abs_entry = db.Column(db.Integer, nullable=False)  # SAP B1 BinLocations AbsEntry
+    warehouse_code = db.Column(db.String(20), nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SAPBusinessPartner(db.Model):
+    __tablename__ = 'sap_business_partners'
+
+    id = db.Column(db.Integer, primary_key=True)
+    card_code = db.Column(db.String(50), unique=True, nullable=False)
+    card_name = db.Column(db.String(200), nullable=True)
+    card_type = db.Column(db.String(20), nullable=True)  # 'cSupplier', 'cCustomer', 'cLid'
+    is_active = db.Column(db.Boolean, default=True)
+    sap_updated_at = db.Column(db.DateTime, nullable=True)  # SAP UpdateDate/UpdateTime
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
@@ -0,0 +1,189 @@
+import logging
+import os
+import time
+
+from sqlalchemy import delete, insert, select, update
+
+from app import db
+from models import GRPOLine, PurchaseOrder, PurchaseOrderLine
+from sap_integration import map_purchase_order, map_purchase_order_line
+
+# Header columns refreshed when a PO already exists locally, matched on
+# sap_doc_entry (a PO keeps its DocEntry when SAP renumbers it)
+PO_UPDATE_COLUMNS = [
+    'po_number', 'supplier_code', 'supplier_name', 'branch_id', 'po_date', 'delivery_date',
+    'total_amount', 'currency', 'status', 'sap_doc_entry'
+]
+
+
+def _dialect_insert(dialect_name):
+    """Return the dialect's INSERT construct if it supports native upserts"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert
+    if dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        return mysql_insert
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert
+    return None
+
+
+class PurchaseOrderBulkWriter:
+    """Set-based writer that upserts SAP purchase orders chunk by chunk.
+
+    Each chunk costs a fixed number of statements no matter how many POs
+    it holds: one lookup of existing doc entries, one header upsert (or an
+    executemany insert plus a bulk update on dialects without a native
+    upsert), one lookup of existing lines, executemany insert/update
+    statements for the lines, and a lookup and delete of the lines SAP no
+    longer lists. Every chunk is committed on its own.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or int(
+            os.environ.get('SAP_SYNC_CHUNK_SIZE', '500'))
+        self.dialect_name = db.engine.dialect.name
+        self._buffer = []
+        self._started = time.perf_counter()
+        self.stats = {'created': 0, 'updated': 0, 'lines': 0, 'lines_removed': 0}
+
+    def add(self, sap_po):
+        self._buffer.append(sap_po)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk, self._buffer = self._buffer, []
+        self._write_chunk(chunk)
+        db.session.commit()
+
+    def finish(self):
+        """Write what is left and return the run statistics"""
+        self.flush()
+        elapsed = time.perf_counter() - self._started
+        rows = self.stats['created'] + self.stats['updated'] + self.stats['lines']
+        self.stats['seconds'] = round(elapsed, 3)
+        self.stats['rows_per_sec'] = round(rows / elapsed, 1) if elapsed else 0.0
+        logging.info(
+            f"PO bulk sync wrote {rows} rows in {elapsed:.2f}s "
+            f"({self.stats['rows_per_sec']} rows/sec)")
+        return self.stats
+
+    def _write_chunk(self, chunk):
+        # The last version of a PO in the chunk wins
+        by_entry = {sap_po['DocEntry']: sap_po for sap_po in chunk}
+        headers = [map_purchase_order(sap_po) for sap_po in by_entry.values()]
+        doc_entries = list(by_entry)
+
+        existing = self._po_ids(doc_entries)
+        self.stats['updated'] += len(existing)
+        self.stats['created'] += len(headers) - len(existing)
+
+        self._upsert_headers(headers, existing)
+        po_ids = self._po_ids(doc_entries)
+
+        lines = []
+        # POs whose payload carries their lines; a header-only payload leaves the lines alone
+        full_po_ids = []
+        for doc_entry, sap_po in by_entry.items():
+            if 'DocumentLines' in sap_po:
+                full_po_ids.append(po_ids[doc_entry])
+            for sap_line in sap_po.get('DocumentLines', []):
+                line_values = map_purchase_order_line(sap_line)
+                line_values['po_id'] = po_ids[doc_entry]
+                lines.append(line_values)
+        existing_lines = self._line_ids(list(po_ids.values()))
+        self._upsert_lines(lines, existing_lines)
+        self._remove_missing_lines(lines, existing_lines, full_po_ids)
+
+    def _po_ids(self, doc_entries):
+        rows = db.session.execute(
+            select(PurchaseOrder.sap_doc_entry, PurchaseOrder.id)
+            .where(PurchaseOrder.sap_doc_entry.in_(doc_entries)))
+        return dict(rows.all())
+
+    def _upsert_headers(self, headers, existing):
+        dialect_insert = _dialect_insert(self.dialect_name)
+
+        if dialect_insert is not None:
+            stmt = dialect_insert(PurchaseOrder.__table__)
+            if self.dialect_name in ('mysql', 'mariadb'):
+                stmt = stmt.on_duplicate_key_update(
+                    {column: stmt.inserted[column] for column in PO_UPDATE_COLUMNS})
+            else:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['sap_doc_entry'],
+                    set_={column: stmt.excluded[column] for column in PO_UPDATE_COLUMNS})
+            db.session.execute(stmt, headers)
+            return
+
+        new_rows = [row for row in headers if row['sap_doc_entry'] not in existing]
+        changed_rows = [
+            dict(row, id=existing[row['sap_doc_entry']])
+            for row in headers if row['sap_doc_entry'] in existing
+        ]
+        if new_rows:
+            db.session.execute(insert(PurchaseOrder), new_rows)
+        if changed_rows:
+            db.session.execute(update(PurchaseOrder), changed_rows)
+
+    def _line_ids(self, po_ids):
+        """Line ids of ``po_ids`` by (po_id, line_number)"""
+        return {
+            (po_id, line_number): line_id
+            for line_id, po_id, line_number in db.session.execute(
+                select(PurchaseOrderLine.id, PurchaseOrderLine.po_id,
+                       PurchaseOrderLine.line_number)
+                .where(PurchaseOrderLine.po_id.in_(po_ids)))
+        }
+
+    def _upsert_lines(self, lines, existing):
+        if not lines:
+            return
+
+        new_lines = []
+        changed_lines = []
+        for line in lines:
+            line_id = existing.get((line['po_id'], line['line_number']))
+            if line_id:
+                changed_lines.append(dict(line, id=line_id))
+            else:
+                new_lines.append(line)
+
+        if new_lines:
+            db.session.execute(insert(PurchaseOrderLine), new_lines)
+        if changed_lines:
+            db.session.execute(update(PurchaseOrderLine), changed_lines)
+        self.stats['lines'] += len(lines)
+
+    def _remove_missing_lines(self, lines, existing, po_ids):
+        """Delete lines of ``po_ids`` that SAP no longer lists.
+
+        Lines already received on a GRPO are kept for its history and logged.
+        """
+        po_ids = set(po_ids)
+        incoming = {(line['po_id'], line['line_number']) for line in lines}
+        missing = [
+            (line_id, po_id, line_number)
+            for (po_id, line_number), line_id in existing.items()
+            if po_id in po_ids and (po_id, line_number) not in incoming
+        ]
+        if not missing:
+            return
+
+        received = set(db.session.execute(
+            select(GRPOLine.po_line_id).distinct()
+            .where(GRPOLine.po_line_id.in_([line_id for line_id, _, _ in missing]))).scalars())
+        removable = [line_id for line_id, _, _ in missing if line_id not in received]
+        if removable:
+            db.session.execute(delete(PurchaseOrderLine).where(PurchaseOrderLine.id.in_(removable)))
+            self.stats['lines_removed'] += len(removable)
+        for line_id, po_id, line_number in missing:
+            if line_id in received:
+                logging.warning(
+                    f"PO line {line_number} of PO id {po_id} is no longer in SAP B1 "
+                    f"but has been received, keeping it")
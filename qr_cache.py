@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: eviction runs without a cross-process lock
+    fcntl = None
+
+
+def write_atomic(path, data):
+    """Write bytes so readers in any process see either nothing or the whole file"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class QRImageCache:
+    """Content-addressed on-disk store of rendered QR images.
+
+    Images are keyed by a SHA-256 of the payload and render options and
+    live under ``<root>/<k[0:2]>/<k[2:4]>/<k>.<fmt>``. The same label is
+    therefore rendered once, whichever worker asks for it. A hit refreshes
+    the file's mtime. Once the directory grows past ``max_bytes``, the
+    least recently used files are deleted until it is back under
+    ``low_water`` of the budget.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, low_water=0.9,
+                 check_every=256):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.check_every = check_every
+        self._writes_since_check = 0
+        self._evicting = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(qr_data, fmt, options):
+        digest = hashlib.sha256()
+        digest.update(f"{fmt}|{options}|".encode())
+        digest.update(qr_data.encode())
+        return digest.hexdigest()
+
+    def relative_path(self, key, fmt):
+        return os.path.join(key[0:2], key[2:4], f"{key}.{fmt}")
+
+    def path(self, relative_path):
+        return os.path.join(self.root, relative_path)
+
+    def lookup(self, relative_path):
+        """Return True and mark the image recently used if it is cached"""
+        try:
+            os.utime(self.path(relative_path))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def stored(self, count=1):
+        """Note that ``count`` images were written.
+
+        Every ``check_every`` writes an eviction pass starts on a background
+        thread, so the request that rendered the images never waits on a
+        scan of the cache directory.
+        """
+        with self._lock:
+            self._writes_since_check += count
+            due = self._writes_since_check >= self.check_every and not self._evicting
+            if due:
+                self._writes_since_check = 0
+                self._evicting = True
+        if due:
+            threading.Thread(target=self._evict_in_background, name='qr-cache-evict', daemon=True).start()
+
+    def _evict_in_background(self):
+        try:
+            self.evict()
+        except Exception as e:
+            logging.error(f"QR image cache eviction failed: {e}")
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp') or filename == '.evict.lock':
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        """Delete least recently used images until the cache fits its budget"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.evict.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return 0  # Another process is already evicting
+
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return 0
+
+            target = self.max_bytes * self.low_water
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                removed += 1
+
+        with self._lock:
+            self.evictions += removed
+        logging.info(f"QR image cache evicted {removed} images, {total / 1048576:.1f} MB left")
+        return removed
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -1,17 +1,92 @@
 import qrcode
+import qrcode.image.svg
 import json
+import logging
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, wait as futures_wait
 from datetime import datetime
+from decimal import Decimal
 from io import BytesIO
 import base64
+import threading
+from urllib.parse import unquote
 
-def generate_grn_number():
-    """Generate unique GRN number"""
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    return f"GRN{timestamp}"
+from qr_cache import QRImageCache, write_atomic
+
+# Root of the QR image cache; QRCode.qr_code_image_path is relative to it.
+# Kept out of static/ so images are only served through the login-protected /qr route.
+QR_STORAGE_DIR = os.environ.get(
+    'QR_STORAGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'qr_codes'))
+# Where earlier versions cached images, publicly served by /static
+_LEGACY_QR_STORAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'qr_codes')
+# Part of every cache key: change the rendering below and old images stop matching
+QR_RENDER_OPTIONS = 'ecc=L,box=10,border=4'
+# Label payload written by generate_qr_code: 'compact' or the original 'json'
+QR_PAYLOAD_FORMAT = os.environ.get('QR_PAYLOAD_FORMAT', 'compact')
+COMPACT_PAYLOAD_VERSION = 'W1'
+# QR alphanumeric characters minus the field separator '/' and the escape '%'
+COMPACT_SAFE_CHARS = set('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $*+-.:')
+# Batches smaller than this render in-process; the pool only pays off for bigger ones
+QR_POOL_THRESHOLD = int(os.environ.get('QR_POOL_THRESHOLD', '32'))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+qr_image_cache = QRImageCache(
+    QR_STORAGE_DIR, max_bytes=int(os.environ.get('QR_CACHE_MAX_MB', '512')) * 1024 * 1024)
+if os.path.isdir(_LEGACY_QR_STORAGE_DIR) and os.path.abspath(QR_STORAGE_DIR) != _LEGACY_QR_STORAGE_DIR:
+    logging.warning(f"{_LEGACY_QR_STORAGE_DIR} is no longer used and is still served publicly, delete it")
+
+def generate_grn_number(branch_id=None):
+    """Allocate the next GRN number, e.g. GRN-MAIN-0000042 for branch MAIN"""
+    from sequence_allocator import grn_sequence
+    
+    branch = ''.join(c for c in str(branch_id or '').upper() if c.isalnum())[:10]
+    number = grn_sequence.next_value(branch)
+    return f"GRN-{branch}-{number:07d}" if branch else f"GRN-{number:07d}"
+
+def _compact_escape(value):
+    """Percent-escape everything outside the QR alphanumeric set (and the separator)"""
+    if value is None:
+        return ''
+    escaped = []
+    for char in str(value):
+        if char in COMPACT_SAFE_CHARS:
+            escaped.append(char)
+        else:
+            escaped.extend(f"%{byte:02X}" for byte in char.encode())
+    return ''.join(escaped)
+
+def _compact_unescape(value):
+    return unquote(value) or None
+
+def encode_compact_payload(grn_number, line_number, item_code, quantity,
+                           batch_number=None, expiry_date=None):
+    """Encode a label as ``W1/GRN/LINE/ITEM/QTY/BATCH/EXPIRY``.
+
+    Every character is in the QR alphanumeric set (5.5 bits each instead
+    of 8), so labels need far smaller QR versions than the JSON format.
+    Anything else is percent-escaped. Trailing empty fields are dropped.
+    """
+    fields = [
+        COMPACT_PAYLOAD_VERSION,
+        _compact_escape(grn_number),
+        str(line_number),
+        _compact_escape(item_code),
+        format(Decimal(str(quantity)).normalize(), 'f'),
+        _compact_escape(batch_number),
+        expiry_date.strftime('%Y%m%d') if expiry_date else ''
+    ]
+    return '/'.join(fields).rstrip('/')
 
 def generate_qr_code(grpo, grpo_line, quantity):
     """Generate QR code data for GRPO line"""
+    if QR_PAYLOAD_FORMAT == 'compact':
+        return encode_compact_payload(grpo.grn_number, grpo_line.po_line.line_number,
+                                      grpo_line.po_line.item_code, quantity,
+                                      grpo_line.batch_number, grpo_line.expiry_date)
+
     qr_data = {
         'grn_number': grpo.grn_number,
         'po_number': grpo.purchase_order.po_number,
@@ -29,8 +104,7 @@ def generate_qr_code(grpo, grpo_line, quantity):
     
     return json.dumps(qr_data)
 
-def create_qr_code_image(qr_data, filename=None):
-    """Create QR code image from data"""
+def _make_qr(qr_data):
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -40,41 +114,158 @@ def create_qr_code_image(qr_data, filename=None):
     
     qr.add_data(qr_data)
     qr.make(fit=True)
+    return qr
+
+def create_qr_code_image(qr_data, filename=None):
+    """Create QR code image from data, reusing the cached PNG if there is one.
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    Without a filename this returns a base64 data URI; pages should link
+    to the /qr/<id>.png route (qr_image_url in templates) instead.
+    """
+    image = read_qr_code_image(qr_data)
     
     if filename:
         # Save to file
-        img.save(filename)
+        with open(filename, 'wb') as f:
+            f.write(image)
         return filename
     else:
         # Return as base64 string
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+        img_str = base64.b64encode(image).decode()
         return f"data:image/png;base64,{img_str}"
 
+def render_qr_code(qr_data, fmt='png'):
+    """Render QR code data to PNG or SVG bytes"""
+    qr = _make_qr(qr_data)
+    buffer = BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def _render_to_storage(job):
+    """Render one QR code straight into the cache (runs in a pool worker)"""
+    qr_data, fmt, path = job
+    write_atomic(path, render_qr_code(qr_data, fmt))
+    return path
+
+def render_workers():
+    """Number of processes used for large render batches"""
+    return int(os.environ.get('QR_RENDER_WORKERS', '0')) or os.cpu_count() or 1
+
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn, not fork: the web server process is multi-threaded
+            _render_pool = ProcessPoolExecutor(
+                max_workers=render_workers(), mp_context=multiprocessing.get_context('spawn'))
+        return _render_pool
+
+def qr_image_key(qr_data, fmt='png'):
+    """Content hash of a payload's image; also its HTTP ETag"""
+    return QRImageCache.key(qr_data, fmt, QR_RENDER_OPTIONS)
+
+def qr_image_path(qr_data, fmt='png'):
+    """Cache-relative path of a payload's image, whether it is rendered yet or not"""
+    return qr_image_cache.relative_path(qr_image_key(qr_data, fmt), fmt)
+
+def render_qr_codes(payloads, fmt='png', executor=None):
+    """Make sure every payload has a cached image and return their paths.
+
+    Paths are relative to QR_STORAGE_DIR and in the order given; identical
+    payloads share one image. Only cache misses are rendered, on the
+    process pool for large batches, and each worker writes its image
+    straight into the cache so image bytes never travel back to the
+    caller. ``executor`` replaces the shared process pool.
+    """
+    paths = [qr_image_path(qr_data, fmt) for qr_data in payloads]
+    missing = {}
+    for qr_data, path in zip(payloads, paths):
+        if path not in missing and not qr_image_cache.lookup(path):
+            missing[path] = qr_data
+    jobs = [(qr_data, fmt, qr_image_cache.path(path)) for path, qr_data in missing.items()]
+
+    if executor is None and len(jobs) < QR_POOL_THRESHOLD:
+        for job in jobs:
+            _render_to_storage(job)
+    elif jobs:
+        # A few chunks per worker keeps IPC low and the workers evenly loaded
+        chunksize = max(1, min(64, len(jobs) // (render_workers() * 4)))
+        list((executor or _get_render_pool()).map(_render_to_storage, jobs, chunksize=chunksize))
+
+    if jobs:
+        qr_image_cache.stored(len(jobs))
+    logging.info(f"QR code images: {len(payloads) - len(jobs)} cached, {len(jobs)} rendered")
+    return paths
+
+def get_qr_code_image(qr_data, fmt='png'):
+    """Cache-relative path of a payload's image, rendering it on a miss"""
+    return render_qr_codes([qr_data], fmt)[0]
+
+def read_qr_code_image(qr_data, fmt='png'):
+    """Bytes of a payload's image, from the cache or rendered on a miss"""
+    try:
+        with open(qr_image_cache.path(get_qr_code_image(qr_data, fmt)), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        # Evicted by a background pass between the lookup and the read
+        return render_qr_code(qr_data, fmt)
+
 def decode_qr_code(qr_data):
-    """Decode QR code data"""
+    """Decode QR code data in either the compact or the JSON label format"""
+    if qr_data.startswith(COMPACT_PAYLOAD_VERSION + '/'):
+        fields = qr_data.split('/') + [''] * 7
+        try:
+            return {
+                'format': fields[0],
+                'grn_number': _compact_unescape(fields[1]),
+                'line_number': int(fields[2]),
+                'item_code': _compact_unescape(fields[3]),
+                'quantity': float(fields[4]),
+                'batch_number': _compact_unescape(fields[5]),
+                'expiry_date': datetime.strptime(fields[6], '%Y%m%d').date().isoformat()
+                if fields[6] else None
+            }
+        except ValueError:
+            return None
     try:
         return json.loads(qr_data)
     except json.JSONDecodeError:
         return None
 
-def print_qr_label(qr_codes, printer_name=None):
-    """Print QR code labels (mock implementation)"""
-    # In a real implementation, this would send the QR codes to a label printer
-    # For now, we'll just log the print request
-    import logging
+def print_qr_label(qr_codes, printer_name=None, wait=0):
+    """Print QR code labels as native ZPL on a networked label printer.
+
+    Jobs are queued on the label spooler and sent in the background; this
+    waits up to ``wait`` seconds for them to reach the printer. Returns
+    'printed', 'queued' (still waiting to be sent) or 'logged' when no
+    LABEL_PRINTERS are configured. Raises PrinterError if a job could not
+    be queued or sent.
+    """
+    from label_printing import PrinterError, configured_printers, print_labels
     
-    logging.info(f"Printing {len(qr_codes)} QR code labels to printer: {printer_name or 'default'}")
+    if not configured_printers():
+        logging.info(f"No label printers configured, logging {len(qr_codes)} QR code labels")
+        for qr_code in qr_codes:
+            qr_info = decode_qr_code(qr_code.qr_code_data)
+            if qr_info:
+                logging.info(f"Label: {qr_info['grn_number']} - {qr_info['item_code']} - Qty: {qr_info['quantity']}")
+        return 'logged'
     
-    for qr_code in qr_codes:
-        qr_info = decode_qr_code(qr_code.qr_code_data)
-        if qr_info:
-            logging.info(f"Label: {qr_info['grn_number']} - {qr_info['item_code']} - Qty: {qr_info['quantity']}")
+    try:
+        futures = print_labels(qr_codes, printer_name,
+                               timeout=float(os.environ.get('LABEL_SUBMIT_TIMEOUT', '10')))
+    except TimeoutError:
+        logging.error("Label printing failed: printer queue is full")
+        raise PrinterError("The printer queue is full, try again shortly")
     
-    return True
+    done, pending = futures_wait(futures, timeout=wait)
+    for future in done:
+        if future.exception():
+            raise future.exception()
+    return 'queued' if pending else 'printed'
 
 def split_quantity(total_quantity, split_method='equal', split_count=2):
     """Split quantity into multiple parts"""
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Daily GRPO rollups for reports, refreshed incrementally from a watermark
+
+``grpo_daily_rollups`` holds one row per receipt day, branch, supplier and
+status with the GRPO count, line count, value and QC outcomes.
+``grpo_monthly_rollups`` sums those rows per month. Each refresh finds the
+receipt days of GRPOs updated since the last run and recomputes those days
+and their months whole. A day is deleted and re-aggregated in one
+transaction, so GRPOs that moved status are counted once. Reports bucket
+the rollups by day, week, month, quarter or year. They read the monthly
+rows whenever the date range allows. They use only portable
+SQL (EXTRACT and plain GROUP BY), so the same code runs on MySQL,
+PostgreSQL and SQLite.
+
+Deleted GRPOs and edited receipt dates are only picked up by a full
+rebuild:
+
+    python report_rollups.py [--full]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Date, case, delete, extract, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import (GRPO, GRPODailyRollup, GRPOLine, GRPOMonthlyRollup, GRPOStatus, PurchaseOrder,
+                    QCApproval, SyncWatermark)
+
+REPORT_ROLLUP_REFRESH_SECONDS = float(os.environ.get('REPORT_ROLLUP_REFRESH_SECONDS', '300'))
+# Re-read this much before the watermark, for transactions that committed late
+REPORT_ROLLUP_OVERLAP_SECONDS = int(os.environ.get('REPORT_ROLLUP_OVERLAP_SECONDS', '600'))
+# Receipt days recomputed per statement
+REPORT_ROLLUP_DAYS_PER_CHUNK = 100
+
+WATERMARK_ENTITY = 'grpo_daily_rollups'
+BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+DIMENSIONS = {'branch': 'branch_id', 'supplier': 'supplier_code', 'status': 'status'}
+MEASURES = ('grpo_count', 'line_count', 'total_amount', 'qc_approved', 'qc_rejected')
+
+
+def _lock_watermark(connection):
+    """Lock this job's watermark row so refreshes from several workers queue up"""
+    table = SyncWatermark.__table__
+    row = (table.c.entity == WATERMARK_ENTITY) & (table.c.branch_id == '')
+    watermark = connection.execute(select(table.c.last_updated_at).where(row).with_for_update()).first()
+    if watermark is None:
+        try:
+            with db.engine.begin() as other:
+                other.execute(insert(table).values(entity=WATERMARK_ENTITY, branch_id='',
+                                                   updated_at=datetime.utcnow()))
+        except IntegrityError:
+            pass  # Another worker created it first
+        watermark = connection.execute(select(table.c.last_updated_at).where(row).with_for_update()).first()
+    return watermark[0]
+
+
+def _rebuild_days(connection, days):
+    """Replace the rollup rows of ``days`` with a fresh aggregate of their GRPOs"""
+    in_days = GRPO.receipt_date.in_(days)
+    lines = (select(GRPOLine.grpo_id, func.count().label('line_count'))
+             .join(GRPO, GRPO.id == GRPOLine.grpo_id).where(in_days)
+             .group_by(GRPOLine.grpo_id).subquery())
+    qc = (select(QCApproval.grpo_id,
+                 func.max(case((QCApproval.approval_status == 'approved', 1), else_=0)).label('approved'),
+                 func.max(case((QCApproval.approval_status == 'rejected', 1), else_=0)).label('rejected'))
+          .join(GRPO, GRPO.id == QCApproval.grpo_id).where(in_days)
+          .group_by(QCApproval.grpo_id).subquery())
+    dimensions = (GRPO.receipt_date, PurchaseOrder.branch_id, PurchaseOrder.supplier_code, GRPO.status)
+    aggregate = (select(*dimensions, func.count(GRPO.id),
+                        func.coalesce(func.sum(lines.c.line_count), 0),
+                        func.coalesce(func.sum(GRPO.total_amount), 0),
+                        func.coalesce(func.sum(qc.c.approved), 0),
+                        func.coalesce(func.sum(qc.c.rejected), 0))
+                 .join(PurchaseOrder, PurchaseOrder.id == GRPO.po_id)
+                 .outerjoin(lines, lines.c.grpo_id == GRPO.id)
+                 .outerjoin(qc, qc.c.grpo_id == GRPO.id)
+                 .where(in_days).group_by(*dimensions))
+
+    table = GRPODailyRollup.__table__
+    connection.execute(delete(table).where(table.c.day.in_(days)))
+    connection.execute(insert(table).from_select(
+        ['day', 'branch_id', 'supplier_code', 'status', *MEASURES], aggregate))
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def _rebuild_months(connection, months):
+    """Replace the monthly rows of ``months`` with sums of their daily rows"""
+    daily = GRPODailyRollup.__table__
+    table = GRPOMonthlyRollup.__table__
+    dimensions = (daily.c.branch_id, daily.c.supplier_code, daily.c.status)
+    for month in months:
+        connection.execute(delete(table).where(table.c.month == month))
+        connection.execute(insert(table).from_select(
+            ['month', 'branch_id', 'supplier_code', 'status', *MEASURES],
+            select(literal(month, Date), *dimensions, *[func.sum(daily.c[name]) for name in MEASURES])
+            .where(daily.c.day >= month, daily.c.day < _next_month(month))
+            .group_by(*dimensions)))
+
+
+def refresh(full=False):
+    """Bring the rollups up to date; returns how many days were recomputed"""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    table = GRPODailyRollup.__table__
+    with db.engine.begin() as connection:
+        since = _lock_watermark(connection)
+        if full or since is None:
+            connection.execute(delete(table))
+            connection.execute(delete(GRPOMonthlyRollup.__table__))
+            touched = select(GRPO.receipt_date).distinct()
+        else:
+            cutoff = since - timedelta(seconds=REPORT_ROLLUP_OVERLAP_SECONDS)
+            touched = select(GRPO.receipt_date).where(GRPO.updated_at >= cutoff).distinct()
+        days = sorted(connection.execute(touched).scalars())
+        for offset in range(0, len(days), REPORT_ROLLUP_DAYS_PER_CHUNK):
+            _rebuild_days(connection, days[offset:offset + REPORT_ROLLUP_DAYS_PER_CHUNK])
+        _rebuild_months(connection, sorted({day.replace(day=1) for day in days}))
+
+        watermarks = SyncWatermark.__table__
+        connection.execute(update(watermarks).where(
+            (watermarks.c.entity == WATERMARK_ENTITY) & (watermarks.c.branch_id == '')).values(
+                last_updated_at=now, updated_at=now))
+
+    seconds = time.perf_counter() - started
+    if days:
+        logging.info(f"Report rollups: recomputed {len(days)} days in {seconds:.2f}s")
+    return {'days': len(days), 'full': bool(full or since is None), 'seconds': seconds}
+
+
+def last_refreshed():
+    watermark = SyncWatermark.query.filter_by(entity=WATERMARK_ENTITY, branch_id='').first()
+    return watermark.last_updated_at if watermark else None
+
+
+def _period(bucket, values):
+    if bucket == 'day':
+        return values[0].isoformat()
+    if bucket == 'week':
+        year, week, _ = values[0].isocalendar()
+        return f"{year}-W{week:02d}"
+    year = int(values[0])
+    if bucket == 'year':
+        return f"{year}"
+    month = int(values[1])
+    if bucket == 'quarter':
+        return f"{year}-Q{(month - 1) // 3 + 1}"
+    return f"{year}-{month:02d}"
+
+
+def report(bucket='month', by=(), start=None, end=None, branch_id=None, supplier_code=None, status=None):
+    """Aggregate the rollups into periods and dimensions.
+
+    ``bucket`` is one of BUCKETS or None for one row per dimension
+    combination; ``by`` names DIMENSIONS to split on. Returns dicts with
+    ``period`` (when bucketed), the dimensions and MEASURES, sorted.
+    """
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket {bucket}, expected one of {', '.join(BUCKETS)}")
+    unknown = [name for name in by if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension {', '.join(unknown)}, expected {', '.join(DIMENSIONS)}")
+
+    # Ranges of whole months can be read from the monthly rows, about 30 times fewer
+    whole_months = ((not start or start.day == 1)
+                    and (not end or end + timedelta(days=1) == _next_month(end.replace(day=1))))
+    if bucket not in ('day', 'week') and whole_months:
+        rollup, day = GRPOMonthlyRollup, GRPOMonthlyRollup.month
+    else:
+        rollup, day = GRPODailyRollup, GRPODailyRollup.day
+    if bucket in ('day', 'week'):
+        periods = [day]
+    elif bucket in ('month', 'quarter'):
+        periods = [extract('year', day), extract('month', day)]
+    elif bucket == 'year':
+        periods = [extract('year', day)]
+    else:
+        periods = []
+    dimensions = [getattr(rollup, DIMENSIONS[name]) for name in by]
+
+    query = select(*periods, *dimensions, *[func.sum(getattr(rollup, name)) for name in MEASURES])
+    if start:
+        query = query.where(day >= start)
+    if end:
+        query = query.where(day <= end)
+    if branch_id:
+        query = query.where(rollup.branch_id == branch_id)
+    if supplier_code:
+        query = query.where(rollup.supplier_code == supplier_code)
+    if status:
+        query = query.where(rollup.status == status)
+    if periods or dimensions:
+        query = query.group_by(*periods, *dimensions)
+
+    # Weeks and quarters are folded here, the database only groups by day or month
+    results = {}
+    for row in db.session.execute(query):
+        row = tuple(row)
+        key = tuple(value.value if isinstance(value, GRPOStatus) else value
+                    for value in row[len(periods):len(periods) + len(dimensions)])
+        if periods:
+            key = (_period(bucket, row[:len(periods)]),) + key
+        totals = results.setdefault(key, dict.fromkeys(MEASURES, 0))
+        for name, value in zip(MEASURES, row[len(periods) + len(dimensions):]):
+            totals[name] += value or 0
+
+    rows = []
+    for key in sorted(results, key=lambda k: tuple('' if v is None else str(v) for v in k)):
+        names = (['period'] if periods else []) + list(by)
+        row = dict(zip(names, key))
+        row.update({name: int(value) for name, value in results[key].items() if name != 'total_amount'})
+        row['total_amount'] = float(results[key]['total_amount'])
+        rows.append(row)
+    return rows
+
+
+def start(app):
+    """Refresh now and then every REPORT_ROLLUP_REFRESH_SECONDS"""
+    def run():
+        with app.app_context():
+            while True:
+                try:
+                    refresh()
+                except Exception as e:
+                    logging.error(f"Report rollup refresh failed: {e}")
+                finally:
+                    db.session.remove()
+                time.sleep(REPORT_ROLLUP_REFRESH_SECONDS)
+
+    threading.Thread(target=run, name='report-rollups', daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--full', action='store_true', help='rebuild every day from scratch')
+    parser.add_argument('--bucket', choices=BUCKETS, default='month', help='print a report in these periods')
+    args = parser.parse_args()
+
+    from app import app
+    logging.getLogger().setLevel(logging.INFO)
+    with app.app_context():
+        stats = refresh(full=args.full)
+        print(f"Recomputed {stats['days']} days in {stats['seconds']:.2f}s")
+        for row in report(args.bucket):
+            print(f"{row['period']:<12}{row['grpo_count']:>8} GRPOs{row['line_count']:>9} lines"
+                  f"{row['total_amount']:>16,.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,19 @@
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
-from datetime import datetime, date
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, Response, stream_with_context
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation
 from app import app, db
-from models import User, PurchaseOrder, PurchaseOrderLine, GRPO, GRPOLine, QCApproval, QRCode, UserRole, GRPOStatus
+from models import User, PurchaseOrder, PurchaseOrderLine, GRPO, GRPOLine, QCApproval, QRCode, UserRole, GRPOStatus, SAPOutbox
 from auth import login_required, admin_required, get_current_user
-from sap_integration import SAPIntegration
-from qr_generator import generate_qr_code, generate_grn_number
+from qr_generator import generate_qr_code, generate_grn_number, render_qr_codes, qr_image_cache, print_qr_label, qr_image_key, read_qr_code_image
+import sap_master_data
+import scan_index
+import gs1
+import grpo_queries
+import dashboard_counters
+import report_rollups
+from label_sheets import LABEL_SHEET_LAYOUT, PAGE_SIZES, iter_chunks, parse_layout, stream_label_sheet
+from sap_worker import get_health as get_sap_health, open_outbox_entry
+from label_printing import LABEL_CONFIRM_SECONDS, PrinterError, configured_printers, get_spooler
 import json
 import logging
 
@@ -47,13 +56,14 @@ def logout():
 def dashboard():
     user = get_current_user()
     
-    # Get dashboard statistics
-    total_grpos = GRPO.query.count()
-    pending_qc = GRPO.query.filter_by(status=GRPOStatus.PENDING_QC).count()
-    draft_grpos = GRPO.query.filter_by(status=GRPOStatus.DRAFT).count()
+    # Get dashboard statistics, maintained on write by dashboard_counters.py
+    counts = dashboard_counters.get_counts()
+    total_grpos = counts['total']
+    pending_qc = counts[GRPOStatus.PENDING_QC.value]
+    draft_grpos = counts[GRPOStatus.DRAFT.value]
     
     # Recent GRPOs
-    recent_grpos = GRPO.query.order_by(GRPO.created_at.desc()).limit(5).all()
+    recent_grpos = grpo_queries.recent_grpos()
     
     return render_template('dashboard.html', 
                          user=user,
@@ -66,19 +76,52 @@ def dashboard():
 @login_required
 def grpo_list():
     user = get_current_user()
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
     
-    query = GRPO.query
-    
-    if status_filter:
-        query = query.filter_by(status=GRPOStatus(status_filter))
-    
-    grpos = query.order_by(GRPO.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
-    
-    return render_template('grpo_list.html', grpos=grpos, user=user, status_filter=status_filter)
+    status = GRPOStatus(status_filter) if status_filter else None
+    try:
+        grpos = grpo_queries.grpo_page(request.args.get('cursor') or None, status)
+    except ValueError:
+        flash('That page link is no longer valid, showing the newest GRPOs', 'info')
+        return redirect(url_for('grpo_list', status=status_filter or None))
+    # From the dashboard counters: no COUNT(*) over grpos per page
+    approximate_total = dashboard_counters.get_counts()[status_filter or 'total']
+    
+    return render_template('grpo_list.html', grpos=grpos, user=user, status_filter=status_filter,
+                           approximate_total=approximate_total)
+
+@app.route('/api/grpos')
+@login_required
+def grpo_list_api():
+    """GRPOs newest first; pass back next_cursor or prev_cursor as ?cursor= to page"""
+    try:
+        status = GRPOStatus(request.args['status']) if request.args.get('status') else None
+        limit = request.args.get('limit', grpo_queries.GRPO_PAGE_SIZE, type=int)
+        if not 1 <= limit <= grpo_queries.GRPO_PAGE_MAX:
+            raise ValueError(f"limit must be between 1 and {grpo_queries.GRPO_PAGE_MAX}")
+        page = grpo_queries.grpo_page(request.args.get('cursor') or None, status, per_page=limit, profile='api')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = {
+        'grpos': [{
+            'id': grpo.id,
+            'grn_number': grpo.grn_number,
+            'po_number': grpo.purchase_order.po_number,
+            'supplier_code': grpo.purchase_order.supplier_code,
+            'supplier_name': grpo.purchase_order.supplier_name,
+            'branch_id': grpo.purchase_order.branch_id,
+            'receipt_date': grpo.receipt_date.isoformat() if grpo.receipt_date else None,
+            'status': grpo.status.value,
+            'total_amount': float(grpo.total_amount or 0),
+            'created_at': grpo.created_at.isoformat()
+        } for grpo in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
+    if request.args.get('total', '').lower() in ('1', 'true', 'yes'):
+        result['approximate_total'] = dashboard_counters.get_counts()[status.value if status else 'total']
+    return jsonify(result)
 
 @app.route('/grpos/new', methods=['GET', 'POST'])
 @login_required
@@ -101,7 +144,7 @@ def create_grpo():
             return redirect(url_for('create_grpo'))
         
         # Create GRPO
-        grn_number = generate_grn_number()
+        grn_number = generate_grn_number(po.branch_id)
         grpo = GRPO(
             grn_number=grn_number,
             po_id=po.id,
@@ -124,9 +167,10 @@ def create_grpo():
 @login_required
 def grpo_details(grpo_id):
     user = get_current_user()
-    grpo = GRPO.query.get_or_404(grpo_id)
+    grpo = grpo_queries.get_grpo_or_404(grpo_id)
     
-    return render_template('grpo_details.html', grpo=grpo, user=user)
+    return render_template('grpo_details.html', grpo=grpo, user=user,
+                           printer_errors=label_printer_errors())
 
 @app.route('/grpos/<int:grpo_id>/add_line', methods=['POST'])
 @login_required
@@ -139,12 +183,33 @@ def add_grpo_line(grpo_id):
         return redirect(url_for('grpo_details', grpo_id=grpo_id))
     
     po_line_id = request.form.get('po_line_id')
-    received_quantity = float(request.form.get('received_quantity', 0))
+    received_quantity = request.form.get('received_quantity')
     bin_location = request.form.get('bin_location')
     batch_number = request.form.get('batch_number')
     expiry_date = request.form.get('expiry_date')
     supplier_barcode = request.form.get('supplier_barcode')
     
+    # A scanned GS1 carton label fills whatever was not keyed in
+    if supplier_barcode and gs1.is_gs1(supplier_barcode):
+        try:
+            carton = gs1.parse(supplier_barcode)
+        except gs1.GS1ParseError as e:
+            # Keep the line with the keyed fields and the barcode as scanned
+            flash(f'Supplier barcode could not be read, saved as scanned: {e}', 'warning')
+            carton = None
+        if carton:
+            batch_number = batch_number or carton['batch_number']
+            if not expiry_date and carton['expiry_date']:
+                expiry_date = carton['expiry_date']
+                if date.fromisoformat(expiry_date) < date.today():
+                    flash(f'The carton label shows an expiry date of {expiry_date}, which has already passed', 'warning')
+            received_quantity = received_quantity or carton['quantity']
+            supplier_barcode = carton['gtin'] or supplier_barcode
+    
+    try:
+        received_quantity = Decimal(str(received_quantity or 0))
+    except InvalidOperation:
+        received_quantity = Decimal(0)
     po_line = PurchaseOrderLine.query.get_or_404(po_line_id)
     
     # Check if quantity is valid
@@ -196,33 +261,41 @@ def submit_grpo_for_qc(grpo_id):
         flash('Cannot submit GRPO without any lines', 'error')
         return redirect(url_for('grpo_details', grpo_id=grpo_id))
     
+    # Catch what SAP would reject before QC spends time on it
+    problems = sap_master_data.validate_grpo(grpo)
+    if problems:
+        for problem in problems:
+            flash(problem, 'error')
+        return redirect(url_for('grpo_details', grpo_id=grpo_id))
+    
     # Generate QR codes for received items
+    qr_codes = []
     for line in grpo.grpo_lines:
         # Check if quantity should be split
-        split_quantities = request.form.getlist(f'split_qty_{line.id}')
+        split_quantities = [float(qty) for qty in request.form.getlist(f'split_qty_{line.id}')]
         if split_quantities:
-            for qty in split_quantities:
-                if float(qty) > 0:
-                    qr_data = generate_qr_code(grpo, line, float(qty))
-                    qr_code = QRCode(
-                        grpo_id=grpo.id,
-                        qr_code_data=qr_data,
-                        item_code=line.po_line.item_code,
-                        quantity=float(qty),
-                        batch_number=line.batch_number
-                    )
-                    db.session.add(qr_code)
+            quantities = [qty for qty in split_quantities if qty > 0]
         else:
             # Single QR code for the entire quantity
-            qr_data = generate_qr_code(grpo, line, line.received_quantity)
+            quantities = [line.received_quantity]
+        for qty in quantities:
             qr_code = QRCode(
                 grpo_id=grpo.id,
-                qr_code_data=qr_data,
+                qr_code_data=generate_qr_code(grpo, line, qty),
                 item_code=line.po_line.item_code,
-                quantity=line.received_quantity,
+                quantity=qty,
                 batch_number=line.batch_number
             )
             db.session.add(qr_code)
+            qr_codes.append(qr_code)
+    
+    # Render the label images in one parallel batch; reprints reuse the cached files
+    try:
+        paths = render_qr_codes([qr.qr_code_data for qr in qr_codes])
+        for qr_code, path in zip(qr_codes, paths):
+            qr_code.qr_code_image_path = path
+    except Exception as e:
+        logging.error(f"QR code rendering for GRPO {grpo.grn_number} failed: {e}")
     
     grpo.status = GRPOStatus.PENDING_QC
     db.session.commit()
@@ -230,6 +303,82 @@ def submit_grpo_for_qc(grpo_id):
     flash('GRPO submitted for Quality Control approval', 'success')
     return redirect(url_for('grpo_details', grpo_id=grpo_id))
 
+@app.route('/grpos/<int:grpo_id>/print_labels', methods=['POST'])
+@login_required
+def print_grpo_labels(grpo_id):
+    user = get_current_user()
+    grpo = GRPO.query.get_or_404(grpo_id)
+    
+    if not user.has_permission('grpo_edit'):
+        flash('You do not have permission to print GRPO labels', 'error')
+        return redirect(url_for('grpo_details', grpo_id=grpo_id))
+    
+    # One label when a QR code is given, otherwise every label of the GRPO
+    qr_id = request.form.get('qr_id', type=int)
+    qr_codes = [qr for qr in grpo.qr_codes if qr_id is None or qr.id == qr_id]
+    if not qr_codes:
+        flash('No QR code labels to print', 'error')
+        return redirect(url_for('grpo_details', grpo_id=grpo_id))
+    
+    try:
+        status = print_qr_label(qr_codes, request.form.get('printer') or None,
+                                wait=LABEL_CONFIRM_SECONDS)
+    except PrinterError as e:
+        flash(f'Labels could not be printed: {e}', 'error')
+    else:
+        if status == 'queued':
+            flash(f'{len(qr_codes)} label(s) queued; the printer has not taken them yet', 'info')
+        else:
+            flash(f'{len(qr_codes)} label(s) sent to the printer', 'success')
+    return redirect(url_for('grpo_details', grpo_id=grpo_id))
+
+@app.route('/labels/sheet.pdf')
+@login_required
+def label_sheet_pdf():
+    """Stream the labels of a GRPO (?grpo_id=) or of a day's receipts (?date=) as a PDF sheet"""
+    grpo_id = request.args.get('grpo_id', type=int)
+    day = request.args.get('date')
+    page_size = request.args.get('page_size', 'A4')
+    layout = request.args.get('layout') or LABEL_SHEET_LAYOUT
+    
+    # Plain columns instead of ORM objects keep each chunk small
+    query = db.session.query(QRCode.id, QRCode.qr_code_data, QRCode.item_code,
+                             QRCode.quantity, QRCode.batch_number)
+    if grpo_id:
+        grpo = GRPO.query.get_or_404(grpo_id)
+        query = query.filter(QRCode.grpo_id == grpo_id)
+        filename = f"labels-{grpo.grn_number or grpo_id}.pdf"
+        back = url_for('grpo_details', grpo_id=grpo_id)
+    elif day:
+        try:
+            start = datetime.strptime(day, '%Y-%m-%d')
+        except ValueError:
+            flash('Invalid date, expected YYYY-MM-DD', 'error')
+            return redirect(url_for('grpo_list'))
+        query = query.filter(QRCode.created_at >= start,
+                             QRCode.created_at < start + timedelta(days=1))
+        filename = f"labels-{day}.pdf"
+        back = url_for('grpo_list')
+    else:
+        flash('Choose a GRPO or a date to reprint labels for', 'error')
+        return redirect(url_for('grpo_list'))
+    
+    try:
+        if page_size not in PAGE_SIZES:
+            raise ValueError(f"Unsupported page size {page_size}")
+        parse_layout(layout)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(back)
+    if query.first() is None:
+        flash('No QR code labels to reprint', 'error')
+        return redirect(back)
+    
+    sheet = stream_label_sheet(iter_chunks(query, QRCode.id), page_size, layout)
+    return Response(stream_with_context(sheet), mimetype='application/pdf',
+                    headers={'Content-Disposition': f'inline; filename="{filename}"',
+                             'X-Accel-Buffering': 'no'})
+
 @app.route('/qc/pending')
 @login_required
 def qc_pending():
@@ -239,20 +388,29 @@ def qc_pending():
         flash('You do not have permission to access QC approvals', 'error')
         return redirect(url_for('dashboard'))
     
-    pending_grpos = GRPO.query.filter_by(status=GRPOStatus.PENDING_QC).all()
+    pending_grpos = grpo_queries.pending_qc_grpos()
+    pending_total = len(pending_grpos)
+    if pending_total >= grpo_queries.QC_PENDING_LIMIT:
+        pending_total = GRPO.query.filter_by(status=GRPOStatus.PENDING_QC).count()
     
-    return render_template('qc_approval.html', grpos=pending_grpos, user=user)
+    return render_template('qc_approval.html', grpos=pending_grpos, user=user, pending_total=pending_total)
 
 @app.route('/qc/approve/<int:grpo_id>', methods=['POST'])
 @login_required
 def approve_grpo(grpo_id):
     user = get_current_user()
-    grpo = GRPO.query.get_or_404(grpo_id)
     
     if not user.has_permission('qc_approve'):
         flash('You do not have permission to approve GRPOs', 'error')
         return redirect(url_for('qc_pending'))
     
+    # Locked so a double submit waits here and then sees the first decision
+    grpo = GRPO.query.filter_by(id=grpo_id).with_for_update().first_or_404()
+    if grpo.status != GRPOStatus.PENDING_QC:
+        db.session.rollback()
+        flash(f'GRPO {grpo.grn_number} is not awaiting QC', 'error')
+        return redirect(url_for('qc_pending'))
+    
     approval_status = request.form.get('approval_status')
     qc_notes = request.form.get('qc_notes')
     
@@ -269,20 +427,10 @@ def approve_grpo(grpo_id):
     if approval_status == 'approved':
         grpo.status = GRPOStatus.QC_APPROVED
         
-        # Post to SAP B1
-        try:
-            sap = SAPIntegration()
-            sap_doc_entry = sap.post_grpo_to_sap(grpo)
-            
-            if sap_doc_entry:
-                grpo.sap_doc_entry = sap_doc_entry
-                grpo.status = GRPOStatus.POSTED_TO_SAP
-                flash('GRPO approved and posted to SAP B1 successfully', 'success')
-            else:
-                flash('GRPO approved but failed to post to SAP B1', 'warning')
-        except Exception as e:
-            logging.error(f"SAP posting error: {e}")
-            flash('GRPO approved but SAP posting failed', 'warning')
+        # Queue the SAP B1 posting; sap_worker.py picks it up from the outbox
+        if open_outbox_entry(grpo.id) is None:
+            db.session.add(SAPOutbox(grpo_id=grpo.id))
+        flash('GRPO approved and queued for posting to SAP B1', 'success')
     else:
         grpo.status = GRPOStatus.QC_REJECTED
         flash('GRPO rejected', 'info')
@@ -291,6 +439,62 @@ def approve_grpo(grpo_id):
     
     return redirect(url_for('qc_pending'))
 
+@app.route('/sap/outbox')
+@login_required
+def sap_outbox():
+    user = get_current_user()
+    
+    if not user.has_permission('grpo_view'):
+        flash('You do not have permission to view the SAP posting queue', 'error')
+        return redirect(url_for('dashboard'))
+    
+    status_counts = dict(db.session.query(
+        SAPOutbox.status, db.func.count(SAPOutbox.id)
+    ).group_by(SAPOutbox.status).all())
+    
+    entries = SAPOutbox.query.filter(
+        SAPOutbox.status.in_(['pending', 'processing', 'failed'])
+    ).order_by(SAPOutbox.created_at).limit(200).all()
+    
+    return render_template('sap_outbox.html',
+                         user=user,
+                         entries=entries,
+                         status_counts=status_counts,
+                         sap_health=get_sap_health())
+
+@app.route('/api/sap/health')
+@login_required
+def sap_health():
+    """Circuit breaker and limiter state of each SAP worker, as last published"""
+    return jsonify(get_sap_health())
+
+@app.route('/sap/outbox/<int:entry_id>/retry', methods=['POST'])
+@login_required
+def retry_sap_outbox(entry_id):
+    user = get_current_user()
+    entry = SAPOutbox.query.get_or_404(entry_id)
+    
+    if not user.has_permission('qc_approve'):
+        flash('You do not have permission to retry SAP postings', 'error')
+        return redirect(url_for('sap_outbox'))
+    
+    if entry.status != 'failed':
+        flash('Only failed postings can be retried', 'error')
+        return redirect(url_for('sap_outbox'))
+    
+    if open_outbox_entry(entry.grpo_id) is not None:
+        flash(f'GRPO {entry.grpo.grn_number} is already queued for posting', 'error')
+        return redirect(url_for('sap_outbox'))
+    
+    entry.status = 'pending'
+    entry.attempts = 0
+    entry.next_attempt_at = datetime.utcnow()
+    entry.grpo.status = GRPOStatus.QC_APPROVED
+    db.session.commit()
+    
+    flash(f'GRPO {entry.grpo.grn_number} queued for posting to SAP B1 again', 'success')
+    return redirect(url_for('sap_outbox'))
+
 @app.route('/users')
 @admin_required
 def user_management():
@@ -343,20 +547,74 @@ def reports():
         flash('You do not have permission to view reports', 'error')
         return redirect(url_for('dashboard'))
     
-    # Generate report data
-    grpo_by_status = db.session.query(
-        GRPO.status, db.func.count(GRPO.id)
-    ).group_by(GRPO.status).all()
-    
-    monthly_grpos = db.session.query(
-        db.func.date_format(GRPO.created_at, '%Y-%m').label('month'),
-        db.func.count(GRPO.id).label('count')
-    ).group_by(db.func.date_format(GRPO.created_at, '%Y-%m')).all()
+    try:
+        filters = _report_filters(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('reports'))
+    
+    # Read from the daily rollups kept by report_rollups.py, not the grpos table
+    grpo_by_status = [(GRPOStatus(row['status']), row['grpo_count'])
+                      for row in report_rollups.report(None, by=('status',), **filters)]
+    monthly_grpos = [(row['period'], row['grpo_count'])
+                     for row in report_rollups.report('month', **filters)]
+    
+    suppliers = report_rollups.report(None, by=('supplier',), **filters)
+    top_suppliers = sorted(suppliers, key=lambda row: row['grpo_count'], reverse=True)[:5]
+    supplier_names = dict(db.session.query(PurchaseOrder.supplier_code, PurchaseOrder.supplier_name)
+                          .filter(PurchaseOrder.supplier_code.in_([row['supplier'] for row in top_suppliers]))
+                          .distinct().all())
+    
+    decided = sum(row['qc_approved'] + row['qc_rejected'] for row in suppliers)
+    qc_rates = {
+        'approved': round(100 * sum(row['qc_approved'] for row in suppliers) / decided, 1) if decided else None,
+        'rejected': round(100 * sum(row['qc_rejected'] for row in suppliers) / decided, 1) if decided else None
+    }
     
     return render_template('reports.html', 
                          user=user,
                          grpo_by_status=grpo_by_status,
-                         monthly_grpos=monthly_grpos)
+                         monthly_grpos=monthly_grpos,
+                         top_suppliers=top_suppliers,
+                         supplier_names=supplier_names,
+                         qc_rates=qc_rates,
+                         refreshed_at=report_rollups.last_refreshed())
+
+def _report_filters(args):
+    """Report filters from the query string; raises ValueError on a bad date"""
+    filters = {}
+    for arg, name in (('start_date', 'start'), ('end_date', 'end')):
+        if args.get(arg):
+            try:
+                filters[name] = datetime.strptime(args[arg], '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError(f"Invalid {arg.replace('_', ' ')}, expected YYYY-MM-DD")
+    branch = args.get('branch_filter') or args.get('branch')
+    if branch:
+        filters['branch_id'] = branch
+    if args.get('supplier'):
+        filters['supplier_code'] = args['supplier']
+    if args.get('status'):
+        filters['status'] = GRPOStatus(args['status'])
+    return filters
+
+@app.route('/api/reports/grpos')
+@login_required
+def grpo_report_api():
+    """GRPO rollups by period and dimension, e.g. ?bucket=week&by=branch,status"""
+    if not get_current_user().has_permission('reports'):
+        return jsonify({'error': 'You do not have permission to view reports'}), 403
+    
+    bucket = request.args.get('bucket', 'month')
+    by = tuple(name for name in request.args.get('by', '').split(',') if name)
+    try:
+        rows = report_rollups.report(None if bucket == 'none' else bucket, by=by,
+                                     **_report_filters(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    refreshed_at = report_rollups.last_refreshed()
+    return jsonify({'refreshed_at': refreshed_at.isoformat() if refreshed_at else None, 'rows': rows})
 
 # API endpoints for barcode scanning
 @app.route('/api/scan_po', methods=['POST'])
@@ -376,6 +634,7 @@ def scan_po():
     }
     
     for line in po.po_lines:
+        item = sap_master_data.get_item(line.item_code)
         po_data['lines'].append({
             'id': line.id,
             'item_code': line.item_code,
@@ -384,26 +643,119 @@ def scan_po():
             'received_quantity': float(line.received_quantity),
             'open_quantity': float(line.open_quantity),
             'unit_of_measure': line.unit_of_measure,
-            'unit_price': float(line.unit_price)
+            'unit_price': float(line.unit_price),
+            'manage_batch': item['manage_batch'] if item else None
         })
     
     return jsonify(po_data)
 
+@app.route('/api/master_data/<entity>/<path:code>')
+@login_required
+def master_data_lookup(entity, code):
+    if entity not in sap_master_data.ENTITIES:
+        return jsonify({'error': 'Unknown master data type'}), 404
+    
+    record = sap_master_data.lookup(entity, code)
+    if not record:
+        return jsonify({'error': f'{code} not found in SAP master data'}), 404
+    
+    return jsonify({key: value.isoformat() if isinstance(value, datetime) else value
+                    for key, value in record.items()})
+
+@app.route('/api/sap/master_data')
+@login_required
+def master_data_status():
+    return jsonify({'cache': sap_master_data.cache.metrics(),
+                    'collections': sap_master_data.freshness(with_rows=True)})
+
+QR_IMAGE_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+@app.template_global()
+def qr_image_url(qr_code, fmt='png'):
+    """Versioned image URL for a QRCode row; the version changes with its content"""
+    return url_for('qr_image', qr_id=qr_code.id, fmt=fmt,
+                   v=qr_image_key(qr_code.qr_code_data, fmt)[:16])
+
+@app.route('/qr/<int:qr_id>.<any(png, svg):fmt>')
+@login_required
+def qr_image(qr_id, fmt):
+    qr_code = QRCode.query.get_or_404(qr_id)
+    etag = qr_image_key(qr_code.qr_code_data, fmt)
+    
+    def cache_headers(response):
+        response.set_etag(etag)
+        if request.args.get('v') == etag[:16]:
+            # Versioned URL: the image behind it can never change
+            response.cache_control.no_cache = None
+            response.cache_control.private = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+    
+    if request.if_none_match.contains(etag):
+        return cache_headers(Response(status=304))
+    
+    # Rendered on first request, then served from the image cache
+    image = read_qr_code_image(qr_code.qr_code_data, fmt)
+    return cache_headers(Response(image, mimetype=QR_IMAGE_MIMETYPES[fmt]))
+
+@app.route('/api/qr_cache')
+@login_required
+def qr_cache_status():
+    return jsonify(qr_image_cache.metrics())
+
+@app.route('/api/label_printers')
+@login_required
+def label_printer_status():
+    return jsonify(get_spooler().metrics() if configured_printers() else {})
+
+def label_printer_errors():
+    """Last delivery error of each printer that had one in this process"""
+    if not configured_printers():
+        return {}
+    return {name: stats for name, stats in get_spooler().metrics().items() if stats['last_error']}
+
 @app.route('/api/scan_barcode', methods=['POST'])
 @login_required
 def scan_barcode():
-    barcode = request.json.get('barcode')
-    
-    # Mock barcode scanning - in real implementation, this would decode the barcode
-    # and return item details, batch number, expiry date, etc.
-    mock_data = {
-        'item_code': 'ITEM001',
-        'batch_number': 'B001-2024',
-        'expiry_date': '2025-12-31',
-        'supplier_barcode': barcode
-    }
+    barcode = (request.json or {}).get('barcode') or ''
+    
+    # Resolved from the in-memory scan index, without a database round trip
+    result = scan_index.resolve(barcode)
+    if result is None:
+        return jsonify({'error': f'Barcode {barcode} not recognized',
+                        'suggestions': scan_index.get_index().suggest(barcode)}), 404
     
-    return jsonify(mock_data)
+    return jsonify(result)
+
+@app.route('/api/gs1/parse', methods=['POST'])
+@login_required
+def gs1_parse():
+    """Parse a batch of GS1 barcodes, e.g. a pallet's worth of carton scans"""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Send a JSON object with a barcodes list'}), 400
+    barcodes = body.get('barcodes') or []
+    if not isinstance(barcodes, list) or len(barcodes) > 1000:
+        return jsonify({'error': 'Send up to 1000 barcodes as a list'}), 400
+    
+    separator = body.get('separator')
+    if separator is not None and not (isinstance(separator, str) and len(separator) == 1):
+        return jsonify({'error': 'separator must be a single character'}), 400
+    results = []
+    for barcode in barcodes:
+        try:
+            results.append({'barcode': barcode, 'fields': gs1.parse(str(barcode), separator)})
+        except gs1.GS1ParseError as e:
+            results.append({'barcode': barcode, 'error': str(e)})
+    return jsonify({'results': results})
+
+@app.route('/api/scan_index')
+@login_required
+def scan_index_status():
+    return jsonify(scan_index.get_index().metrics())
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,151 @@
+import json
+import uuid
+from email.parser import HeaderParser
+
+
+class BatchPart:
+    """One operation's response inside a Service Layer $batch reply"""
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 300
+
+
+def _http_part(method, path, payload, content_id=None):
+    lines = ['Content-Type: application/http',
+             'Content-Transfer-Encoding: binary']
+    if content_id is not None:
+        lines.append(f'Content-ID: {content_id}')
+    lines += ['', f'{method} {path}']
+    if payload is not None:
+        lines += ['Content-Type: application/json', '', json.dumps(payload)]
+    else:
+        lines.append('')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def build_batch_request(operations, use_changeset=False):
+    """Build a multipart/mixed $batch body.
+
+    ``operations`` is a list of ``(method, path, payload)`` tuples where path
+    is the absolute Service Layer path, e.g. ``/b1s/v1/PurchaseReceipts``.
+    With ``use_changeset`` the operations are wrapped in a single changeset,
+    which SAP applies atomically. Returns ``(content_type, body)``.
+    """
+    batch_boundary = f'batch_{uuid.uuid4().hex}'
+    parts = []
+
+    if use_changeset:
+        changeset_boundary = f'changeset_{uuid.uuid4().hex}'
+        changeset = ''.join(
+            f'--{changeset_boundary}\r\n' + _http_part(method, path, payload, index)
+            for index, (method, path, payload) in enumerate(operations, 1))
+        changeset += f'--{changeset_boundary}--\r\n'
+        parts.append(
+            f'Content-Type: multipart/mixed;boundary={changeset_boundary}\r\n\r\n'
+            + changeset)
+    else:
+        parts = [_http_part(method, path, payload)
+                 for method, path, payload in operations]
+
+    body = ''.join(f'--{batch_boundary}\r\n{part}' for part in parts)
+    body += f'--{batch_boundary}--\r\n'
+    return f'multipart/mixed;boundary={batch_boundary}', body.encode('utf-8')
+
+
+def _boundary(content_type):
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary':
+            return value.strip('"')
+    raise ValueError(f"No boundary in content type: {content_type}")
+
+
+def _split_multipart(body, boundary):
+    delimiter = f'--{boundary}'
+    sections = body.split(delimiter)
+    # sections[0] is the preamble; the last one starts with '--' (the close)
+    for section in sections[1:]:
+        if section.startswith('--'):
+            break
+        yield section.strip('\n')
+
+
+def _parse_http_response(text):
+    head, _, body = text.partition('\n\n')
+    status_line, _, header_text = head.partition('\n')
+    status_code = int(status_line.split()[1])
+    headers = dict(HeaderParser().parsestr(header_text).items())
+    return BatchPart(status_code, headers, body.strip())
+
+
+def parse_batch_response(content_type, body):
+    """Flatten a $batch reply into a list of BatchPart, in request order"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    body = body.replace('\r\n', '\n')
+
+    results = []
+    for section in _split_multipart(body, _boundary(content_type)):
+        mime_head, _, mime_body = section.partition('\n\n')
+        mime_headers = HeaderParser().parsestr(mime_head)
+        part_type = mime_headers.get('Content-Type', '')
+        if part_type.lower().startswith('multipart/mixed'):
+            results.extend(parse_batch_response(part_type, mime_body))
+        else:
+            results.append(_parse_http_response(mime_body))
+    return results
+
+
+class BatchOperation:
+    """One request inside a $batch body, as seen by the receiving side"""
+
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+def parse_batch_request(content_type, body):
+    """Parse a $batch body into a list of groups.
+
+    Each group is ``(is_changeset, [BatchOperation, ...])``; stand-alone
+    operations form a group of one. Used by the local Service Layer
+    simulator to answer the requests built above.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    body = body.replace('\r\n', '\n')
+
+    groups = []
+    for section in _split_multipart(body, _boundary(content_type)):
+        mime_head, _, mime_body = section.partition('\n\n')
+        part_type = HeaderParser().parsestr(mime_head).get('Content-Type', '')
+        if part_type.lower().startswith('multipart/mixed'):
+            operations = []
+            for inner in _split_multipart(mime_body, _boundary(part_type)):
+                operations.append(_parse_http_request(inner.partition('\n\n')[2]))
+            groups.append((True, operations))
+        else:
+            groups.append((False, [_parse_http_request(mime_body)]))
+    return groups
+
+
+def _parse_http_request(text):
+    head, _, body = text.partition('\n\n')
+    request_line, _, header_text = head.partition('\n')
+    method, path = request_line.split()[:2]
+    headers = dict(HeaderParser().parsestr(header_text).items())
+    return BatchOperation(method, path, headers, body.strip())
@@ -1,8 +1,40 @@
-import requests
-import json
 import logging
 import os
-from datetime import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+from time import perf_counter
+from urllib.parse import urlparse
+
+from sap_batch import build_batch_request, parse_batch_response
+from sap_resilience import SAPUnavailableError, get_guard
+from sap_session import SAPLoginError, get_session_pool
+
+# Purchase order fields mapped by sync_purchase_orders. The Service Layer
+# returns DocumentLines as a whole collection, so it cannot be narrowed further.
+PO_SELECT_FIELDS = [
+    'DocEntry', 'DocNum', 'CardCode', 'CardName', 'BPL_IDAssignedToInvoice',
+    'DocDate', 'DocDueDate', 'DocTotal', 'DocCurrency', 'DocumentStatus',
+    'Cancelled', 'UpdateDate', 'UpdateTime', 'DocumentLines'
+]
+
+# PurchaseReceipts field stamped with the WMS GRN number so a receipt can be
+# found again after its POST response was lost. NumAtCard (vendor reference)
+# exists in every company database; a user-defined field such as U_WMS_GRN
+# can be configured instead once it has been added to OPDN.
+GRPO_KEY_FIELD = os.environ.get('SAP_GRPO_KEY_FIELD', 'NumAtCard')
+
+PO_STATUS_MAP = {
+    'bost_Open': 'Open',
+    'bost_Close': 'Closed',
+    'bost_Paid': 'Closed',
+    'bost_Delivered': 'Closed'
+}
+
+
+class SAPRequestError(Exception):
+    """Raised when the Service Layer answers a request with an error status"""
 
 
 class SAPIntegration:
@@ -14,71 +46,147 @@ class SAPIntegration:
                                          'EINV-TESTDB-LIVE-HUST')
         self.username = os.environ.get('SAP_B1_USERNAME', 'manager')
         self.password = os.environ.get('SAP_B1_PASSWORD', '1422')
-        self.session_id = None
-        self.session_timeout = None
         # Development mode flag
         self.dev_mode = os.environ.get('WMS_DEV_MODE', 'true').lower() == 'true'
+        # Reason for the last failed call, recorded by the outbox worker
+        self.last_error = None
+        # Seconds to wait when the last call was refused by the circuit breaker
+        self.retry_after = None
+        self.connect_timeout = float(os.environ.get('SAP_B1_CONNECT_TIMEOUT', '5'))
+        # Page size for collection reads ($top / odata.maxpagesize)
+        self.page_size = int(os.environ.get('SAP_B1_PAGE_SIZE', '100'))
+        # Authenticated keep-alive sessions shared by every caller in the process
+        self.pool = get_session_pool(self.base_url, self.company_db,
+                                     self.username, self.password)
 
     def login(self):
-        """Login to SAP B1 Service Layer"""
+        """Make sure a pooled SAP B1 Service Layer session is authenticated"""
         # Skip actual SAP login in development mode
         if self.dev_mode:
             logging.info("Development mode: Skipping SAP B1 login")
-            self.session_id = "dev_session_123"
-            self.session_timeout = "dev_route_456"
             return True
-            
-        try:
-            login_data = {
-                'CompanyDB': self.company_db,
-                'UserName': self.username,
-                'Password': self.password
-            }
 
-            response = requests.post(f"{self.base_url}Login",
-                                     json=login_data,
-                                     verify=False,
-                                     timeout=30)
-
-            if response.status_code == 200:
-                self.session_id = response.cookies.get('B1SESSION')
-                self.session_timeout = response.cookies.get('ROUTEID')
-                logging.info("Successfully logged in to SAP B1")
+        try:
+            with self.pool.session():
                 return True
-            else:
-                logging.error(f"SAP B1 login failed: {response.status_code}")
-                return False
-
-        except Exception as e:
-            logging.error(f"SAP B1 login error: {e}")
+        except SAPLoginError as e:
+            logging.error(str(e))
             return False
 
     def logout(self):
-        """Logout from SAP B1 Service Layer"""
-        if self.session_id:
-            try:
-                cookies = {
-                    'B1SESSION': self.session_id,
-                    'ROUTEID': self.session_timeout
-                }
+        """Kept for callers of the per-call login/logout API; does nothing.
+
+        The pooled sessions are shared by every SAPIntegration in the process
+        (and with other processes), so one caller must not log them out.
+        Use sap_session.close_session_pools() when the process exits.
+        """
+
+    def _request(self, method, path, timeout=30, **kwargs):
+        """Send a request through the endpoint's circuit breaker and limiter.
+
+        Raises SAPUnavailableError without touching the network when SAP is
+        known to be down or already saturated, so callers fail fast.
+        """
+        endpoint = path.split('?', 1)[0].split('(', 1)[0]
+        self.retry_after = None
+        return get_guard(endpoint).call(
+            self.pool.request, method, path,
+            timeout=(self.connect_timeout, timeout), **kwargs)
+
+    def _build_grpo_payload(self, grpo):
+        """Build the PurchaseReceipts document for a GRPO"""
+        # Prepare GRPO data for SAP B1
+        grpo_data = {
+            'CardCode': grpo.purchase_order.supplier_code,
+            'DocDate': grpo.receipt_date.isoformat(),
+            'DocDueDate': grpo.receipt_date.isoformat(),
+            'Comments': grpo.remarks or f"GRPO {grpo.grn_number}",
+            GRPO_KEY_FIELD: grpo.grn_number,
+            'DocumentLines': []
+        }
+
+        # Add GRPO lines
+        for line in grpo.grpo_lines:
+            po_line = line.po_line
+            grpo_line = {
+                'ItemCode': po_line.item_code,
+                'Quantity': float(line.received_quantity),
+                'Price': float(line.unit_price),
+                'WarehouseCode': po_line.warehouse_code,
+                'BaseType': 22,  # Purchase Order
+                'BaseEntry': grpo.purchase_order.sap_doc_entry,
+                'BaseLine':
+                po_line.line_number - 1  # SAP uses 0-based indexing
+            }
 
-                response = requests.post(f"{self.base_url}Logout",
-                                         cookies=cookies,
-                                         verify=False,
-                                         timeout=30)
+            # Add batch information if available
+            if line.batch_number:
+                grpo_line['BatchNumbers'] = [{
+                    'BatchNumber':
+                    line.batch_number,
+                    'Quantity':
+                    float(line.received_quantity),
+                    'ExpiryDate':
+                    line.expiry_date.isoformat()
+                    if line.expiry_date else None
+                }]
 
-                if response.status_code == 204:
-                    logging.info("Successfully logged out from SAP B1")
+            grpo_data['DocumentLines'].append(grpo_line)
 
-            except Exception as e:
-                logging.error(f"SAP B1 logout error: {e}")
+        return grpo_data
 
-            finally:
-                self.session_id = None
-                self.session_timeout = None
+    def find_posted_grpo(self, grpo):
+        """Return the DocEntry of the Purchase Receipt SAP holds for a GRPO, or None.
+
+        Raises when SAP cannot answer, because "unknown" must never be read
+        as "not posted".
+        """
+        if self.dev_mode:
+            return None
+
+        key = grpo.grn_number.replace("'", "''")
+        response = self._request(
+            'GET', f"PurchaseReceipts?$select=DocEntry&$filter={GRPO_KEY_FIELD} eq '{key}'&$top=1",
+            timeout=30)
+        if response.status_code != 200:
+            raise SAPRequestError(
+                f"SAP B1 receipt lookup failed: {response.status_code} - {response.text}")
+        receipts = response.json().get('value', [])
+        return receipts[0]['DocEntry'] if receipts else None
+
+    def check_grpo_key_field(self):
+        """Log an error unless PurchaseReceipts has GRPO_KEY_FIELD; returns whether it does.
+
+        Without the field every posting and every receipt lookup fails with
+        an invalid property error. Returns None when SAP cannot be asked.
+        """
+        if self.dev_mode:
+            return True
+        try:
+            response = self._request(
+                'GET', f"PurchaseReceipts?$select=DocEntry,{GRPO_KEY_FIELD}&$top=1", timeout=30)
+        except Exception as e:
+            logging.warning(f"Could not check SAP B1 field {GRPO_KEY_FIELD}: {e}")
+            return None
+        if response.status_code == 200:
+            return True
+        if response.status_code == 400:
+            logging.error(
+                f"SAP B1 PurchaseReceipts has no field {GRPO_KEY_FIELD}, so GRPOs cannot be posted. "
+                f"Add the user-defined field or set SAP_GRPO_KEY_FIELD=NumAtCard. "
+                f"SAP answered: {response.text}")
+            return False
+        logging.warning(f"Could not check SAP B1 field {GRPO_KEY_FIELD}: {response.status_code}")
+        return None
+
+    def post_grpo_to_sap(self, grpo, verify_first=False):
+        """Post GRPO to SAP B1 as Purchase Receipt.
 
-    def post_grpo_to_sap(self, grpo):
-        """Post GRPO to SAP B1 as Purchase Receipt"""
+        Every receipt carries the GRN number in GRPO_KEY_FIELD. Pass
+        ``verify_first`` when an earlier attempt may have reached SAP (a
+        timeout, a 5xx, a crashed worker): the receipt is then looked up by
+        that key and only posted if SAP does not have it yet.
+        """
         # Development mode - simulate successful posting
         if self.dev_mode:
             import random
@@ -87,59 +195,24 @@ class SAPIntegration:
             return doc_entry
             
         try:
-            if not self.login():
-                return None
-
-            # Prepare GRPO data for SAP B1
-            grpo_data = {
-                'CardCode': grpo.purchase_order.supplier_code,
-                'DocDate': grpo.receipt_date.isoformat(),
-                'DocDueDate': grpo.receipt_date.isoformat(),
-                'Comments': grpo.remarks or f"GRPO {grpo.grn_number}",
-                'DocumentLines': []
-            }
+            if verify_first:
+                doc_entry = self.find_posted_grpo(grpo)
+                if doc_entry:
+                    self.last_error = None
+                    logging.info(
+                        f"GRPO {grpo.grn_number} already in SAP B1 as DocEntry {doc_entry}, "
+                        f"not posting again")
+                    return doc_entry
 
-            # Add GRPO lines
-            for line in grpo.grpo_lines:
-                po_line = line.po_line
-                grpo_line = {
-                    'ItemCode': po_line.item_code,
-                    'Quantity': float(line.received_quantity),
-                    'Price': float(line.unit_price),
-                    'WarehouseCode': po_line.warehouse_code,
-                    'BaseType': 22,  # Purchase Order
-                    'BaseEntry': grpo.purchase_order.sap_doc_entry,
-                    'BaseLine':
-                    po_line.line_number - 1  # SAP uses 0-based indexing
-                }
-
-                # Add batch information if available
-                if line.batch_number:
-                    grpo_line['BatchNumbers'] = [{
-                        'BatchNumber':
-                        line.batch_number,
-                        'Quantity':
-                        float(line.received_quantity),
-                        'ExpiryDate':
-                        line.expiry_date.isoformat()
-                        if line.expiry_date else None
-                    }]
-
-                grpo_data['DocumentLines'].append(grpo_line)
+            grpo_data = self._build_grpo_payload(grpo)
 
             # Post to SAP B1
-            cookies = {
-                'B1SESSION': self.session_id,
-                'ROUTEID': self.session_timeout
-            }
-
-            response = requests.post(f"{self.base_url}PurchaseReceipts",
-                                     json=grpo_data,
-                                     cookies=cookies,
-                                     verify=False,
-                                     timeout=60)
+            response = self._request('POST', 'PurchaseReceipts',
+                                         json=grpo_data,
+                                         timeout=60)
 
             if response.status_code == 201:
+                self.last_error = None
                 result = response.json()
                 doc_entry = result.get('DocEntry')
                 logging.info(
@@ -147,102 +220,415 @@ class SAPIntegration:
                 )
                 return doc_entry
             else:
+                self.last_error = f"{response.status_code} - {response.text}"
                 logging.error(
-                    f"SAP B1 GRPO posting failed: {response.status_code} - {response.text}"
+                    f"SAP B1 GRPO posting failed: {self.last_error}"
                 )
                 return None
 
+        except SAPUnavailableError as e:
+            self.last_error = str(e)
+            self.retry_after = e.retry_after
+            logging.warning(f"SAP B1 GRPO posting skipped: {e}")
+            return None
+
         except Exception as e:
+            self.last_error = str(e)
             logging.error(f"SAP B1 GRPO posting error: {e}")
             return None
 
-        finally:
-            self.logout()
+    def post_grpos_batch(self, grpos, use_changeset=False):
+        """Post several GRPOs as Purchase Receipts in one $batch request.
+
+        Returns one ``{'grn_number', 'doc_entry', 'error'}`` dict per GRPO in
+        the order given. With ``use_changeset`` SAP commits all receipts or
+        none of them, so a single failure is reported against every GRPO.
+        """
+        results = [{'grn_number': grpo.grn_number, 'doc_entry': None, 'error': None}
+                   for grpo in grpos]
+        if not grpos:
+            return results
+
+        # Development mode - simulate successful posting
+        if self.dev_mode:
+            import random
+            for result in results:
+                result['doc_entry'] = random.randint(100000, 999999)
+            logging.info(f"Development mode: Simulated batch posting of {len(grpos)} GRPOs")
+            return results
 
-    def get_purchase_orders(self, branch_id=None):
-        """Get open purchase orders from SAP B1"""
         try:
-            if not self.login():
-                return []
+            service_path = urlparse(self.base_url).path.rstrip('/')
+            operations = [('POST', f"{service_path}/PurchaseReceipts",
+                           self._build_grpo_payload(grpo)) for grpo in grpos]
+            content_type, body = build_batch_request(operations, use_changeset)
+
+            response = self._request('POST', '$batch', data=body,
+                                         headers={'Content-Type': content_type},
+                                         timeout=60 + 5 * len(grpos))
+            if response.status_code not in (200, 202):
+                raise SAPRequestError(
+                    f"{response.status_code} - {response.text}")
+
+            parts = parse_batch_response(response.headers.get('Content-Type', ''),
+                                         response.content)
+        except SAPUnavailableError as e:
+            self.last_error = str(e)
+            self.retry_after = e.retry_after
+            logging.warning(f"SAP B1 batch GRPO posting skipped: {e}")
+            for result in results:
+                result['error'] = str(e)
+            return results
+        except Exception as e:
+            logging.error(f"SAP B1 batch GRPO posting error: {e}")
+            for result in results:
+                result['error'] = str(e)
+            return results
+
+        if use_changeset and len(parts) != len(grpos):
+            # A failed changeset comes back as a single error response
+            error = parts[0].body if parts else 'Empty $batch response'
+            for result in results:
+                result['error'] = error
+            logging.error(f"SAP B1 batch changeset rejected: {error}")
+            return results
+
+        for result, part in zip(results, parts):
+            if part.status_code == 201:
+                result['doc_entry'] = part.json().get('DocEntry')
+            else:
+                result['error'] = f"{part.status_code} - {part.body}"
+        for result in results[len(parts):]:
+            result['error'] = 'No response for this document in $batch reply'
+
+        posted = sum(1 for result in results if result['doc_entry'])
+        logging.info(f"SAP B1 batch posted {posted} of {len(grpos)} GRPOs")
+        return results
+
+    def _iter_collection(self, resource, filter_expr=None, select=None,
+                         order_by=None, page_size=None):
+        """Yield records of a Service Layer collection one page at a time.
+
+        Follows ``odata.nextLink`` when the server pages the result itself
+        and otherwise advances ``$skip`` for as long as pages come back full,
+        so only one page is ever held in memory.
+        """
+        page_size = page_size or self.page_size
+        query = []
+        if select:
+            query.append(f"$select={','.join(select)}")
+        if filter_expr:
+            query.append(f"$filter={filter_expr}")
+        if order_by:
+            query.append(f"$orderby={order_by}")
+        headers = {'Prefer': f"odata.maxpagesize={page_size}"}
+
+        fetched = 0
+        window_start = 0
+        url = f"{resource}?{'&'.join(query + [f'$top={page_size}', '$skip=0'])}"
+        while url:
+            response = self._request('GET', url, headers=headers, timeout=60)
+            if response.status_code != 200:
+                raise SAPRequestError(
+                    f"SAP B1 {resource} retrieval failed: {response.status_code}")
+
+            body = response.json()
+            page = body.get('value', [])
+            for record in page:
+                yield record
+            fetched += len(page)
+
+            next_link = body.get('odata.nextLink') or body.get('@odata.nextLink')
+            if next_link:
+                url = next_link
+            elif page and fetched - window_start >= page_size:
+                # The $top window is exhausted but may not be the end of the data
+                window_start = fetched
+                url = f"{resource}?{'&'.join(query + [f'$top={page_size}', f'$skip={fetched}'])}"
+            else:
+                url = None
 
-            cookies = {
-                'B1SESSION': self.session_id,
-                'ROUTEID': self.session_timeout
-            }
+    def iter_purchase_orders(self, branch_id=None, page_size=None,
+                             updated_since=None):
+        """Stream purchase orders from SAP B1 one document at a time.
+
+        Without ``updated_since`` only open POs are returned. With it, every
+        PO updated on or after that day is returned whatever its status.
+        """
+        if self.dev_mode:
+            logging.info("Development mode: Skipping SAP B1 PO retrieval")
+            return
 
+        if updated_since:
+            filter_expr = f"UpdateDate ge '{updated_since.strftime('%Y-%m-%d')}'"
+        else:
             # Build filter for open POs
-            filter_params = "$filter=DocumentStatus eq 'bost_Open'"
-            if branch_id:
-                filter_params += f" and BPL_IDAssignedToInvoice eq {branch_id}"
-
-            response = requests.get(
-                f"{self.base_url}PurchaseOrders?{filter_params}",
-                cookies=cookies,
-                verify=False,
-                timeout=60)
-
-            if response.status_code == 200:
-                return response.json().get('value', [])
-            else:
-                logging.error(
-                    f"SAP B1 PO retrieval failed: {response.status_code}")
-                return []
+            filter_expr = "DocumentStatus eq 'bost_Open'"
+        if branch_id:
+            filter_expr += f" and BPL_IDAssignedToInvoice eq {branch_id}"
 
+        yield from self._iter_collection('PurchaseOrders',
+                                         filter_expr=filter_expr,
+                                         select=PO_SELECT_FIELDS,
+                                         order_by='DocEntry',
+                                         page_size=page_size)
+
+    def get_purchase_orders(self, branch_id=None):
+        """Get open purchase orders from SAP B1"""
+        try:
+            return list(self.iter_purchase_orders(branch_id))
         except Exception as e:
             logging.error(f"SAP B1 PO retrieval error: {e}")
             return []
 
-        finally:
-            self.logout()
+    def get_branches(self):
+        """Return the IDs of the active SAP B1 branches (business places).
+
+        SAP_SYNC_BRANCHES, a comma separated list, overrides the lookup.
+        """
+        configured = os.environ.get('SAP_SYNC_BRANCHES')
+        if configured:
+            return [branch.strip() for branch in configured.split(',') if branch.strip()]
+        if self.dev_mode:
+            logging.info("Development mode: Skipping SAP B1 branch retrieval")
+            return []
 
-    def sync_purchase_orders(self):
-        """Sync purchase orders from SAP B1 to local database"""
-        from models import PurchaseOrder, PurchaseOrderLine
+        places = self._iter_collection('BusinessPlaces',
+                                       filter_expr="Disabled eq 'tNO'",
+                                       select=['BPLID'], order_by='BPLID')
+        return [str(place['BPLID']) for place in places]
+
+    def _watermark(self, branch_id):
+        """Return the PO sync watermark of a branch ('' for all), creating it if needed"""
+        from models import SyncWatermark
+        from app import db
+
+        watermark = SyncWatermark.query.filter_by(
+            entity='PurchaseOrders', branch_id=branch_id or '').first()
+        if not watermark:
+            watermark = SyncWatermark(entity='PurchaseOrders',
+                                      branch_id=branch_id or '')
+            db.session.add(watermark)
+        return watermark
+
+    def sync_purchase_orders(self, branch_id=None, full=False):
+        """Sync purchase orders changed in SAP B1 since the last run.
+
+        The first run (or ``full=True``) pulls every open PO; later runs ask
+        only for documents whose UpdateDate/UpdateTime is at or after the
+        stored watermark, so closed and cancelled POs are picked up too.
+        Documents are written in chunks by ``PurchaseOrderBulkWriter``.
+        """
+        from po_sync import PurchaseOrderBulkWriter
         from app import db
 
+        stats = {'fetched': 0, 'created': 0, 'updated': 0}
+
         try:
-            sap_pos = self.get_purchase_orders()
+            since = None if full else self._watermark(branch_id).last_updated_at
+            high_water = since
+            writer = PurchaseOrderBulkWriter()
 
+            sap_pos = self.iter_purchase_orders(branch_id, updated_since=since)
             for sap_po in sap_pos:
-                # Check if PO already exists
-                existing_po = PurchaseOrder.query.filter_by(
-                    sap_doc_entry=sap_po['DocEntry']).first()
-
-                if not existing_po:
-                    # Create new PO
-                    po = PurchaseOrder(
-                        po_number=sap_po['DocNum'],
-                        supplier_code=sap_po['CardCode'],
-                        supplier_name=sap_po['CardName'],
-                        branch_id=sap_po.get('BPL_IDAssignedToInvoice', '1'),
-                        po_date=datetime.strptime(sap_po['DocDate'],
-                                                  '%Y-%m-%d').date(),
-                        delivery_date=datetime.strptime(
-                            sap_po['DocDueDate'], '%Y-%m-%d').date(),
-                        total_amount=sap_po['DocTotal'],
-                        currency=sap_po['DocCurrency'],
-                        sap_doc_entry=sap_po['DocEntry'])
-
-                    db.session.add(po)
-                    db.session.flush()  # Get the ID
-
-                    # Add PO lines
-                    for line in sap_po['DocumentLines']:
-                        po_line = PurchaseOrderLine(
-                            po_id=po.id,
-                            line_number=line['LineNum'] +
-                            1,  # Convert to 1-based
-                            item_code=line['ItemCode'],
-                            item_description=line['ItemDescription'],
-                            ordered_quantity=line['Quantity'],
-                            unit_price=line['Price'],
-                            unit_of_measure=line['MeasureUnit'],
-                            warehouse_code=line['WarehouseCode'])
-                        db.session.add(po_line)
+                stats['fetched'] += 1
+                updated_at = _parse_sap_datetime(sap_po.get('UpdateDate'),
+                                                 sap_po.get('UpdateTime'))
+                # UpdateDate filtering is day-granular, skip what we already have
+                if since and updated_at and updated_at < since:
+                    continue
 
+                writer.add(sap_po)
+
+                if updated_at and (high_water is None or updated_at > high_water):
+                    high_water = updated_at
+
+            stats.update(writer.finish())
+
+            self._watermark(branch_id).last_updated_at = high_water
             db.session.commit()
-            logging.info("Purchase orders synchronized from SAP B1")
+            logging.info(
+                f"Purchase orders synchronized from SAP B1: {stats['created']} created, "
+                f"{stats['updated']} updated")
 
         except Exception as e:
             logging.error(f"PO synchronization error: {e}")
             db.session.rollback()
+            stats['error'] = str(e)
+
+        return stats
+
+    def sync_purchase_orders_parallel(self, branch_ids=None, full=False,
+                                      max_workers=None):
+        """Sync several branches at once, one fetch stream per branch.
+
+        Fetch threads share the pooled Service Layer sessions and hand
+        documents to the calling thread through a bounded queue. Only the
+        calling thread touches the database, through a single
+        ``PurchaseOrderBulkWriter``. Every branch keeps its own watermark,
+        which only advances when that branch was fetched completely.
+        ``stats['branches']`` holds per-branch counts and fetch times.
+        """
+        from po_sync import PurchaseOrderBulkWriter
+        from app import db
+
+        if branch_ids is None:
+            branch_ids = self.get_branches()
+        branch_ids = [str(branch_id) for branch_id in branch_ids]
+        max_workers = max_workers or int(
+            os.environ.get('SAP_SYNC_WORKERS', str(self.pool.size)))
+
+        stats = {'fetched': 0, 'created': 0, 'updated': 0, 'branches': {
+            branch_id: {'fetched': 0, 'written': 0, 'seconds': 0.0, 'error': None}
+            for branch_id in branch_ids
+        }}
+        if not branch_ids:
+            return stats
+
+        started = perf_counter()
+        documents = queue.Queue(maxsize=int(os.environ.get('SAP_SYNC_QUEUE_SIZE', '1000')))
+        cancelled = threading.Event()
+
+        def offer(item):
+            # Give up instead of blocking forever once the writer has failed
+            while not cancelled.is_set():
+                try:
+                    documents.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch(branch_id, since):
+            branch_stats = stats['branches'][branch_id]
+            fetch_started = perf_counter()
+            try:
+                for sap_po in self.iter_purchase_orders(branch_id, updated_since=since):
+                    if not offer((branch_id, sap_po)):
+                        return
+            except Exception as e:
+                branch_stats['error'] = str(e)
+                logging.error(f"PO fetch for branch {branch_id} failed: {e}")
+            finally:
+                branch_stats['seconds'] = round(perf_counter() - fetch_started, 3)
+                offer((branch_id, None))
+
+        try:
+            since = {branch_id: None if full else self._watermark(branch_id).last_updated_at
+                     for branch_id in branch_ids}
+            high_water = dict(since)
+            writer = PurchaseOrderBulkWriter()
+
+            with ThreadPoolExecutor(max_workers=max_workers,
+                                    thread_name_prefix='po-sync') as executor:
+                for branch_id in branch_ids:
+                    executor.submit(fetch, branch_id, since[branch_id])
+
+                try:
+                    remaining = len(branch_ids)
+                    while remaining:
+                        branch_id, sap_po = documents.get()
+                        if sap_po is None:
+                            remaining -= 1
+                            continue
+
+                        branch_stats = stats['branches'][branch_id]
+                        branch_stats['fetched'] += 1
+                        stats['fetched'] += 1
+                        updated_at = _parse_sap_datetime(sap_po.get('UpdateDate'),
+                                                         sap_po.get('UpdateTime'))
+                        # UpdateDate filtering is day-granular, skip what we already have
+                        if since[branch_id] and updated_at and updated_at < since[branch_id]:
+                            continue
+
+                        writer.add(sap_po)
+                        branch_stats['written'] += 1
+
+                        if updated_at and (high_water[branch_id] is None
+                                           or updated_at > high_water[branch_id]):
+                            high_water[branch_id] = updated_at
+                finally:
+                    cancelled.set()
+
+            stats.update(writer.finish())
+
+            for branch_id in branch_ids:
+                if stats['branches'][branch_id]['error'] is None:
+                    self._watermark(branch_id).last_updated_at = high_water[branch_id]
+            db.session.commit()
+
+            stats['seconds'] = round(perf_counter() - started, 3)
+            for branch_id, branch_stats in stats['branches'].items():
+                logging.info(
+                    f"Branch {branch_id}: {branch_stats['fetched']} POs fetched in "
+                    f"{branch_stats['seconds']}s"
+                    + (f" (failed: {branch_stats['error']})" if branch_stats['error'] else ""))
+            logging.info(
+                f"Purchase orders synchronized from SAP B1 for {len(branch_ids)} branches "
+                f"in {stats['seconds']}s: {stats['created']} created, {stats['updated']} updated")
+
+        except Exception as e:
+            logging.error(f"Parallel PO synchronization error: {e}")
+            db.session.rollback()
+            stats['error'] = str(e)
+
+        return stats
+
+
+def _parse_sap_date(value):
+    """Parse a Service Layer date, which may carry a time part"""
+    if not value:
+        return None
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def _parse_sap_datetime(date_value, time_value=None):
+    """Combine SAP UpdateDate and UpdateTime into a datetime.
+
+    UpdateTime is "HH:MM:SS" on current Service Layer versions and an
+    HHMM integer on older ones.
+    """
+    day = _parse_sap_date(date_value)
+    if day is None:
+        return None
+    if isinstance(time_value, int):
+        clock = time(time_value // 100 % 24, time_value % 100)
+    elif time_value:
+        clock = time.fromisoformat(str(time_value)[:8])
+    else:
+        clock = time.min
+    return datetime.combine(day, clock)
+
+
+def map_purchase_order(sap_po):
+    """Map a SAP B1 PurchaseOrders record onto PurchaseOrder columns"""
+    if sap_po.get('Cancelled') == 'tYES':
+        status = 'Cancelled'
+    else:
+        status = PO_STATUS_MAP.get(sap_po.get('DocumentStatus'), 'Open')
+
+    return {
+        'po_number': str(sap_po['DocNum']),
+        'supplier_code': sap_po['CardCode'],
+        'supplier_name': sap_po['CardName'],
+        'branch_id': str(sap_po.get('BPL_IDAssignedToInvoice') or '1'),
+        'po_date': _parse_sap_date(sap_po['DocDate']),
+        'delivery_date': _parse_sap_date(sap_po.get('DocDueDate')),
+        'total_amount': sap_po['DocTotal'],
+        'currency': sap_po['DocCurrency'],
+        'status': status,
+        'sap_doc_entry': sap_po['DocEntry']
+    }
+
+
+def map_purchase_order_line(sap_line):
+    """Map a SAP B1 DocumentLines record onto PurchaseOrderLine columns"""
+    return {
+        'line_number': sap_line['LineNum'] + 1,  # Convert to 1-based
+        'item_code': sap_line['ItemCode'],
+        'item_description': sap_line['ItemDescription'],
+        'ordered_quantity': sap_line['Quantity'],
+        'unit_price': sap_line['Price'],
+        'unit_of_measure': sap_line['MeasureUnit'],
+        'warehouse_code': sap_line['WarehouseCode']
+    }
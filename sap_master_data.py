@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Local copy of SAP B1 master data with an in-process lookup cache
+
+Items, Warehouses, BinLocations and BusinessPartners are bulk-loaded from
+the Service Layer into local tables. Items and business partners refresh
+incrementally from their UpdateDate watermark. The smaller warehouse and
+bin location lists are reloaded whole. Lookups go through an LRU with a
+time to live and only ever read the local tables, so scanning and display
+never wait on SAP. Run from cron to keep the tables fresh:
+
+    python sap_master_data.py            # refresh collections older than SAP_MASTER_DATA_MAX_AGE
+    python sap_master_data.py --full     # reload everything
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update
+
+from app import app, db
+from models import SAPBinLocation, SAPBusinessPartner, SAPItem, SAPWarehouse, SyncWatermark
+from po_sync import _dialect_insert
+from sap_integration import SAPIntegration, _parse_sap_datetime
+
+
+def map_item(record):
+    return {
+        'item_code': record['ItemCode'],
+        'item_name': record.get('ItemName'),
+        'unit_of_measure': record.get('InventoryUOM'),
+        'manage_batch': record.get('ManageBatchNumbers') == 'tYES',
+        'is_active': record.get('Valid', 'tYES') == 'tYES' and record.get('Frozen') != 'tYES',
+        'sap_updated_at': _parse_sap_datetime(record.get('UpdateDate'), record.get('UpdateTime'))
+    }
+
+
+def map_warehouse(record):
+    return {
+        'warehouse_code': record['WarehouseCode'],
+        'warehouse_name': record.get('WarehouseName'),
+        'branch_id': str(record['BusinessPlaceID']) if record.get('BusinessPlaceID') else None,
+        'bin_locations_enabled': record.get('EnableBinLocations') == 'tYES',
+        'is_active': record.get('Inactive') != 'tYES'
+    }
+
+
+def map_bin_location(record):
+    return {
+        'bin_code': record['BinCode'],
+        'abs_entry': record['AbsEntry'],
+        'warehouse_code': record['Warehouse'],
+        'is_active': record.get('Inactive') != 'tYES'
+    }
+
+
+def map_business_partner(record):
+    return {
+        'card_code': record['CardCode'],
+        'card_name': record.get('CardName'),
+        'card_type': record.get('CardType'),
+        'is_active': record.get('Valid', 'tYES') == 'tYES' and record.get('Frozen') != 'tYES',
+        'sap_updated_at': _parse_sap_datetime(record.get('UpdateDate'), record.get('UpdateTime'))
+    }
+
+
+class MasterDataEntity:
+    """How one Service Layer master-data collection maps onto its local table"""
+
+    def __init__(self, resource, model, key, fields, mapper, order_by, delta=False):
+        self.resource = resource
+        self.model = model
+        self.key = key
+        self.fields = fields
+        self.mapper = mapper
+        self.order_by = order_by
+        self.delta = delta
+
+
+ENTITIES = {
+    'items': MasterDataEntity(
+        'Items', SAPItem, 'item_code',
+        ['ItemCode', 'ItemName', 'InventoryUOM', 'ManageBatchNumbers', 'Valid',
+         'Frozen', 'UpdateDate', 'UpdateTime'],
+        map_item, order_by='ItemCode', delta=True),
+    'warehouses': MasterDataEntity(
+        'Warehouses', SAPWarehouse, 'warehouse_code',
+        ['WarehouseCode', 'WarehouseName', 'BusinessPlaceID', 'EnableBinLocations',
+         'Inactive'],
+        map_warehouse, order_by='WarehouseCode'),
+    'bin_locations': MasterDataEntity(
+        'BinLocations', SAPBinLocation, 'bin_code',
+        ['AbsEntry', 'BinCode', 'Warehouse', 'Inactive'],
+        map_bin_location, order_by='AbsEntry'),
+    'business_partners': MasterDataEntity(
+        'BusinessPartners', SAPBusinessPartner, 'card_code',
+        ['CardCode', 'CardName', 'CardType', 'Valid', 'Frozen', 'UpdateDate',
+         'UpdateTime'],
+        map_business_partner, order_by='CardCode', delta=True)
+}
+
+
+class MasterDataCache:
+    """Thread-safe LRU of master-data lookups with a time to live.
+
+    Misses are loaded from the local tables, never from SAP. Unknown codes
+    are cached too, so a bad barcode scanned over and over stays cheap.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, entity, key, loader):
+        cache_key = (entity, key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(cache_key)
+                    self.hits += 1
+                    return value
+                del self._entries[cache_key]
+                self.expired += 1
+            self.misses += 1
+
+        value = loader(key)
+        with self._lock:
+            self._entries[cache_key] = (value, now + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, entity=None, keys=None):
+        """Drop cached lookups for some keys of an entity, a whole entity, or everything"""
+        with self._lock:
+            if entity is None:
+                self._entries.clear()
+            elif keys is not None:
+                for key in keys:
+                    self._entries.pop((entity, key), None)
+            else:
+                for cache_key in [cache_key for cache_key in self._entries
+                                  if cache_key[0] == entity]:
+                    del self._entries[cache_key]
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+cache = MasterDataCache(
+    maxsize=int(os.environ.get('SAP_MASTER_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('SAP_MASTER_CACHE_TTL', '300')))
+
+
+def _load_row(entity, key):
+    row = entity.model.query.filter_by(**{entity.key: key}).first()
+    if row is None:
+        return None
+    return {column.name: getattr(row, column.name)
+            for column in entity.model.__table__.columns}
+
+
+def lookup(name, key):
+    """Return the local master-data row for a code as a dict, or None if unknown"""
+    if not key:
+        return None
+    entity = ENTITIES[name]
+    return cache.get(name, key, lambda code: _load_row(entity, code))
+
+
+def get_item(item_code):
+    return lookup('items', item_code)
+
+
+def get_warehouse(warehouse_code):
+    return lookup('warehouses', warehouse_code)
+
+
+def get_bin_location(bin_code):
+    return lookup('bin_locations', bin_code)
+
+
+def get_business_partner(card_code):
+    return lookup('business_partners', card_code)
+
+
+def _watermark(entity):
+    watermark = SyncWatermark.query.filter_by(entity=entity.resource, branch_id='').first()
+    if not watermark:
+        watermark = SyncWatermark(entity=entity.resource, branch_id='')
+        db.session.add(watermark)
+    return watermark
+
+
+def _upsert(entity, rows):
+    columns = [column for column in rows[0] if column != entity.key]
+    dialect_name = db.engine.dialect.name
+    dialect_insert = _dialect_insert(dialect_name)
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(entity.model.__table__)
+        if dialect_name in ('mysql', 'mariadb'):
+            stmt = stmt.on_duplicate_key_update(
+                {column: stmt.inserted[column] for column in columns})
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[entity.key],
+                set_={column: stmt.excluded[column] for column in columns})
+        db.session.execute(stmt, rows)
+        return
+
+    key_column = getattr(entity.model, entity.key)
+    existing = dict(db.session.execute(
+        select(key_column, entity.model.id)
+        .where(key_column.in_([row[entity.key] for row in rows]))).all())
+    new_rows = [row for row in rows if row[entity.key] not in existing]
+    changed_rows = [dict(row, id=existing[row[entity.key]])
+                    for row in rows if row[entity.key] in existing]
+    if new_rows:
+        db.session.execute(insert(entity.model), new_rows)
+    if changed_rows:
+        db.session.execute(update(entity.model), changed_rows)
+
+
+def refresh(name, sap=None, full=False, chunk_size=None):
+    """Pull one master-data collection from SAP into its local table.
+
+    Delta collections only fetch records updated since the stored
+    watermark unless ``full`` is set. A full reload marks rows that SAP no
+    longer returned as inactive. Cached lookups of written keys are
+    invalidated chunk by chunk.
+    """
+    entity = ENTITIES[name]
+    sap = sap or SAPIntegration()
+    chunk_size = chunk_size or int(os.environ.get('SAP_SYNC_CHUNK_SIZE', '500'))
+    stats = {'fetched': 0, 'written': 0, 'deactivated': 0}
+
+    if sap.dev_mode:
+        logging.info(f"Development mode: Skipping SAP B1 {entity.resource} refresh")
+        return stats
+
+    started = time.perf_counter()
+    synced_at = datetime.utcnow()
+    since = None if full or not entity.delta else _watermark(entity).last_updated_at
+    high_water = since
+    filter_expr = f"UpdateDate ge '{since.strftime('%Y-%m-%d')}'" if since else None
+
+    def write(rows):
+        _upsert(entity, list(rows.values()))
+        db.session.commit()
+        cache.invalidate(name, list(rows))
+        stats['written'] += len(rows)
+
+    try:
+        rows = {}
+        for record in sap._iter_collection(entity.resource, filter_expr=filter_expr,
+                                           select=entity.fields, order_by=entity.order_by):
+            stats['fetched'] += 1
+            row = entity.mapper(record)
+            row['synced_at'] = synced_at
+            updated_at = row.get('sap_updated_at')
+            # UpdateDate filtering is day-granular, skip what we already have
+            if since and updated_at and updated_at < since:
+                continue
+            if updated_at and (high_water is None or updated_at > high_water):
+                high_water = updated_at
+
+            rows[row[entity.key]] = row
+            if len(rows) >= chunk_size:
+                write(rows)
+                rows = {}
+        if rows:
+            write(rows)
+
+        if since is None:
+            result = db.session.execute(
+                update(entity.model)
+                .where(entity.model.synced_at < synced_at, entity.model.is_active.is_(True))
+                .values(is_active=False))
+            stats['deactivated'] = result.rowcount
+            cache.invalidate(name)
+
+        watermark = _watermark(entity)
+        watermark.last_updated_at = high_water
+        # Record the refresh even when nothing changed, for the staleness check
+        watermark.updated_at = synced_at
+        db.session.commit()
+
+    except Exception as e:
+        logging.error(f"SAP B1 {entity.resource} refresh error: {e}")
+        db.session.rollback()
+        stats['error'] = str(e)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    logging.info(
+        f"SAP B1 {entity.resource} refreshed: {stats['fetched']} fetched, "
+        f"{stats['written']} written, {stats['deactivated']} deactivated "
+        f"in {stats['seconds']}s")
+    return stats
+
+
+def freshness(with_rows=False):
+    """When each collection was last refreshed and whether it is due again.
+
+    Reads only the watermark rows; ``with_rows`` adds each table's row
+    count, which is a full COUNT and meant for the status view.
+    """
+    max_age = timedelta(seconds=int(os.environ.get('SAP_MASTER_DATA_MAX_AGE', '3600')))
+    refreshed = {
+        watermark.entity: watermark.updated_at
+        for watermark in SyncWatermark.query.filter(
+            SyncWatermark.entity.in_([entity.resource for entity in ENTITIES.values()]),
+            SyncWatermark.branch_id == '')
+    }
+    now = datetime.utcnow()
+    result = {}
+    for name, entity in ENTITIES.items():
+        refreshed_at = refreshed.get(entity.resource)
+        result[name] = {
+            'refreshed_at': refreshed_at.isoformat() if refreshed_at else None,
+            'stale': refreshed_at is None or now - refreshed_at > max_age
+        }
+        if with_rows:
+            result[name]['rows'] = entity.model.query.count()
+    return result
+
+
+def refresh_stale(sap=None, full=False):
+    """Refresh every collection past SAP_MASTER_DATA_MAX_AGE (or all with ``full``)"""
+    sap = sap or SAPIntegration()
+    return {name: refresh(name, sap, full=full)
+            for name, state in freshness().items() if full or state['stale']}
+
+
+def validate_grpo(grpo):
+    """List master-data problems that would make SAP reject a GRPO.
+
+    Collections that were never loaded are not checked, so an empty local
+    copy never blocks a receipt.
+    """
+    loaded = {name for name, state in freshness().items() if state['refreshed_at']}
+    problems = []
+
+    if 'business_partners' in loaded:
+        partner = get_business_partner(grpo.purchase_order.supplier_code)
+        if not partner or not partner['is_active']:
+            problems.append(
+                f"Supplier {grpo.purchase_order.supplier_code} is not an active SAP business partner")
+
+    for line in grpo.grpo_lines:
+        po_line = line.po_line
+        if 'items' in loaded:
+            item = get_item(po_line.item_code)
+            if not item or not item['is_active']:
+                problems.append(f"Item {po_line.item_code} is not an active SAP item")
+            elif item['manage_batch'] and not line.batch_number:
+                problems.append(f"Item {po_line.item_code} requires a batch number")
+        if 'warehouses' in loaded:
+            warehouse = get_warehouse(po_line.warehouse_code)
+            if not warehouse or not warehouse['is_active']:
+                problems.append(f"Warehouse {po_line.warehouse_code} is not an active SAP warehouse")
+        if line.bin_location and 'bin_locations' in loaded:
+            bin_location = get_bin_location(line.bin_location)
+            if not bin_location or not bin_location['is_active']:
+                problems.append(f"Bin location {line.bin_location} does not exist in SAP")
+            elif bin_location['warehouse_code'] != po_line.warehouse_code:
+                problems.append(
+                    f"Bin location {line.bin_location} belongs to warehouse "
+                    f"{bin_location['warehouse_code']}, not {po_line.warehouse_code}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--full', action='store_true',
+                        help='reload every collection from scratch')
+    parser.add_argument('--entity', choices=sorted(ENTITIES),
+                        help='refresh only this collection')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with app.app_context():
+        if args.entity:
+            results = {args.entity: refresh(args.entity, full=args.full)}
+        else:
+            results = refresh_stale(full=args.full)
+    sys.exit(1 if any('error' in stats for stats in results.values()) else 0)
@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class SAPUnavailableError(Exception):
+    """Raised instead of calling SAP when its circuit is open or saturated"""
+
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after consecutive failures.
+
+    After ``failure_threshold`` failures in a row the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. It then lets up to
+    ``half_open_calls`` trial calls through; a success closes it again and
+    a failure reopens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, half_open_calls=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.trial_calls = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_timeout - time.time())
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN:
+                if self.retry_after() > 0:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self.trial_calls = 0
+            if self.state == HALF_OPEN:
+                if self.trial_calls >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                self.trial_calls += 1
+            return True
+
+    def release_trial(self):
+        """Hand back a half-open trial slot taken by allow() for a call that never ran"""
+        with self._lock:
+            if self.state == HALF_OPEN and self.trial_calls > 0:
+                self.trial_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logging.info("SAP circuit closed")
+            self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    logging.warning(
+                        f"SAP circuit opened after {self.consecutive_failures} failures")
+                self.state = OPEN
+                self.opened_at = time.time()
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by observed latency.
+
+    Every call that completes under ``target_latency`` grows the limit by
+    ``1 / limit`` (about one slot per round of calls). A slow or failed call
+    shrinks it by ``backoff``. Callers wait at most ``queue_timeout`` seconds
+    for a slot before failing fast.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=32, target_latency=2.0,
+                 backoff=0.7, queue_timeout=2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        deadline = time.time() + self.queue_timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, ok):
+        with self._cond:
+            self.in_flight -= 1
+            if ok and latency <= self.target_latency:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+            self._cond.notify_all()
+
+
+class EndpointGuard:
+    """Circuit breaker plus concurrency limiter for one Service Layer endpoint"""
+
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.environ.get('SAP_CB_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(os.environ.get('SAP_CB_RESET_SECONDS', '30')))
+        self.limiter = AdaptiveLimiter(
+            initial=int(os.environ.get('SAP_LIMIT_INITIAL', '8')),
+            maximum=int(os.environ.get('SAP_LIMIT_MAX', '32')),
+            target_latency=float(os.environ.get('SAP_LIMIT_TARGET_MS', '2000')) / 1000,
+            queue_timeout=float(os.environ.get('SAP_LIMIT_QUEUE_SECONDS', '2')))
+        self.calls = 0
+        self.failures = 0
+
+    def call(self, func, *args, **kwargs):
+        """Run ``func`` if SAP is healthy enough, else raise SAPUnavailableError.
+
+        Exceptions and 5xx/429 responses count as failures; other 4xx
+        responses are business errors and say nothing about SAP's health.
+        """
+        if not self.breaker.allow():
+            raise SAPUnavailableError(
+                f"SAP B1 {self.name} circuit is open",
+                retry_after=self.breaker.retry_after())
+        if not self.limiter.acquire():
+            self.breaker.release_trial()
+            raise SAPUnavailableError(
+                f"SAP B1 {self.name} concurrency limit reached",
+                retry_after=self.limiter.queue_timeout)
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = func(*args, **kwargs)
+            status = getattr(response, 'status_code', 200)
+            ok = status < 500 and status != 429
+            return response
+        finally:
+            latency = time.perf_counter() - start
+            self.limiter.release(latency, ok)
+            self.calls += 1
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.failures += 1
+                self.breaker.record_failure()
+
+    def metrics(self):
+        return {
+            'state': self.breaker.state,
+            'calls': self.calls,
+            'failures': self.failures,
+            'times_opened': self.breaker.times_opened,
+            'rejected_open': self.breaker.rejected,
+            'retry_after': round(self.breaker.retry_after(), 1) if self.breaker.state == OPEN else 0,
+            'concurrency_limit': round(self.limiter.limit, 2),
+            'in_flight': self.limiter.in_flight,
+            'rejected_saturated': self.limiter.rejected
+        }
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(endpoint):
+    """Return the process-wide guard for a Service Layer endpoint"""
+    with _guards_lock:
+        guard = _guards.get(endpoint)
+        if guard is None:
+            guard = _guards[endpoint] = EndpointGuard(endpoint)
+        return guard
+
+
+def get_metrics():
+    """Breaker and limiter state of every endpoint used in this process"""
+    with _guards_lock:
+        guards = list(_guards.values())
+    return {guard.name: guard.metrics() for guard in guards}
@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # Windows: the store is only locked within the process
+    fcntl = None
+
+# Refresh a session this many seconds before SAP would expire it
+EXPIRY_MARGIN = 60
+
+
+class SAPLoginError(Exception):
+    """Raised when the Service Layer rejects or cannot process a login"""
+
+
+class SessionStore:
+    """File-backed store of B1SESSION/ROUTEID cookies.
+
+    Every Flask/gunicorn worker on the host reads and writes the same file,
+    so a session established by one worker is reused by the others instead
+    of each process logging in on its own. Updates hold an flock on a
+    sidecar ``.lock`` file, so concurrent workers never drop each other's
+    slots.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store for a read-modify-write against threads and other processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sap_sessions')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def load(self, key, slot):
+        """Return the cookies stored for a pool slot if they are still valid"""
+        entry = self._read().get(key, {}).get(str(slot))
+        if entry and entry.get('expires_at', 0) > time.time():
+            return entry
+        return None
+
+    def save(self, key, slot, cookies, expires_at, timeout_seconds):
+        try:
+            with self._locked():
+                data = self._read()
+                data.setdefault(key, {})[str(slot)] = {
+                    'cookies': cookies,
+                    'expires_at': expires_at,
+                    'timeout_seconds': timeout_seconds
+                }
+                self._write(data)
+        except OSError as e:
+            logging.warning(f"Could not persist SAP B1 session: {e}")
+
+    def discard(self, key, slot, session_id):
+        try:
+            with self._locked():
+                data = self._read()
+                entry = data.get(key, {}).get(str(slot))
+                if entry and entry['cookies'].get('B1SESSION') == session_id:
+                    del data[key][str(slot)]
+                    self._write(data)
+        except OSError as e:
+            logging.warning(f"Could not discard SAP B1 session: {e}")
+
+
+class SAPSession:
+    """A keep-alive HTTP session bound to one Service Layer login"""
+
+    def __init__(self, slot, verify=False, pool_connections=1):
+        self.slot = slot
+        self.http = requests.Session()
+        self.http.verify = verify
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_connections)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self.expires_at = 0
+        self.timeout_seconds = 0
+
+    @property
+    def session_id(self):
+        return self.http.cookies.get('B1SESSION')
+
+    @property
+    def cookies(self):
+        return {
+            'B1SESSION': self.http.cookies.get('B1SESSION'),
+            'ROUTEID': self.http.cookies.get('ROUTEID')
+        }
+
+    def is_valid(self):
+        return bool(self.session_id) and self.expires_at > time.time()
+
+    def touch(self):
+        """Service Layer timeouts are idle timeouts, so each call extends them"""
+        if self.timeout_seconds:
+            margin = min(EXPIRY_MARGIN, self.timeout_seconds // 10)
+            self.expires_at = time.time() + self.timeout_seconds - margin
+
+    def adopt(self, cookies, expires_at, timeout_seconds):
+        self.http.cookies.clear()
+        for name, value in cookies.items():
+            if value:
+                self.http.cookies.set(name, value)
+        self.expires_at = expires_at
+        self.timeout_seconds = timeout_seconds
+
+    def reset(self):
+        self.http.cookies.clear()
+        self.expires_at = 0
+
+    def close(self):
+        self.http.close()
+
+
+class SAPSessionPool:
+    """Pool of authenticated Service Layer sessions.
+
+    Sessions are created lazily, logged in on first use, reused until
+    they expire and re-authenticated transparently when SAP answers 401.
+    """
+
+    def __init__(self, base_url, company_db, username, password, size=4,
+                 verify=False, timeout=30, store=None):
+        self.base_url = base_url
+        self.company_db = company_db
+        self.username = username
+        self.password = password
+        self.size = size
+        self.verify = verify
+        self.timeout = timeout
+        self.store = store
+        self.store_key = f"{base_url}|{company_db}|{username}"
+        self._idle = []
+        self._free_slots = list(range(size - 1, -1, -1))
+        self._cond = threading.Condition()
+        self.logins = 0
+
+    def _url(self, path):
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}{path.lstrip('/')}"
+
+    def _login(self, sap_session):
+        login_data = {
+            'CompanyDB': self.company_db,
+            'UserName': self.username,
+            'Password': self.password
+        }
+        sap_session.reset()
+        try:
+            response = sap_session.http.post(self._url('Login'),
+                                             json=login_data,
+                                             timeout=self.timeout)
+        except requests.RequestException as e:
+            raise SAPLoginError(f"SAP B1 login error: {e}") from e
+
+        if response.status_code != 200:
+            raise SAPLoginError(
+                f"SAP B1 login failed: {response.status_code}")
+
+        try:
+            timeout_minutes = int(response.json().get('SessionTimeout', 30))
+        except (ValueError, TypeError):
+            timeout_minutes = 30
+
+        sap_session.timeout_seconds = timeout_minutes * 60
+        sap_session.touch()
+        self.logins += 1
+        logging.info("Successfully logged in to SAP B1")
+
+        if self.store:
+            self.store.save(self.store_key, sap_session.slot,
+                            sap_session.cookies, sap_session.expires_at,
+                            sap_session.timeout_seconds)
+
+    def _ensure_login(self, sap_session):
+        if sap_session.is_valid():
+            return
+        if self.store:
+            entry = self.store.load(self.store_key, sap_session.slot)
+            if entry and entry['cookies'].get('B1SESSION') != sap_session.session_id:
+                sap_session.adopt(entry['cookies'], entry['expires_at'],
+                                  entry.get('timeout_seconds', 0))
+                return
+        self._login(sap_session)
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._free_slots:
+                    return SAPSession(self._free_slots.pop(),
+                                      verify=self.verify)
+                self._cond.wait()
+
+    def _release(self, sap_session):
+        with self._cond:
+            self._idle.append(sap_session)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        """Check out an authenticated session for the duration of the block"""
+        sap_session = self._acquire()
+        try:
+            self._ensure_login(sap_session)
+            yield sap_session
+        finally:
+            self._release(sap_session)
+
+    def request(self, method, path, **kwargs):
+        """Send a request on a pooled session, re-authenticating once on 401"""
+        kwargs.setdefault('timeout', self.timeout)
+        with self.session() as sap_session:
+            response = sap_session.http.request(method, self._url(path),
+                                                **kwargs)
+            if response.status_code == 401:
+                logging.info("SAP B1 session expired, logging in again")
+                if self.store:
+                    self.store.discard(self.store_key, sap_session.slot,
+                                       sap_session.session_id)
+                self._login(sap_session)
+                response = sap_session.http.request(method, self._url(path),
+                                                    **kwargs)
+            if response.status_code != 401:
+                sap_session.touch()
+            return response
+
+    def close(self, logout=True):
+        """Drop the keep-alive connections, logging the sessions out first by default.
+
+        Pass ``logout=False`` when other processes may still be using the
+        sessions through the shared store.
+        """
+        with self._cond:
+            sessions, self._idle = self._idle, []
+            self._free_slots.extend(s.slot for s in sessions)
+
+        for sap_session in sessions:
+            if logout and sap_session.session_id:
+                try:
+                    response = sap_session.http.post(self._url('Logout'),
+                                                     timeout=self.timeout)
+                    if response.status_code == 204:
+                        logging.info("Successfully logged out from SAP B1")
+                except requests.RequestException as e:
+                    logging.error(f"SAP B1 logout error: {e}")
+                if self.store:
+                    self.store.discard(self.store_key, sap_session.slot,
+                                       sap_session.session_id)
+            sap_session.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_session_pool(base_url, company_db, username, password):
+    """Return the process-wide session pool for a Service Layer login"""
+    key = (base_url, company_db, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            store_path = os.environ.get(
+                'SAP_B1_SESSION_STORE',
+                os.path.join(tempfile.gettempdir(), 'wms_sap_sessions.json'))
+            pool = SAPSessionPool(
+                base_url, company_db, username, password,
+                size=int(os.environ.get('SAP_B1_POOL_SIZE', '4')),
+                verify=os.environ.get('SAP_B1_VERIFY_SSL', 'false').lower() == 'true',
+                timeout=int(os.environ.get('SAP_B1_TIMEOUT', '30')),
+                store=SessionStore(store_path) if store_path else None)
+            _pools[key] = pool
+        return pool
+
+
+def close_session_pools(logout=False):
+    """Close every pool of this process, for use when it exits.
+
+    Sessions stay logged in by default: they are shared with other
+    processes through the session store and expire on SAP's own timeout.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close(logout=logout)
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the SAP B1 Service Layer
+
+Implements just enough of the Service Layer for the WMS integration code to
+run unchanged against it: Login/Logout, master data (BusinessPlaces, Items,
+Warehouses, BinLocations, BusinessPartners), paged PurchaseOrders,
+PurchaseReceipts and $batch. Latency, error rate, session expiry and throttling are
+configurable so the integration layer can be benchmarked and soak-tested
+without a network:
+
+    python sap_simulator.py --port 50001 --latency lognormal:40,0.5 --error-rate 0.02
+    SAP_B1_URL=http://127.0.0.1:50001/b1s/v1/ WMS_DEV_MODE=false python sap_worker.py
+
+GET /__stats returns request counters as JSON.
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from sap_batch import parse_batch_request
+
+SERVICE_PATH = '/b1s/v1/'
+DEFAULT_PAGE_SIZE = 20
+
+
+class LatencyModel:
+    """Response delay drawn from a distribution given as ``kind:params``.
+
+    ``fixed:20``            always 20 ms
+    ``uniform:10,80``       between 10 and 80 ms
+    ``lognormal:40,0.5``    median 40 ms with a long right tail (sigma 0.5)
+    """
+
+    def __init__(self, spec='fixed:0'):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+
+    def sample(self):
+        """Return a delay in seconds"""
+        if self.kind == 'uniform':
+            low, high = self.params
+            milliseconds = random.uniform(low, high)
+        elif self.kind == 'lognormal':
+            median, sigma = self.params
+            milliseconds = random.lognormvariate(math.log(max(median, 0.001)), sigma)
+        else:
+            milliseconds = self.params[0] if self.params else 0
+        return milliseconds / 1000.0
+
+
+class SimulatorConfig:
+    def __init__(self, latency='fixed:0', error_rate=0.0, session_timeout=1800,
+                 max_concurrent=0, max_page_size=DEFAULT_PAGE_SIZE,
+                 purchase_orders=1000, branches=4, seed=42, lost_response_rate=0.0, user_fields=()):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        # Fraction of successful POSTs whose response is replaced by a 504
+        # after the document was created, like a proxy timing out
+        self.lost_response_rate = lost_response_rate
+        self.session_timeout = session_timeout  # idle seconds before a 401
+        self.max_concurrent = max_concurrent  # 0 disables throttling
+        self.max_page_size = max_page_size
+        self.purchase_orders = purchase_orders
+        self.branches = branches
+        self.seed = seed
+        # User-defined fields (U_...) the company database has; others are invalid properties
+        self.user_fields = set(user_fields)
+
+
+class SimulatorState:
+    """In-memory company database shared by all handler threads"""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.collections = generate_master_data(config)
+        self.collections.update({
+            'PurchaseOrders': generate_purchase_orders(config),
+            'PurchaseReceipts': []
+        })
+        self.next_doc_entry = {'PurchaseReceipts': 1}
+        self.in_flight = 0
+        self.stats = Counter()
+
+    def open_session(self):
+        session_id = str(uuid.uuid4())
+        with self.lock:
+            self.sessions[session_id] = time.time()
+            self.stats['logins'] += 1
+        return session_id
+
+    def touch_session(self, session_id):
+        """Return True and extend the session if it is known and not idle-expired"""
+        now = time.time()
+        with self.lock:
+            last_used = self.sessions.get(session_id)
+            if last_used is None or now - last_used > self.config.session_timeout:
+                self.sessions.pop(session_id, None)
+                return False
+            self.sessions[session_id] = now
+            return True
+
+    def close_session(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def create_document(self, collection, document):
+        with self.lock:
+            doc_entry = self.next_doc_entry[collection]
+            self.next_doc_entry[collection] += 1
+            stored = dict(document, DocEntry=doc_entry, DocNum=doc_entry,
+                          UpdateDate=date.today().isoformat(),
+                          UpdateTime=datetime.now().strftime('%H:%M:%S'))
+            self.collections[collection].append(stored)
+        return stored
+
+
+def generate_master_data(config):
+    """Branches, items, warehouses, bins and suppliers the generated POs refer to"""
+    rng = random.Random(config.seed + 1)
+    today = date.today()
+
+    def updated():
+        return {'UpdateDate': (today - timedelta(days=rng.randint(0, 365))).isoformat(),
+                'UpdateTime': f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"}
+
+    warehouses = [f"WH{number:02d}" for number in range(1, 4)]
+    return {
+        'BusinessPlaces': [
+            {'BPLID': branch, 'BPLName': f"Simulated Branch {branch}", 'Disabled': 'tNO'}
+            for branch in range(1, config.branches + 1)
+        ],
+        'Items': [
+            dict({'ItemCode': f"ITEM{number:04d}", 'ItemName': f"Simulated item {number}",
+                  'InventoryUOM': 'PCS',
+                  'ManageBatchNumbers': 'tYES' if number % 3 == 0 else 'tNO',
+                  'Valid': 'tYES', 'Frozen': 'tNO'}, **updated())
+            for number in range(1, 501)
+        ],
+        'Warehouses': [
+            {'WarehouseCode': code, 'WarehouseName': f"Simulated warehouse {code}",
+             'BusinessPlaceID': (index % config.branches) + 1,
+             'EnableBinLocations': 'tYES', 'Inactive': 'tNO'}
+            for index, code in enumerate(warehouses)
+        ],
+        'BinLocations': [
+            {'AbsEntry': index * 100 + number, 'BinCode': f"{code}-A{number:02d}",
+             'Warehouse': code, 'Inactive': 'tNO'}
+            for index, code in enumerate(warehouses, start=1)
+            for number in range(1, 21)
+        ],
+        'BusinessPartners': [
+            dict({'CardCode': f"SUP{number:03d}", 'CardName': f"Simulated Supplier {number}",
+                  'CardType': 'cSupplier', 'Valid': 'tYES', 'Frozen': 'tNO'}, **updated())
+            for number in range(1, 51)
+        ]
+    }
+
+
+def generate_purchase_orders(config):
+    """Deterministic set of purchase orders spread over branches and suppliers"""
+    rng = random.Random(config.seed)
+    today = date.today()
+    orders = []
+    for doc_entry in range(1, config.purchase_orders + 1):
+        doc_date = today - timedelta(days=rng.randint(0, 90))
+        updated = doc_date + timedelta(days=rng.randint(0, (today - doc_date).days))
+        lines = []
+        for line_num in range(rng.randint(1, 10)):
+            lines.append({
+                'LineNum': line_num,
+                'ItemCode': f"ITEM{rng.randint(1, 500):04d}",
+                'ItemDescription': f"Simulated item {line_num + 1}",
+                'Quantity': float(rng.randint(1, 200)),
+                'Price': round(rng.uniform(1, 500), 2),
+                'MeasureUnit': 'PCS',
+                'WarehouseCode': f"WH{rng.randint(1, 3):02d}",
+                'LineStatus': 'bost_Open'
+            })
+        status = 'bost_Open' if rng.random() < 0.8 else 'bost_Close'
+        supplier = rng.randint(1, 50)
+        orders.append({
+            'DocEntry': doc_entry,
+            'DocNum': 10000 + doc_entry,
+            'CardCode': f"SUP{supplier:03d}",
+            'CardName': f"Simulated Supplier {supplier}",
+            'BPL_IDAssignedToInvoice': rng.randint(1, config.branches),
+            'DocDate': doc_date.isoformat(),
+            'DocDueDate': (doc_date + timedelta(days=14)).isoformat(),
+            'DocTotal': round(sum(line['Quantity'] * line['Price'] for line in lines), 2),
+            'DocCurrency': 'USD',
+            'DocumentStatus': status,
+            'Cancelled': 'tNO',
+            'UpdateDate': updated.isoformat(),
+            'UpdateTime': f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            'DocumentLines': lines
+        })
+    return orders
+
+
+def _literal(token):
+    token = token.strip()
+    if token.startswith("'") and token.endswith("'"):
+        return token[1:-1]
+    try:
+        return float(token) if '.' in token else int(token)
+    except ValueError:
+        return token
+
+
+def compile_filter(expression):
+    """Compile the ``Field op value [and ...]`` subset of $filter we use"""
+    if not expression:
+        return lambda record: True
+
+    operators = {
+        'eq': lambda a, b: a == b, 'ne': lambda a, b: a != b,
+        'ge': lambda a, b: a >= b, 'gt': lambda a, b: a > b,
+        'le': lambda a, b: a <= b, 'lt': lambda a, b: a < b,
+    }
+    clauses = []
+    for clause in expression.split(' and '):
+        field, op, value = clause.strip().split(' ', 2)
+        clauses.append((field, operators[op], _literal(value)))
+
+    def matches(record):
+        for field, op, value in clauses:
+            actual = record.get(field)
+            if actual is None:
+                return False
+            if isinstance(value, str):
+                actual = str(actual)
+            if not op(actual, value):
+                return False
+        return True
+
+    return matches
+
+
+class ServiceLayerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one segment so keep-alive clients are not held
+    # back by Nagle/delayed-ACK interaction
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        logging.debug("SAP simulator: " + format % args)
+
+    # -- plumbing -----------------------------------------------------------
+
+    def _send(self, status, payload=None, content_type='application/json', headers=None):
+        if isinstance(payload, (dict, list)):
+            body = json.dumps(payload).encode('utf-8')
+        elif isinstance(payload, str):
+            body = payload.encode('utf-8')
+        else:
+            body = payload or b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or []):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, code=-1):
+        self._send(status, {'error': {'code': code, 'message': {'lang': 'en-us', 'value': message}}})
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _session_id(self):
+        for cookie in self.headers.get('Cookie', '').split(';'):
+            name, _, value = cookie.strip().partition('=')
+            if name == 'B1SESSION':
+                return value
+        return None
+
+    def _dispatch(self, method):
+        config = self.state.config
+        parsed = urlparse(self.path)
+
+        if parsed.path == '/__stats':
+            with self.state.lock:
+                stats = dict(self.state.stats, open_sessions=len(self.state.sessions))
+            return self._send(200, stats)
+
+        if not parsed.path.startswith(SERVICE_PATH):
+            return self._error(404, f"Resource not found: {parsed.path}")
+        resource = parsed.path[len(SERVICE_PATH):]
+
+        with self.state.lock:
+            throttled = config.max_concurrent and self.state.in_flight >= config.max_concurrent
+            if throttled:
+                self.state.stats['throttled'] += 1
+            else:
+                self.state.in_flight += 1
+            self.state.stats[f"{method} {resource}"] += 1
+        if throttled:
+            self._read_body()
+            return self._error(503, 'Service Layer is busy', code=-503)
+
+        try:
+            time.sleep(config.latency.sample())
+            body = self._read_body()
+
+            if resource == 'Login' and method == 'POST':
+                return self._login(body)
+            if not self.state.touch_session(self._session_id()):
+                self.state.stats['unauthorized'] += 1
+                return self._error(401, 'Invalid session or session already timeout.', code=301)
+            if resource == 'Logout' and method == 'POST':
+                self.state.close_session(self._session_id())
+                return self._send(204)
+            if random.random() < config.error_rate:
+                self.state.stats['injected_errors'] += 1
+                return self._error(500, 'Simulated Service Layer failure')
+
+            status, payload, content_type = self._handle(method, resource, parsed.query, body)
+            if status == 201 and random.random() < config.lost_response_rate:
+                self.state.stats['lost_responses'] += 1
+                return self._error(504, 'Gateway timeout')
+            return self._send(status, payload, content_type)
+        finally:
+            with self.state.lock:
+                self.state.in_flight -= 1
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    # -- resources ----------------------------------------------------------
+
+    def _login(self, body):
+        try:
+            credentials = json.loads(body or b'{}')
+        except ValueError:
+            credentials = {}
+        if not credentials.get('UserName') or not credentials.get('CompanyDB'):
+            return self._error(401, 'Fail to get DB Credentials', code=-304)
+
+        session_id = self.state.open_session()
+        self._send(200, {
+            'odata.metadata': f"{SERVICE_PATH}$metadata#B1Sessions/@Element",
+            'SessionId': session_id,
+            'Version': '1000190',
+            'SessionTimeout': max(1, self.state.config.session_timeout // 60)
+        }, headers=[('Set-Cookie', f"B1SESSION={session_id}; HttpOnly; path=/b1s"),
+                    ('Set-Cookie', 'ROUTEID=.node1; path=/b1s')])
+
+    def _handle(self, method, resource, query, body):
+        """Answer one Service Layer operation, also used for $batch parts"""
+        if resource == '$batch' and method == 'POST':
+            return self._batch(body)
+        if resource not in self.state.collections:
+            return 404, {'error': {'code': -1, 'message': {'value': f"Unknown resource {resource}"}}}, 'application/json'
+        if method == 'GET':
+            params = {key: values[0] for key, values in parse_qs(query).items()}
+            fields = params.get('$select', '').split(',') + [
+                clause.strip().split(' ', 1)[0] for clause in params.get('$filter', '').split(' and ')]
+            invalid = self._invalid_property(fields)
+            if invalid:
+                return invalid
+            return 200, self._query(resource, query), 'application/json'
+        if method == 'POST':
+            document = json.loads(body or b'{}')
+            invalid = self._invalid_property(document)
+            if invalid:
+                return invalid
+            if not document.get('CardCode') or not document.get('DocumentLines'):
+                return 400, {'error': {'code': -5002, 'message': {'value': 'Document has no lines'}}}, 'application/json'
+            return 201, self.state.create_document(resource, document), 'application/json'
+        return 405, {'error': {'code': -1, 'message': {'value': 'Method not allowed'}}}, 'application/json'
+
+    def _invalid_property(self, fields):
+        """The 400 a company database without one of these user-defined fields answers"""
+        for field in fields:
+            if field.startswith('U_') and field not in self.state.config.user_fields:
+                return 400, {'error': {'code': -1000, 'message': {
+                    'value': f"Property '{field}' of 'Document' is invalid"}}}, 'application/json'
+        return None
+
+    def _query(self, resource, query):
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        records = [record for record in self.state.collections[resource]
+                   if compile_filter(params.get('$filter'))(record)]
+        if params.get('$orderby'):
+            field = params['$orderby'].split()[0]
+            records.sort(key=lambda record: record.get(field) or 0)
+
+        skip = int(params.get('$skip', 0))
+        top = int(params['$top']) if '$top' in params else None
+        page_size = DEFAULT_PAGE_SIZE
+        prefer = self.headers.get('Prefer', '')
+        if 'odata.maxpagesize=' in prefer:
+            page_size = int(prefer.split('odata.maxpagesize=')[1].split(',')[0])
+        page_size = min(page_size, self.state.config.max_page_size)
+
+        window = records[skip:skip + top] if top is not None else records[skip:]
+        page = window[:page_size]
+        if params.get('$select'):
+            fields = params['$select'].split(',')
+            page = [{field: record.get(field) for field in fields} for record in page]
+
+        result = {'odata.metadata': f"{SERVICE_PATH}$metadata#{resource}", 'value': page}
+        if len(window) > page_size:
+            next_params = [f"{key}={value}" for key, value in params.items()
+                           if key not in ('$skip', '$top')]
+            next_params.append(f"$skip={skip + page_size}")
+            if top is not None:
+                next_params.append(f"$top={top - page_size}")
+            result['odata.nextLink'] = f"{resource}?{'&'.join(next_params)}"
+        return result
+
+    def _batch(self, body):
+        groups = parse_batch_request(self.headers.get('Content-Type', ''), body)
+        boundary = f"batchresponse_{uuid.uuid4().hex}"
+        parts = []
+
+        for is_changeset, operations in groups:
+            responses = []
+            for operation in operations:
+                resource = urlparse(operation.path).path
+                if resource.startswith(SERVICE_PATH):
+                    resource = resource[len(SERVICE_PATH):]
+                if random.random() < self.state.config.error_rate:
+                    self.state.stats['injected_errors'] += 1
+                    response = (500, {'error': {'code': -1, 'message': {'value': 'Simulated Service Layer failure'}}}, 'application/json')
+                else:
+                    response = self._handle(operation.method, resource,
+                                            urlparse(operation.path).query,
+                                            operation.body.encode('utf-8'))
+                responses.append(response)
+                if is_changeset and response[0] >= 400:
+                    # A changeset is atomic: undo what it created and report one error
+                    self._rollback(responses[:-1])
+                    responses = [response]
+                    break
+
+            if is_changeset and len(responses) == len(operations):
+                changeset = f"changesetresponse_{uuid.uuid4().hex}"
+                inner = ''.join(f"--{changeset}\r\n{_http_response(*response, content_id=index)}"
+                                for index, response in enumerate(responses, 1))
+                parts.append(f"Content-Type: multipart/mixed;boundary={changeset}\r\n\r\n"
+                             f"{inner}--{changeset}--\r\n")
+            else:
+                parts.extend(_http_response(*response) for response in responses)
+
+        payload = ''.join(f"--{boundary}\r\n{part}" for part in parts) + f"--{boundary}--\r\n"
+        return 202, payload, f"multipart/mixed;boundary={boundary}"
+
+    def _rollback(self, responses):
+        created = {payload['DocEntry'] for status, payload, _ in responses if status == 201}
+        with self.state.lock:
+            receipts = self.state.collections['PurchaseReceipts']
+            receipts[:] = [doc for doc in receipts if doc['DocEntry'] not in created]
+
+
+def _http_response(status, payload, content_type, content_id=None):
+    reasons = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request',
+               404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+    lines = ['Content-Type: application/http', 'Content-Transfer-Encoding: binary']
+    if content_id is not None:
+        lines.append(f"Content-ID: {content_id}")
+    lines += ['', f"HTTP/1.1 {status} {reasons.get(status, '')}",
+              f"Content-Type: {content_type}", '',
+              json.dumps(payload) if isinstance(payload, (dict, list)) else (payload or '')]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+class SAPSimulator(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, ServiceLayerHandler)
+        self.state = SimulatorState(config)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{SERVICE_PATH}"
+
+
+def start_simulator(host='127.0.0.1', port=0, **options):
+    """Start a simulator on a background thread and return it"""
+    server = SAPSimulator((host, port), SimulatorConfig(**options))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50001)
+    parser.add_argument('--latency', default='fixed:0',
+                        help="fixed:MS, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of operations answered with a 500')
+    parser.add_argument('--session-timeout', type=int, default=1800,
+                        help='idle seconds before a session answers 401')
+    parser.add_argument('--max-concurrent', type=int, default=0,
+                        help='requests served at once before answering 503 (0 = unlimited)')
+    parser.add_argument('--lost-response-rate', type=float, default=0.0,
+                        help='fraction of created documents answered with a 504')
+    parser.add_argument('--max-page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--purchase-orders', type=int, default=1000)
+    parser.add_argument('--branches', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--user-fields', default='',
+                        help='comma-separated user-defined fields the company database has, e.g. U_WMS_GRN')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = SAPSimulator((args.host, args.port), SimulatorConfig(
+        latency=args.latency, error_rate=args.error_rate,
+        lost_response_rate=args.lost_response_rate,
+        session_timeout=args.session_timeout, max_concurrent=args.max_concurrent,
+        max_page_size=args.max_page_size, purchase_orders=args.purchase_orders,
+        branches=args.branches, seed=args.seed,
+        user_fields=[field for field in args.user_fields.split(',') if field]))
+    logging.info(f"SAP B1 Service Layer simulator listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Background worker that posts approved GRPOs to SAP B1 from the outbox
+
+QC approval only writes an SAPOutbox row in the same transaction as the
+status change. This process drains that queue with bounded concurrency and
+retries failed posts with exponential backoff:
+
+    python sap_worker.py              # poll forever
+    python sap_worker.py --once       # drain what is due and exit
+
+With WMS_DEV_MODE=true (the default) SAPIntegration simulates postings, so
+the worker can be run locally without an SAP server.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import aliased
+
+from app import app, db
+from models import GRPOStatus, SAPGuardSnapshot, SAPOutbox
+from sap_integration import SAPIntegration
+from sap_resilience import get_metrics as get_sap_metrics
+from sap_session import close_session_pools
+
+MAX_ATTEMPTS = int(os.environ.get('SAP_OUTBOX_MAX_ATTEMPTS', '8'))
+BACKOFF_SECONDS = float(os.environ.get('SAP_OUTBOX_BACKOFF_SECONDS', '30'))
+BACKOFF_MAX_SECONDS = float(os.environ.get('SAP_OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+# A 'processing' entry whose worker has been silent this long is taken over
+LEASE_SECONDS = int(os.environ.get('SAP_OUTBOX_LEASE_SECONDS', '600'))
+# How often the worker stores its circuit breaker and limiter state for the web app
+HEALTH_PUBLISH_SECONDS = float(os.environ.get('SAP_HEALTH_PUBLISH_SECONDS', '15'))
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter so retries from many GRPOs spread out"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=LEASE_SECONDS)
+    return db.or_(
+        db.and_(SAPOutbox.status == 'pending', SAPOutbox.next_attempt_at <= now),
+        db.and_(SAPOutbox.status == 'processing', SAPOutbox.locked_at < stale))
+
+
+def open_outbox_entry(grpo_id):
+    """The GRPO's pending or processing outbox entry, if it has one"""
+    return SAPOutbox.query.filter(
+        SAPOutbox.grpo_id == grpo_id,
+        SAPOutbox.status.in_(('pending', 'processing'))).first()
+
+
+def claim_entries(worker_id, limit):
+    """Lease up to ``limit`` due outbox entries to this worker.
+
+    Each entry is claimed with a conditional UPDATE, so several workers can
+    poll the same table without posting a GRPO twice. At most one entry per
+    GRPO is leased at a time, in case an older database holds duplicates.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=LEASE_SECONDS)
+    leased = aliased(SAPOutbox)
+    in_flight = db.session.query(leased.id).filter(
+        leased.grpo_id == SAPOutbox.grpo_id, leased.id != SAPOutbox.id,
+        leased.status == 'processing', leased.locked_at >= stale).exists()
+    candidates = db.session.query(SAPOutbox.id, SAPOutbox.grpo_id).filter(
+        _claimable(now), ~in_flight).order_by(SAPOutbox.next_attempt_at).limit(limit).all()
+
+    claimed = []
+    grpo_ids = set()
+    for entry_id, grpo_id in candidates:
+        if grpo_id in grpo_ids:
+            continue
+        grpo_ids.add(grpo_id)
+        updated = SAPOutbox.query.filter(
+            SAPOutbox.id == entry_id, _claimable(now)).update(
+                {'status': 'processing', 'locked_by': worker_id, 'locked_at': now},
+                synchronize_session=False)
+        if updated:
+            claimed.append(entry_id)
+
+    db.session.commit()
+    return claimed
+
+
+def _record_outcome(entry, doc_entry):
+    """Move an entry and its GRPO to done, failed or a later retry"""
+    grpo = entry.grpo
+    entry.locked_by = None
+    entry.locked_at = None
+
+    if doc_entry:
+        grpo.sap_doc_entry = doc_entry
+        grpo.status = GRPOStatus.POSTED_TO_SAP
+        entry.status = 'done'
+        entry.last_error = None
+        logging.info(f"Outbox: GRPO {grpo.grn_number} posted as DocEntry {doc_entry}")
+    elif entry.attempts >= MAX_ATTEMPTS:
+        grpo.status = GRPOStatus.SAP_POST_FAILED
+        entry.status = 'failed'
+        logging.error(f"Outbox: GRPO {grpo.grn_number} failed after {entry.attempts} attempts")
+    else:
+        delay = backoff_delay(entry.attempts)
+        entry.status = 'pending'
+        entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        logging.warning(
+            f"Outbox: GRPO {grpo.grn_number} attempt {entry.attempts} failed, "
+            f"retrying in {delay:.0f}s")
+
+
+def _defer(entry, sap):
+    """Reschedule an entry SAP refused to take without spending an attempt"""
+    entry.attempts -= 1
+    entry.status = 'pending'
+    entry.locked_by = None
+    entry.locked_at = None
+    entry.last_error = sap.last_error
+    entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=max(sap.retry_after, 1))
+
+
+def _release(entry):
+    """Hand a claimed entry back untouched, to be picked up on a later poll"""
+    entry.status = 'pending'
+    entry.locked_by = None
+    entry.locked_at = None
+
+
+def _may_be_in_sap(entry):
+    """True if an earlier attempt may have created the receipt in SAP.
+
+    The attempt is committed before the POST is sent, so this also covers
+    entries left behind by a crashed worker. A manual retry resets the
+    attempts but keeps last_error.
+    """
+    return entry.attempts > 0 or entry.last_error is not None
+
+
+def _shared_grpo_ids(entries):
+    """GRPOs of ``entries`` that have another outbox entry, which may have posted them"""
+    entry_ids = [entry.id for entry in entries]
+    return {grpo_id for (grpo_id,) in db.session.query(SAPOutbox.grpo_id).filter(
+        SAPOutbox.grpo_id.in_([entry.grpo_id for entry in entries]),
+        SAPOutbox.id.notin_(entry_ids)).distinct()}
+
+
+def _post_entry(entry, verify_first=False):
+    """Post one entry's GRPO, looking its receipt up by GRN number first if needed"""
+    grpo = entry.grpo
+    if grpo.sap_doc_entry:
+        _record_outcome(entry, grpo.sap_doc_entry)
+        return
+
+    verify_first = verify_first or _may_be_in_sap(entry)
+    entry.attempts += 1
+    db.session.commit()
+
+    sap = SAPIntegration()
+    doc_entry = sap.post_grpo_to_sap(grpo, verify_first=verify_first)
+    if sap.retry_after is not None:
+        # The circuit breaker failed fast; wait for it rather than retrying
+        _defer(entry, sap)
+        return
+    entry.last_error = sap.last_error
+    _record_outcome(entry, doc_entry)
+
+
+def process_entry(entry_id):
+    """Post one claimed outbox entry and record the outcome"""
+    with app.app_context():
+        entry = db.session.get(SAPOutbox, entry_id)
+        _post_entry(entry, verify_first=bool(_shared_grpo_ids([entry])))
+        status = entry.status
+        db.session.commit()
+        return status
+
+
+def process_batch(entry_ids):
+    """Post several claimed outbox entries in one SAP $batch request.
+
+    Only first attempts of GRPOs with no other outbox entry go into the
+    $batch. Retries and GRPOs queued more than once may already exist in
+    SAP, so they are verified and posted one by one.
+    """
+    with app.app_context():
+        entries = SAPOutbox.query.filter(SAPOutbox.id.in_(entry_ids)).order_by(SAPOutbox.id).all()
+        by_grpo = {}
+        for entry in entries:
+            if entry.grpo_id in by_grpo:
+                # Posting the GRPO twice in one $batch would create two receipts
+                _release(entry)
+            else:
+                by_grpo[entry.grpo_id] = entry
+        shared = _shared_grpo_ids(by_grpo.values()) if by_grpo else set()
+        fresh = [entry for entry in by_grpo.values()
+                 if not _may_be_in_sap(entry) and not entry.grpo.sap_doc_entry
+                 and entry.grpo_id not in shared]
+        for entry in by_grpo.values():
+            if entry not in fresh:
+                _post_entry(entry, verify_first=entry.grpo_id in shared)
+
+        if fresh:
+            for entry in fresh:
+                entry.attempts += 1
+            db.session.commit()
+
+            sap = SAPIntegration()
+            results = sap.post_grpos_batch([entry.grpo for entry in fresh])
+            if sap.retry_after is not None:
+                for entry in fresh:
+                    _defer(entry, sap)
+            else:
+                for entry, result in zip(fresh, results):
+                    entry.last_error = result['error']
+                    _record_outcome(entry, result['doc_entry'])
+
+        db.session.commit()
+        return [entry.status for entry in entries]
+
+
+def publish_health(worker_id):
+    """Store this process's SAP guard metrics, which only live in its memory"""
+    now = datetime.utcnow()
+    metrics = get_sap_metrics()
+    snapshots = {snapshot.endpoint: snapshot for snapshot in
+                 SAPGuardSnapshot.query.filter_by(worker_id=worker_id)}
+    for endpoint, values in metrics.items():
+        snapshot = snapshots.get(endpoint)
+        if snapshot is None:
+            snapshot = SAPGuardSnapshot(worker_id=worker_id, endpoint=endpoint)
+            db.session.add(snapshot)
+        snapshot.metrics = json.dumps(values)
+        snapshot.updated_at = now
+    # Rows of workers that died without clearing theirs
+    SAPGuardSnapshot.query.filter(SAPGuardSnapshot.updated_at < now - timedelta(hours=1)).delete()
+    db.session.commit()
+
+
+def clear_health(worker_id):
+    SAPGuardSnapshot.query.filter_by(worker_id=worker_id).delete()
+    db.session.commit()
+
+
+def get_health():
+    """SAP guard metrics by worker and endpoint, from recently published snapshots.
+
+    The web process's own guards are included when it has made SAP calls
+    itself. Workers that stopped publishing are left out.
+    """
+    stale = datetime.utcnow() - timedelta(seconds=HEALTH_PUBLISH_SECONDS * 3)
+    health = {}
+    for snapshot in SAPGuardSnapshot.query.filter(SAPGuardSnapshot.updated_at >= stale).order_by(
+            SAPGuardSnapshot.worker_id, SAPGuardSnapshot.endpoint):
+        worker = health.setdefault(snapshot.worker_id, {
+            'updated_at': snapshot.updated_at.isoformat(), 'endpoints': {}})
+        worker['endpoints'][snapshot.endpoint] = json.loads(snapshot.metrics)
+    local = get_sap_metrics()
+    if local:
+        health[f"{socket.gethostname()}:{os.getpid()}"] = {
+            'updated_at': datetime.utcnow().isoformat(), 'endpoints': local}
+    return health
+
+
+def run(concurrency=4, poll_interval=5.0, once=False, batch_size=1):
+    """Drain the outbox until stopped (or until it is empty with ``once``).
+
+    With ``batch_size`` above 1 each thread posts that many GRPOs per SAP
+    $batch request instead of one request per GRPO.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = []
+
+    def stop(signum, frame):
+        logging.info("Outbox worker stopping")
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logging.info(f"Outbox worker {worker_id} started with concurrency {concurrency}")
+    SAPIntegration().check_grpo_key_field()
+    published = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while not stopping:
+            with app.app_context():
+                if time.monotonic() - published >= HEALTH_PUBLISH_SECONDS:
+                    try:
+                        publish_health(worker_id)
+                    except Exception as e:
+                        db.session.rollback()
+                        logging.error(f"Could not publish SAP health: {e}")
+                    published = time.monotonic()
+                entry_ids = claim_entries(worker_id, concurrency * batch_size)
+
+            if entry_ids:
+                if batch_size > 1:
+                    batches = [entry_ids[i:i + batch_size]
+                               for i in range(0, len(entry_ids), batch_size)]
+                    list(executor.map(process_batch, batches))
+                else:
+                    list(executor.map(process_entry, entry_ids))
+                continue
+
+            if once:
+                break
+            time.sleep(poll_interval)
+
+    with app.app_context():
+        clear_health(worker_id)
+    close_session_pools()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int,
+                        default=int(os.environ.get('SAP_WORKER_CONCURRENCY', '4')),
+                        help='number of GRPOs posted in parallel')
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help='seconds to wait when the outbox is empty')
+    parser.add_argument('--once', action='store_true',
+                        help='exit once no entry is due')
+    parser.add_argument('--batch-size', type=int,
+                        default=int(os.environ.get('SAP_OUTBOX_BATCH_SIZE', '1')),
+                        help='GRPOs posted per SAP $batch request (1 disables batching)')
+    args = parser.parse_args()
+
+    run(concurrency=args.concurrency, poll_interval=args.poll_interval,
+        once=args.once, batch_size=args.batch_size)
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+In-memory index that resolves handheld scans without touching the database
+
+Classifies a scanned string as one of our QR label payloads, a GS1 supplier
+carton barcode, a GRN number, a PO number, an item code or a supplier
+barcode recorded on a GRPO line, and returns what it refers to. Lookups are dictionary hits on normalised
+keys, with a sorted key list for prefix suggestions when nothing matches
+exactly.
+
+The index is built once at startup, updated from ORM commits in this
+process, caught up with rows inserted elsewhere (other workers, bulk SAP
+syncs) every SCAN_INDEX_REFRESH_SECONDS, and rebuilt from scratch every
+SCAN_INDEX_REBUILD_SECONDS to pick up edits and deletes made elsewhere.
+
+    python scan_index.py GRN-MAIN-0000042 PO-1 --repeat 100000
+"""
+
+import argparse
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from models import GRPO, GRPOLine, PurchaseOrder, PurchaseOrderLine, SAPItem
+import gs1
+from qr_generator import COMPACT_PAYLOAD_VERSION, decode_qr_code
+
+SCAN_INDEX_REFRESH_SECONDS = float(os.environ.get('SCAN_INDEX_REFRESH_SECONDS', '30'))
+SCAN_INDEX_REBUILD_SECONDS = float(os.environ.get('SCAN_INDEX_REBUILD_SECONDS', '900'))
+
+# Exact-match maps in the order an ambiguous scan is tried, and the type each
+# resolves to. Item codes seen only on PO lines rank below SAP item master data.
+KINDS = {
+    'grn': 'grn',
+    'purchase_order': 'purchase_order',
+    'item': 'item',
+    'po_line_item': 'item',
+    'supplier_barcode': 'supplier_barcode'
+}
+
+
+def normalize(text):
+    return text.strip().upper()
+
+
+def _grpo_entries(connection, condition):
+    rows = connection.execute(
+        select(GRPO.id, GRPO.grn_number, GRPO.status, PurchaseOrder.po_number)
+        .join(PurchaseOrder, GRPO.po_id == PurchaseOrder.id)
+        .where(condition).order_by(GRPO.id))
+    for grpo_id, grn_number, status, po_number in rows:
+        yield grpo_id, 'grn', grn_number, {
+            'grn_number': grn_number, 'grpo_id': grpo_id, 'po_number': po_number,
+            'status': status.value if status else None}
+
+
+def _purchase_order_entries(connection, condition):
+    rows = connection.execute(
+        select(PurchaseOrder.id, PurchaseOrder.po_number, PurchaseOrder.supplier_code,
+               PurchaseOrder.supplier_name, PurchaseOrder.branch_id, PurchaseOrder.status)
+        .where(condition).order_by(PurchaseOrder.id))
+    for po_id, po_number, supplier_code, supplier_name, branch_id, status in rows:
+        yield po_id, 'purchase_order', po_number, {
+            'po_number': po_number, 'po_id': po_id, 'supplier_code': supplier_code,
+            'supplier_name': supplier_name, 'branch_id': branch_id, 'status': status}
+
+
+def _po_line_item_entries(connection, condition):
+    rows = connection.execute(
+        select(PurchaseOrderLine.id, PurchaseOrderLine.item_code,
+               PurchaseOrderLine.item_description, PurchaseOrderLine.unit_of_measure)
+        .where(condition).order_by(PurchaseOrderLine.id))
+    for line_id, item_code, description, unit_of_measure in rows:
+        yield line_id, 'po_line_item', item_code, {
+            'item_code': item_code, 'description': description,
+            'unit_of_measure': unit_of_measure, 'manage_batch': None}
+
+
+def _sap_item_entries(connection, condition):
+    rows = connection.execute(
+        select(SAPItem.id, SAPItem.item_code, SAPItem.item_name, SAPItem.unit_of_measure,
+               SAPItem.manage_batch)
+        .where(condition, SAPItem.is_active.is_(True)).order_by(SAPItem.id))
+    for item_id, item_code, item_name, unit_of_measure, manage_batch in rows:
+        yield item_id, 'item', item_code, {
+            'item_code': item_code, 'description': item_name,
+            'unit_of_measure': unit_of_measure, 'manage_batch': manage_batch}
+
+
+def _supplier_barcode_entries(connection, condition):
+    rows = connection.execute(
+        select(GRPOLine.id, GRPOLine.supplier_barcode, GRPOLine.batch_number,
+               GRPOLine.expiry_date, PurchaseOrderLine.item_code, GRPO.grn_number)
+        .join(PurchaseOrderLine, GRPOLine.po_line_id == PurchaseOrderLine.id)
+        .join(GRPO, GRPOLine.grpo_id == GRPO.id)
+        .where(condition, GRPOLine.supplier_barcode.isnot(None))
+        .order_by(GRPOLine.id))
+    for line_id, barcode, batch_number, expiry_date, item_code, grn_number in rows:
+        yield line_id, 'supplier_barcode', barcode, {
+            'supplier_barcode': barcode, 'item_code': item_code, 'batch_number': batch_number,
+            'expiry_date': expiry_date.isoformat() if expiry_date else None,
+            'grn_number': grn_number}
+
+
+# Indexed model -> (loader, the map its rows go into, column holding the code)
+LOADERS = {
+    GRPO: (_grpo_entries, 'grn', 'grn_number'),
+    PurchaseOrder: (_purchase_order_entries, 'purchase_order', 'po_number'),
+    PurchaseOrderLine: (_po_line_item_entries, 'po_line_item', None),
+    SAPItem: (_sap_item_entries, 'item', None),
+    GRPOLine: (_supplier_barcode_entries, 'supplier_barcode', 'supplier_barcode')
+}
+
+
+class ScanIndex:
+    """Hash maps per kind of code plus one sorted key list for prefix search"""
+
+    def __init__(self):
+        self.entries = {kind: {} for kind in KINDS}
+        self.keys = []  # Sorted (normalised key, kind) pairs
+        self.high_water = {model: 0 for model in LOADERS}
+        self.built_at = None
+        self.lookups = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _put(self, kind, code, record):
+        key = normalize(code)
+        entries = self.entries[kind]
+        if key not in entries:
+            bisect.insort(self.keys, (key, kind))
+        entries[key] = record
+
+    def _remove(self, kind, code):
+        key = normalize(code)
+        if self.entries[kind].pop(key, None) is not None:
+            position = bisect.bisect_left(self.keys, (key, kind))
+            if position < len(self.keys) and self.keys[position] == (key, kind):
+                del self.keys[position]
+
+    @classmethod
+    def build(cls):
+        """Load a complete index from the database"""
+        started = time.perf_counter()
+        index = cls()
+        for model, (loader, _, _) in LOADERS.items():
+            for row_id, kind, code, record in loader(db.session, model.id > 0):
+                if code:
+                    index.entries[kind][normalize(code)] = record
+                index.high_water[model] = max(index.high_water[model], row_id)
+        index.keys = sorted((key, kind) for kind, entries in index.entries.items()
+                            for key in entries)
+        index.built_at = time.time()
+        logging.info(f"Scan index built with {len(index.keys)} codes in "
+                     f"{time.perf_counter() - started:.2f}s")
+        return index
+
+    def _load(self, connection, model, condition):
+        loader = LOADERS[model][0]
+        rows = list(loader(connection, condition))
+        with self._lock:
+            for row_id, kind, code, record in rows:
+                if code:
+                    self._put(kind, code, record)
+                self.high_water[model] = max(self.high_water[model], row_id)
+        return len(rows)
+
+    def catch_up(self):
+        """Add rows inserted since the last build or catch-up, e.g. by other workers"""
+        added = sum(self._load(db.session, model, model.id > self.high_water[model])
+                    for model in LOADERS)
+        if added:
+            logging.debug(f"Scan index caught up with {added} new rows")
+        return added
+
+    def apply(self, written, removed=()):
+        """Drop deleted or replaced codes and re-read rows committed in this process.
+
+        ``written`` maps models to row ids. The rows are read on a
+        connection of their own, as the committing session is finished.
+        A dropped code that another row still carries (a supplier barcode
+        on several lines) is read back from that row.
+        """
+        removed = [(kind, code) for kind, code in removed if code]
+        with self._lock:
+            for kind, code in removed:
+                self._remove(kind, code)
+        with db.engine.connect() as connection:
+            for model, ids in written.items():
+                self._load(connection, model, model.id.in_(ids))
+            for model, (_, kind, code_column) in LOADERS.items():
+                codes = {code for removed_kind, code in removed if removed_kind == kind}
+                if code_column and codes:
+                    self._load(connection, model, getattr(model, code_column).in_(codes))
+
+    def suggest(self, prefix, limit=5):
+        """Known codes starting with ``prefix``"""
+        key = normalize(prefix)
+        if not key:
+            return []
+        position = bisect.bisect_left(self.keys, (key, ''))
+        matches = []
+        for candidate, kind in self.keys[position:position + limit * 2]:
+            if not candidate.startswith(key) or len(matches) == limit:
+                break
+            match = {'type': KINDS[kind], 'code': candidate}
+            if match not in matches:
+                matches.append(match)
+        return matches
+
+    def resolve(self, text):
+        """Classify a scanned string and return what it refers to, or None"""
+        self.lookups += 1
+        text = (text or '').strip()
+        if not text:
+            self.misses += 1
+            return None
+
+        if text.startswith(COMPACT_PAYLOAD_VERSION + '/') or text.startswith('{'):
+            label = decode_qr_code(text)
+            if label:
+                grpo = self.entries['grn'].get(normalize(label.get('grn_number') or ''))
+                return dict(label, type='qr_label',
+                            grpo_id=grpo['grpo_id'] if grpo else None,
+                            status=grpo['status'] if grpo else None)
+
+        if gs1.is_gs1(text):
+            try:
+                fields = gs1.parse(text)
+            except gs1.GS1ParseError:
+                fields = None
+            if fields:
+                # Cartons of a GTIN received before tell us the item
+                known = self.entries['supplier_barcode'].get(fields['gtin'] or '')
+                return dict(fields, type='gs1', supplier_barcode=fields['gtin'],
+                            item_code=known['item_code'] if known else None)
+
+        key = normalize(text)
+        for kind, result_type in KINDS.items():
+            record = self.entries[kind].get(key)
+            if record is not None:
+                return dict(record, type=result_type)
+        self.misses += 1
+        return None
+
+    def metrics(self):
+        return {
+            'codes': {kind: len(entries) for kind, entries in self.entries.items()},
+            'keys': len(self.keys),
+            'lookups': self.lookups,
+            'misses': self.misses,
+            'built_at': self.built_at
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index, built on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ScanIndex.build()
+    return _index
+
+
+def resolve(text):
+    return get_index().resolve(text)
+
+
+def start(app):
+    """Warm the index in the background and keep it fresh"""
+    def run():
+        global _index
+        with app.app_context():
+            try:
+                get_index()
+            except Exception as e:
+                logging.error(f"Scan index warm-up failed: {e}")
+            last_build = time.monotonic()
+            while True:
+                time.sleep(SCAN_INDEX_REFRESH_SECONDS)
+                try:
+                    if time.monotonic() - last_build >= SCAN_INDEX_REBUILD_SECONDS:
+                        index = ScanIndex.build()
+                        with _index_lock:
+                            _index = index
+                        last_build = time.monotonic()
+                    else:
+                        get_index().catch_up()
+                except Exception as e:
+                    logging.error(f"Scan index refresh failed: {e}")
+                finally:
+                    db.session.remove()
+
+    threading.Thread(target=run, name='scan-index', daemon=True).start()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_replaced_codes(session, flush_context, instances):
+    """Note the old value of every edited PO number, GRN and supplier barcode"""
+    if _index is None:
+        return
+    _, removed = session.info.setdefault('scan_index_pending', ({}, []))
+    for obj in session.dirty:
+        if type(obj) not in LOADERS or obj in session.deleted:
+            continue
+        model = type(obj)
+        _, kind, code_column = LOADERS[model]
+        if not code_column:
+            continue
+        history = inspect(obj).attrs[code_column].history
+        if history.deleted:
+            removed.extend((kind, code) for code in history.deleted)
+        elif history.added and obj.id is not None:
+            # Assigned while expired, e.g. after a commit: the old value is still in the table
+            removed.append((kind, session.connection().execute(
+                select(getattr(model, code_column)).where(model.id == obj.id)).scalar()))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Note indexed rows written by a flush; the index is updated on commit"""
+    if _index is None:
+        return
+    written, removed = session.info.setdefault('scan_index_pending', ({}, []))
+    for obj in list(session.new) + list(session.dirty):
+        if type(obj) in LOADERS:
+            written.setdefault(type(obj), set()).add(obj.id)
+    for obj in session.deleted:
+        if type(obj) in LOADERS:
+            _, kind, code_column = LOADERS[type(obj)]
+            if code_column:
+                removed.append((kind, getattr(obj, code_column)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    pending = session.info.pop('scan_index_pending', None)
+    if pending and _index is not None:
+        try:
+            _index.apply(*pending)
+        except Exception as e:
+            # The periodic catch-up and rebuild will pick the rows up
+            logging.error(f"Scan index update failed: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('scan_index_pending', None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('barcodes', nargs='+')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='resolve each barcode this many times and print the average time')
+    args = parser.parse_args()
+
+    from app import app
+    logging.getLogger().setLevel(logging.INFO)
+    with app.app_context():
+        index = get_index()
+        print(index.metrics()['codes'])
+        for barcode in args.barcodes:
+            start_time = time.perf_counter()
+            for _ in range(args.repeat):
+                result = index.resolve(barcode)
+            micros = (time.perf_counter() - start_time) * 1e6 / args.repeat
+            print(f"{barcode}: {micros:.2f} us -> {result or index.suggest(barcode)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+# Numbers claimed from the database at a time by each process
+GRN_BLOCK_SIZE = int(os.environ.get('GRN_BLOCK_SIZE', '50'))
+
+
+class BlockAllocator:
+    """Hands out document numbers from blocks claimed off a database counter.
+
+    Each process claims ``block_size`` numbers per branch with one atomic
+    UPDATE of its ``number_sequences`` row and then issues them from memory,
+    so numbers from different workers never collide and issuing one needs
+    no database round trip. Numbers are unique but not gapless: whatever
+    is left of a block when a process exits is never issued.
+    """
+
+    def __init__(self, name, block_size=GRN_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self.claims = 0
+        self.issued = 0
+        self._blocks = {}  # branch_id -> [next value, end of block)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def next_value(self, branch_id=''):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse its parent's blocks
+                self._blocks = {}
+                self._pid = os.getpid()
+            block = self._blocks.get(branch_id)
+            if block is None or block[0] >= block[1]:
+                block = self._blocks[branch_id] = self._claim_block(branch_id)
+            value = block[0]
+            block[0] += 1
+            self.issued += 1
+            return value
+
+    def _claim_block(self, branch_id):
+        """Reserve the next block in its own transaction, apart from the caller's session"""
+        from app import db
+        from models import NumberSequence
+
+        table = NumberSequence.__table__
+        row = (table.c.name == self.name) & (table.c.branch_id == branch_id)
+        while True:
+            with db.engine.begin() as connection:
+                claimed = connection.execute(
+                    update(table).where(row).values(
+                        next_value=table.c.next_value + self.block_size,
+                        updated_at=datetime.utcnow()))
+                if claimed.rowcount:
+                    end = connection.execute(select(table.c.next_value).where(row)).scalar_one()
+                    self.claims += 1
+                    logging.debug(f"{self.name} sequence {branch_id or '-'}: claimed "
+                                  f"{end - self.block_size}-{end - 1}")
+                    return [end - self.block_size, end]
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(insert(table).values(
+                        name=self.name, branch_id=branch_id, next_value=1,
+                        updated_at=datetime.utcnow()))
+                logging.info(f"Started {self.name} number sequence for branch {branch_id or '-'}")
+            except IntegrityError:
+                pass  # Another worker created the row first
+
+    def metrics(self):
+        return {'name': self.name, 'block_size': self.block_size,
+                'claims': self.claims, 'issued': self.issued}
+
+
+grn_sequence = BlockAllocator('GRN')
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Soak-test the SAP integration layer against the local Service Layer simulator
+
+Several threads post Purchase Receipts and page through Purchase Orders for
+a fixed duration while the simulator injects latency, errors and session
+expiry. Prints throughput, error counts, latency percentiles and how many
+logins the session pool needed.
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', default='lognormal:40,0.6')
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--session-timeout', type=int, default=120,
+                        help='simulator idle session timeout in seconds')
+    parser.add_argument('--max-concurrent', type=int, default=0)
+    parser.add_argument('--read-ratio', type=float, default=0.2,
+                        help='fraction of operations that read a PO page')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    from sap_simulator import start_simulator
+    server = start_simulator(latency=args.latency, error_rate=args.error_rate,
+                             session_timeout=args.session_timeout,
+                             max_concurrent=args.max_concurrent)
+    os.environ['SAP_B1_URL'] = server.base_url
+    os.environ['WMS_DEV_MODE'] = 'false'
+    os.environ['SAP_B1_POOL_SIZE'] = str(args.threads)
+    os.environ['SAP_B1_SESSION_STORE'] = ''
+
+    from bench_sap_batch import fake_grpo
+    from sap_integration import SAPIntegration
+
+    sap = SAPIntegration()
+    deadline = time.time() + args.duration
+    lock = threading.Lock()
+    latencies = {'post': [], 'read': []}
+    failures = {'post': 0, 'read': 0}
+
+    def worker(worker_index):
+        sequence = 0
+        while time.time() < deadline:
+            sequence += 1
+            kind = 'read' if random.random() < args.read_ratio else 'post'
+            start = time.perf_counter()
+            if kind == 'post':
+                ok = bool(sap.post_grpo_to_sap(fake_grpo(worker_index * 1000000 + sequence)))
+            else:
+                try:
+                    pages = sap.iter_purchase_orders(page_size=50)
+                    ok = sum(1 for _ in zip(range(50), pages)) > 0
+                except Exception:
+                    ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+                if not ok:
+                    failures[kind] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"Soak test: {args.threads} threads for {args.duration:.0f}s, latency {args.latency}, "
+          f"error rate {args.error_rate}")
+    print(f"{'operation':<10}{'count':>8}{'failed':>8}{'ops/sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind in ('post', 'read'):
+        samples = latencies[kind]
+        print(f"{kind:<10}{len(samples):>8}{failures[kind]:>8}{len(samples) / args.duration:>10.1f}"
+              f"{percentile(samples, 0.50) * 1000:>10.1f}{percentile(samples, 0.95) * 1000:>10.1f}"
+              f"{percentile(samples, 0.99) * 1000:>10.1f}")
+    print(f"Service Layer logins: {sap.pool.logins}")
+    print(f"Simulator counters: {dict(server.state.stats)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -177,10 +177,28 @@ BarcodeScanner.processGenericScan = function(barcode) {
     } else if (this.isSupplierBarcode(barcode)) {
         this.processSupplierBarcodeScan(barcode);
     } else {
-        WMS.showToast('Barcode type not recognized', 'warning');
+        this.resolveScan(barcode);
     }
 };
 
+// Let the server classify anything else (QR labels, GRNs, supplier barcodes)
+BarcodeScanner.resolveScan = function(barcode) {
+    API.post('/api/scan_barcode', { barcode: barcode })
+        .then(response => {
+            if (response.type === 'purchase_order') {
+                this.processPOScan(response.po_number);
+            } else if (['supplier_barcode', 'gs1', 'qr_label'].includes(response.type)) {
+                this.displaySupplierInfo(response);
+                WMS.showToast('Barcode recognized', 'success');
+            } else {
+                WMS.showToast(`Scanned ${response.type.replace('_', ' ')}`, 'info');
+            }
+        })
+        .catch(error => {
+            WMS.showToast('Barcode type not recognized', 'warning');
+        });
+};
+
 // Check if barcode is a PO number
 BarcodeScanner.isPONumber = function(barcode) {
     return barcode.startsWith('PO-') || barcode.startsWith('PO');
@@ -193,7 +211,12 @@ BarcodeScanner.isItemCode = function(barcode) {
 
 // Check if barcode is a supplier barcode
 BarcodeScanner.isSupplierBarcode = function(barcode) {
-    return barcode.startsWith('SUP-') || barcode.startsWith('S-');
+    return barcode.startsWith('SUP-') || barcode.startsWith('S-') || this.isGS1(barcode);
+};
+
+// Check if barcode is a GS1 carton label (GS1-128, DataMatrix, bracketed AIs)
+BarcodeScanner.isGS1 = function(barcode) {
+    return /^(\]C1|\]d2|\]Q3|\]e0|\(\d{2,4}\)|0[012]\d{14})/.test(barcode) || barcode.includes('\x1d');
 };
 
 // Process PO scan
@@ -307,9 +330,20 @@ BarcodeScanner.autoFillSupplierData = function(data) {
         'batch_number': data.batch_number,
         'expiry_date': data.expiry_date,
         'supplier_barcode': data.supplier_barcode,
-        'item_code': data.item_code
+        'item_code': data.item_code,
+        'received_quantity': data.quantity
     };
     
+    // Pick the PO line of a known item
+    const lineSelect = document.getElementById('po_line_id');
+    if (lineSelect && data.item_code) {
+        const option = lineSelect.querySelector(`option[data-item-code="${data.item_code}"]`);
+        if (option) {
+            lineSelect.value = option.value;
+            lineSelect.dispatchEvent(new Event('change'));
+        }
+    }
+    
     Object.keys(fields).forEach(fieldName => {
         const field = document.getElementById(fieldName);
         if (field && fields[fieldName]) {